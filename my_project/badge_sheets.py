@@ -0,0 +1,146 @@
+"""Printable PDF sheets of visitor badges.
+
+Ten CR80-sized badges per A4 page, each with the QR code, visitor name,
+company, host and expiry. QR codes are drawn as vector rectangles (one per
+run of dark modules), so they stay sharp at any print resolution and no
+image encoding is needed.
+
+QR encoding is pure-Python CPU work, so the matrices are computed in a
+process pool, a page's worth per task. All pages are submitted up front
+and the response streams each page as soon as its codes are ready, with
+the PDF page tree written last (see pdf.py).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import threading
+
+from config import get_settings
+import pdf
+
+settings = get_settings()
+
+# Badge layout in points: 2 x 5 cards of 85.6 x 54 mm on A4
+COLUMNS = 2
+ROWS = 5
+BADGES_PER_PAGE = COLUMNS * ROWS
+BADGE_WIDTH = 242.65
+BADGE_HEIGHT = 153.07
+QR_SIZE = 112
+PADDING = 10
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# (row, first column, length) runs of dark modules, and the module count per side
+QRRuns = Tuple[int, List[Tuple[int, int, int]]]
+
+
+def qr_runs(qr_codes: List[str]) -> List[QRRuns]:
+    """Encode QR codes as runs of dark modules; runs in a pool worker"""
+    # qrcode pulls in PIL, so it is imported on first use
+    import qrcode
+
+    encoded = []
+    for value in qr_codes:
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=4)
+        qr.add_data(value)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        runs = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < len(row):
+                if row[x]:
+                    start = x
+                    while x < len(row) and row[x]:
+                        x += 1
+                    runs.append((y, start, x - start))
+                else:
+                    x += 1
+        encoded.append((len(matrix), runs))
+    return encoded
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: a forked child would share the parent's database connections
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.BADGE_SHEET_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _draw_badge(canvas: pdf.Canvas, x: float, y: float, badge: dict, qr: QRRuns):
+    """Draw one badge with its lower left corner at (x, y)"""
+    canvas.gray(0.6)
+    canvas.rect(x, y, BADGE_WIDTH, BADGE_HEIGHT, fill=False)
+    canvas.gray(0)
+
+    size, runs = qr
+    module = QR_SIZE / size
+    qr_x = x + PADDING
+    qr_y = y + BADGE_HEIGHT - PADDING - QR_SIZE
+    for row, column, length in runs:
+        # Matrix rows run top to bottom, PDF y runs bottom to top
+        canvas.rect(qr_x + column * module, qr_y + (size - row - 1) * module, length * module, module)
+    canvas.text(qr_x, y + PADDING, pdf.fit(badge["qr_code"], BADGE_WIDTH - 2 * PADDING, 6), size=6)
+
+    text_x = qr_x + QR_SIZE + PADDING
+    text_width = BADGE_WIDTH - QR_SIZE - 3 * PADDING
+    top = y + BADGE_HEIGHT - PADDING
+    canvas.text(text_x, top - 10, "VISITOR", size=9, bold=True)
+    canvas.text(text_x, top - 32, pdf.fit(badge["visitor_name"], text_width, 12), size=12, bold=True)
+    if badge["company"]:
+        canvas.text(text_x, top - 46, pdf.fit(badge["company"], text_width, 8), size=8)
+    canvas.text(text_x, top - 72, "Host", size=7, bold=True)
+    canvas.text(text_x, top - 82, pdf.fit(badge["host_name"] or "N/A", text_width, 8), size=8)
+    canvas.text(text_x, top - 100, "Valid until", size=7, bold=True)
+    canvas.text(text_x, top - 110, f"{badge['expiry_time']:%Y-%m-%d %H:%M} UTC", size=8)
+
+
+async def render(badges: List[dict]) -> AsyncIterator[bytes]:
+    """Stream a PDF of `badges` (dicts with qr_code, visitor_name, company, host_name, expiry_time)"""
+    writer = pdf.PDFWriter(title=f"Visitor badges {datetime.utcnow():%Y-%m-%d}")
+    page_width, page_height = writer.page_size
+    margin_x = (page_width - COLUMNS * BADGE_WIDTH) / 2
+    margin_y = (page_height - ROWS * BADGE_HEIGHT) / 2
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    pages = [badges[start:start + BADGES_PER_PAGE] for start in range(0, len(badges), BADGES_PER_PAGE)]
+    encoding = [
+        loop.run_in_executor(pool, qr_runs, [badge["qr_code"] for badge in page])
+        for page in pages
+    ]
+
+    try:
+        yield writer.header()
+        for page, pending in zip(pages, encoding):
+            qrs = await pending
+            canvas = writer.canvas()
+            for index, (badge, qr) in enumerate(zip(page, qrs)):
+                column = index % COLUMNS
+                row = index // COLUMNS
+                x = margin_x + column * BADGE_WIDTH
+                y = page_height - margin_y - (row + 1) * BADGE_HEIGHT
+                _draw_badge(canvas, x, y, badge, qr)
+            yield writer.page(canvas)
+        yield writer.trailer()
+    finally:
+        # A client that goes away mid-sheet leaves nothing queued
+        for pending in encoding:
+            pending.cancel()
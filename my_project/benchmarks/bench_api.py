@@ -0,0 +1,84 @@
+"""Request throughput and latency of the main API paths.
+
+Runs the app in-process (middleware included) against a temporary SQLite
+database, or any database given with --database-url, seeded with
+--visitors visitors for one host:
+
+    python benchmarks/bench_api.py --visitors 2000 --requests 500
+"""
+from datetime import datetime, timedelta
+import os
+
+from common import measure, parser, print_table, setup, summarize, timing_headers
+
+
+def seed(client, prefix: str, headers: dict, visitors: int) -> tuple:
+    response = client.post(f"{prefix}/users/", headers=headers, json={
+        "username": "benchhost", "email": "bench@example.com", "full_name": "Bench Host",
+        "department": "Engineering", "password": "BenchPass123"
+    })
+    response.raise_for_status()
+    host_id = response.json()["id"]
+
+    # Spread over the next hours, inside the expected-arrivals window
+    start = datetime.utcnow() + timedelta(minutes=5)
+    for offset in range(0, visitors, 500):
+        rows = [
+            {
+                "full_name": f"Visitor {number}",
+                "email": f"visitor{number}@example.com",
+                "phone": f"+1555{number:07d}",
+                "purpose": "meeting",
+                "host_id": host_id,
+                "scheduled_time": (start + timedelta(seconds=30 * number)).isoformat()
+            }
+            for number in range(offset, min(offset + 500, visitors))
+        ]
+        # Approved with badges, so the expected-arrivals feed has rows to return
+        client.post(f"{prefix}/visitors/bulk?pre_approve=true", headers=headers, json=rows).raise_for_status()
+    return host_id
+
+
+def main():
+    arguments = parser(__doc__)
+    arguments.add_argument("--visitors", type=int, default=1000, help="visitors to seed")
+    arguments.add_argument("--requests", type=int, default=300, help="timed requests per endpoint")
+    args = arguments.parse_args()
+    # The seeded rows are seconds old; let delta sync return them
+    os.environ.setdefault("SYNC_COMMIT_LAG_SECONDS", "0")
+    database_url = setup(args.database_url)
+
+    from fastapi.testclient import TestClient
+    from config import get_settings
+    import main as app_module
+
+    prefix = get_settings().API_PREFIX
+    with TestClient(app_module.app) as client:
+        token = client.post(f"{prefix}/auth/token", data={"username": "admin", "password": "Admin123!"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        host_id = seed(client, prefix, headers, args.visitors)
+
+        visitor_id = client.get(f"{prefix}/visitors/?limit=1", headers=headers).json()[0]["id"]
+        new_visitor = {"full_name": "Walk In", "email": "walkin@example.com", "phone": "+15550000000",
+                       "purpose": "meeting", "host_id": host_id}
+
+        def get(path: str):
+            return lambda: client.get(prefix + path, headers=headers).raise_for_status()
+
+        endpoints = [
+            ("GET /visitors/?limit=100", get("/visitors/?limit=100")),
+            ("GET /visitors/?limit=100&fields=...", get("/visitors/?limit=100&fields=full_name,status,host_name")),
+            ("GET /visitors/{id}", get(f"/visitors/{visitor_id}")),
+            ("GET /visitors/expected", get("/visitors/expected?hours=24")),
+            ("GET /visitors/changes", get("/visitors/changes?limit=500")),
+            ("GET /stats/visitors", get("/stats/visitors")),
+            ("POST /visitors/", lambda: client.post(f"{prefix}/visitors/", headers=headers, json=new_visitor).raise_for_status()),
+        ]
+        rows = [summarize(name, measure(operation, args.requests)) for name, operation in endpoints]
+
+    print(f"{database_url}, {args.visitors} visitors, {args.requests} requests per endpoint\n")
+    print_table(timing_headers(), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Bandwidth and CPU trade-off of response compression.
+
+For each payload and each encoder setting the middleware can use (gzip
+levels, and Brotli qualities when the brotli package is installed),
+reports the compressed size, the CPU time to compress it, and the time to
+send it over a --link-mbps link, compressed and not. Streamed payloads
+are compressed chunk by chunk with a flush after each chunk, as the
+middleware does for exports. No database is needed:
+
+    python benchmarks/bench_compression.py --link-mbps 2
+"""
+from typing import List
+
+from common import UNITS, measure, parser, print_table, setup
+from bench_json import stats_body, visitor_page
+
+
+def main():
+    arguments = parser(__doc__)
+    arguments.add_argument("--iterations", type=int, default=50, help="timed compressions per case")
+    arguments.add_argument("--link-mbps", type=float, default=2.0, help="link speed for the transfer time column")
+    args = arguments.parse_args()
+    setup(args.database_url)
+
+    from compression import _BrotliEncoder, _GzipEncoder, brotli
+    import responses
+
+    from config import get_settings
+
+    export_rows = visitor_page(5000)
+    batch = get_settings().EXPORT_BATCH_SIZE
+    # One chunk per EXPORT_BATCH_SIZE rows, as exports.py yields them
+    export_chunks: List[bytes] = [
+        b"".join(responses.dumps(row) + b"\n" for row in export_rows[start:start + batch])
+        for start in range(0, len(export_rows), batch)
+    ]
+    payloads = [
+        ("GET /visitors?limit=100", [responses.dumps(visitor_page(100))]),
+        ("GET /stats/visitors, 365 days", [responses.dumps(stats_body(365))]),
+        ("NDJSON export, 5000 rows", export_chunks),
+    ]
+
+    settings = [(f"gzip {level}", lambda level=level: _GzipEncoder(level)) for level in (1, 6, 9)]
+    if brotli is not None:
+        settings += [(f"br {quality}", lambda quality=quality: _BrotliEncoder(quality)) for quality in (1, 4, 11)]
+
+    def transfer_ms(size: int) -> float:
+        return size * 8 / (args.link_mbps * 1_000_000) * UNITS["ms"]
+
+    rows = []
+    for name, chunks in payloads:
+        plain = sum(len(chunk) for chunk in chunks)
+        rows.append([name, "identity", plain, "1.00", "0.00", f"{transfer_ms(plain):.1f}"])
+        for label, new_encoder in settings:
+            def compress() -> int:
+                encoder = new_encoder()
+                return sum(len(encoder.compress(chunk)) for chunk in chunks) + len(encoder.finish())
+
+            size = compress()
+            timings = measure(compress, args.iterations, warmup=2)
+            cpu_ms = sorted(timings)[len(timings) // 2] * UNITS["ms"]
+            rows.append([name, label, size, f"{plain / size:.2f}", f"{cpu_ms:.2f}", f"{transfer_ms(size):.1f}"])
+
+    if brotli is None:
+        print("brotli is not installed; only gzip is measured\n")
+    print(f"Transfer times at {args.link_mbps:g} Mbit/s\n")
+    print_table(["payload", "encoding", "bytes", "ratio", "cpu ms", "transfer ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
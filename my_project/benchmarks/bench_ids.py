@@ -0,0 +1,116 @@
+"""Insert throughput and storage of random string keys versus time-ordered binary keys.
+
+Fills two copies of a visitors-shaped table, one keyed the old way
+(uuid4 in String(36)) and one the current way (UUIDv7 in BinaryUUID,
+16 bytes), with the same rows, then reports rows inserted per second
+and the size of each table and its indexes (host_id is indexed as in
+`visitors`). Sizes come from dbstat on SQLite, information_schema on
+MySQL and pg_*_size on PostgreSQL. The differences grow with the table,
+so use --rows in the millions on MySQL to see the clustered-index
+effect:
+
+    python benchmarks/bench_ids.py --rows 200000
+    python benchmarks/bench_ids.py --database-url mysql+pymysql://... --rows 2000000
+"""
+from datetime import datetime
+from typing import Tuple
+import random
+import time
+import uuid
+
+from common import parser, print_table, setup
+
+
+def size_of(connection, table: str) -> Tuple[int, int]:
+    """(table bytes, index bytes) of `table`"""
+    from sqlalchemy import text
+
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        rows = connection.execute(text(
+            "SELECT dbstat.name, SUM(dbstat.pgsize) FROM dbstat "
+            "JOIN sqlite_master ON sqlite_master.name = dbstat.name "
+            "WHERE sqlite_master.tbl_name = :table GROUP BY dbstat.name"
+        ), {"table": table}).all()
+        table_bytes = sum(size for name, size in rows if name == table)
+        return table_bytes, sum(size for _, size in rows) - table_bytes
+    if dialect == "mysql":
+        connection.execute(text(f"ANALYZE TABLE {table}"))
+        row = connection.execute(text(
+            "SELECT data_length, index_length FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = :table"
+        ), {"table": table}).one()
+        return int(row[0]), int(row[1])
+    if dialect == "postgresql":
+        row = connection.execute(text("SELECT pg_table_size(:table), pg_indexes_size(:table)"), {"table": table}).one()
+        return int(row[0]), int(row[1])
+    raise SystemExit(f"No size query for {dialect}")
+
+
+def main():
+    arguments = parser(__doc__)
+    arguments.add_argument("--rows", type=int, default=100_000, help="rows inserted into each table")
+    arguments.add_argument("--batch", type=int, default=1000, help="rows per INSERT transaction")
+    arguments.add_argument("--hosts", type=int, default=200, help="distinct host_id values")
+    args = arguments.parse_args()
+    database_url = setup(args.database_url)
+
+    from sqlalchemy import Column, DateTime, Index, MetaData, String, Table
+    from db_connection import get_engine
+    from db_models import BinaryUUID, generate_uuid
+
+    metadata = MetaData()
+
+    def visitors_like(name: str, key_type) -> Table:
+        return Table(
+            name, metadata,
+            Column("id", key_type, primary_key=True),
+            Column("host_id", key_type, nullable=False),
+            Column("full_name", String(100), nullable=False),
+            Column("created_at", DateTime, nullable=False),
+            Index(f"ix_{name}_host_id", "host_id"),
+        )
+
+    variants = [
+        ("uuid4 String(36)", visitors_like("bench_keys_uuid4", String(36)), lambda: str(uuid.uuid4())),
+        ("UUIDv7 BINARY(16)", visitors_like("bench_keys_uuid7", BinaryUUID()), generate_uuid),
+    ]
+
+    engine = get_engine()
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    names = [f"Visitor {number}" for number in range(args.rows)]
+
+    results = []
+    try:
+        for label, table, new_id in variants:
+            hosts = [new_id() for _ in range(args.hosts)]
+            started = time.perf_counter()
+            for offset in range(0, args.rows, args.batch):
+                rows = []
+                for name in names[offset:offset + args.batch]:
+                    # Keys are generated as rows arrive, like the app does
+                    rows.append({"id": new_id(), "host_id": random.choice(hosts), "full_name": name,
+                                 "created_at": datetime.utcnow()})
+                with engine.begin() as connection:
+                    connection.execute(table.insert(), rows)
+            elapsed = time.perf_counter() - started
+
+            with engine.begin() as connection:
+                table_bytes, index_bytes = size_of(connection, table.name)
+            results.append([
+                label,
+                f"{args.rows / elapsed:.0f}",
+                f"{table_bytes / 1024 / 1024:.1f}",
+                f"{index_bytes / 1024 / 1024:.1f}",
+                f"{(table_bytes + index_bytes) / args.rows:.0f}",
+            ])
+    finally:
+        metadata.drop_all(engine)
+
+    print(f"{database_url}, {args.rows} rows in batches of {args.batch}\n")
+    print_table(["keys", "rows/s", "table MB", "index MB", "bytes/row"], results)
+
+
+if __name__ == "__main__":
+    main()
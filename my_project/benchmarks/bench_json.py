@@ -0,0 +1,131 @@
+"""Serialization cost of the JSON response paths.
+
+Compares, per payload, what FastAPI does for a dict returned from a route
+(validate against the response_model where there is one, encode for JSON,
+stdlib json.dumps) with trusted_json(), which encodes the payload as it is,
+with the stdlib encoder and with orjson when it is installed. Payloads are
+a 100-row VisitorOut page, a verify_badge result and a /stats/visitors
+body covering a year of daily counts. No database is needed:
+
+    python benchmarks/bench_json.py --iterations 2000
+"""
+from datetime import datetime, timedelta
+from typing import List
+import json
+import uuid
+
+from common import measure, parser, print_table, setup, summarize, timing_headers
+
+
+def visitor_page(rows: int) -> List[dict]:
+    from db_models import VisitPurpose, VisitStatus
+
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "full_name": f"Visitor {number}",
+            "email": f"visitor{number}@example.com",
+            "phone": "+15550000000",
+            "company": "Example Ltd",
+            "purpose": VisitPurpose.MEETING,
+            "host_id": str(uuid.uuid4()),
+            "photo_url": None,
+            "host_name": "Host Name",
+            "status": VisitStatus.CHECKED_OUT,
+            "scheduled_time": now,
+            "check_in_time": now,
+            "check_out_time": now + timedelta(minutes=45),
+            "created_at": now - timedelta(days=1),
+            "has_photo": False,
+            "has_badge": True,
+            "visit_duration": 45.0,
+            "version": 3
+        }
+        for number in range(rows)
+    ]
+
+
+def verify_result() -> dict:
+    now = datetime.utcnow()
+    return {
+        "valid": True,
+        "badge_id": str(uuid.uuid4()),
+        "visitor_id": str(uuid.uuid4()),
+        "visitor_name": "Visitor Name",
+        "visitor_email": "visitor@example.com",
+        "visitor_phone": "+15550000000",
+        "visitor_company": "Example Ltd",
+        "purpose": "meeting",
+        "host_name": "Host Name",
+        "host_department": "Engineering",
+        "status": "checked_in",
+        "check_in_time": now,
+        "check_out_time": None,
+        "scheduled_time": now,
+        "expiry_time": now + timedelta(hours=8)
+    }
+
+
+def stats_body(days: int) -> dict:
+    start = datetime(2024, 1, 1)
+    return {
+        "total_visitors": 52_000,
+        "date_range": {"start_date": start, "end_date": start + timedelta(days=days)},
+        "status_counts": {"pending": 12, "approved": 40, "rejected": 310, "checked_in": 25, "checked_out": 51_000, "expired": 613},
+        "purpose_counts": {"meeting": 30_000, "interview": 8_000, "delivery": 9_000, "maintenance": 3_000, "other": 2_000},
+        "average_visit_duration_minutes": 47.3,
+        "daily_counts": [
+            {"date": (start + timedelta(days=day)).date().isoformat(), "count": 100 + day % 50}
+            for day in range(days)
+        ]
+    }
+
+
+def main():
+    arguments = parser(__doc__)
+    arguments.add_argument("--iterations", type=int, default=1000, help="timed serializations per case")
+    args = arguments.parse_args()
+    setup(args.database_url)
+
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from schemas import VisitorOut
+    import responses
+
+    def stdlib_render(content) -> bytes:
+        # What JSONResponse.render does
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+    def fastapi_path(payload, adapter=None):
+        if adapter is None:
+            return lambda: stdlib_render(jsonable_encoder(payload))
+        return lambda: stdlib_render(adapter.dump_python(adapter.validate_python(payload), mode="json"))
+
+    def trusted_stdlib(payload):
+        return lambda: json.dumps(payload, default=responses._default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def trusted_orjson(payload):
+        return lambda: responses.dumps(payload)
+
+    payloads = [
+        ("VisitorOut x100", visitor_page(100), TypeAdapter(List[VisitorOut])),
+        ("verify_badge", verify_result(), None),
+        ("stats, 365 days", stats_body(365), None),
+    ]
+
+    rows = []
+    for name, payload, adapter in payloads:
+        cases = [("FastAPI default", fastapi_path(payload, adapter)), ("trusted_json, json", trusted_stdlib(payload))]
+        if responses.orjson is not None:
+            cases.append(("trusted_json, orjson", trusted_orjson(payload)))
+        for label, operation in cases:
+            rows.append(summarize(f"{name}: {label}", measure(operation, args.iterations), unit="us"))
+
+    if responses.orjson is None:
+        print("orjson is not installed; its rows are skipped\n")
+    print_table(timing_headers("us"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Shared setup for the benchmark scripts.
+
+Call `setup()` before importing any application module: settings are read
+once, on first import, from the environment this prepares.
+"""
+from typing import Callable, Iterable, List, Optional, Sequence
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--database-url", help="SQLAlchemy URL to benchmark against (default: a temporary SQLite file)")
+    return parser
+
+
+def setup(database_url: Optional[str] = None) -> str:
+    """Point the settings at `database_url` (or a fresh SQLite file) and make the app importable"""
+    if database_url is None:
+        database_url = f"sqlite:///{tempfile.mkdtemp(prefix='vms-bench-')}/vms.db"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("DEBUG", "false")
+    os.chdir(PROJECT_DIR)
+    sys.path.insert(0, PROJECT_DIR)
+    return database_url
+
+
+def measure(operation: Callable[[], object], iterations: int, warmup: int = 5) -> List[float]:
+    """Seconds taken by each of `iterations` calls, after `warmup` untimed ones"""
+    for _ in range(warmup):
+        operation()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+# Seconds to the unit named in the table headers
+UNITS = {"ms": 1e3, "us": 1e6}
+
+
+def summarize(name: str, timings: Sequence[float], unit: str = "ms") -> list:
+    """Table row: name, calls per second, median and p95 in `unit`"""
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    scale = UNITS[unit]
+    return [name, f"{len(timings) / sum(timings):.0f}", f"{statistics.median(ordered) * scale:.2f}", f"{p95 * scale:.2f}"]
+
+
+def timing_headers(unit: str = "ms") -> List[str]:
+    return ["benchmark", "ops/s", f"median {unit}", f"p95 {unit}"]
+
+
+def print_table(headers: Sequence[str], rows: Iterable[Sequence[object]]):
+    rows = [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[index]) for row in rows)) for index, header in enumerate(headers)]
+    print("  ".join(str(header).ljust(width) for header, width in zip(headers, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        # Text left, numbers right
+        print("  ".join(
+            cell.ljust(width) if index == 0 else cell.rjust(width)
+            for index, (cell, width) in enumerate(zip(row, widths))
+        ))
@@ -0,0 +1,50 @@
+"""One-time database preparation: schema creation and upgrade, and the default admin.
+
+`server.py` runs this once before starting workers. When the app is served
+directly (`uvicorn main:app`), the startup hook runs it instead unless
+INIT_DB_ON_STARTUP is disabled.
+"""
+from sqlalchemy.exc import IntegrityError
+import logging
+
+from db_connection import SessionLocal, init_db
+import migrate_schema
+
+# Configure logging
+logger = logging.getLogger("bootstrap")
+
+
+def seed_admin():
+    """Create the default admin user if no user named "admin" exists"""
+    from auth import get_password_hash
+    from db_models import User
+
+    db = SessionLocal()
+    try:
+        if db.query(User.id).filter(User.username == "admin").first():
+            return
+
+        db.add(User(
+            username="admin",
+            email="admin@example.com",
+            full_name="Admin User",
+            department="IT",
+            hashed_password=get_password_hash("Admin123!"),
+            is_admin=True
+        ))
+        try:
+            db.commit()
+            logger.info("Created default admin user")
+        except IntegrityError:
+            # Another process seeded it first
+            db.rollback()
+    finally:
+        db.close()
+
+
+def prepare_database():
+    init_db()
+    # create_all leaves existing tables alone; add what they are missing
+    migrate_schema.upgrade()
+    logger.info("Database initialized successfully")
+    seed_admin()
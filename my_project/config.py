@@ -1,15 +1,25 @@
 from pydantic_settings import BaseSettings
-from typing import List, Union
+from pydantic import model_validator
+from typing import List, Optional, Union
 from functools import lru_cache
 import json
 
 class Settings(BaseSettings):
     # MySQL Database Configuration
-    DB_HOST: str
-    DB_PORT: int
-    DB_USER: str
-    DB_PASSWORD: str
-    DB_NAME: str
+    DB_HOST: str = "localhost"
+    DB_PORT: int = 3306
+    DB_USER: str = "root"
+    DB_PASSWORD: str = ""
+    DB_NAME: str = "vms_db"
+
+    # Full SQLAlchemy URL, overrides the MySQL settings above
+    # (e.g. sqlite:///./vms.db for local runs and benchmarks)
+    DATABASE_URL: Optional[str] = None
+
+    # Read replicas (JSON list of SQLAlchemy URLs); reads fall back to the primary
+    DATABASE_REPLICA_URLS: Union[str, List[str]] = []
+    REPLICA_HEALTH_CHECK_SECONDS: int = 10
+    READ_YOUR_WRITES_SECONDS: int = 5  # Reads follow a write to the primary this long (signed with SECRET_KEY)
 
     # JWT Configuration
     SECRET_KEY: str
@@ -20,12 +30,120 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     API_PREFIX: str = "/api/v1"
 
+    # Create tables and the default admin in the app's startup hook;
+    # server.py turns this off and does it once before starting workers
+    INIT_DB_ON_STARTUP: bool = True
+
+    # Production Server Configuration (server.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    SERVER_GRACEFUL_TIMEOUT: int = 30  # Seconds to finish in-flight requests on shutdown
+
     # CORS Configuration
     CORS_ORIGINS: Union[str, List[str]] = "*"
 
-    @property
-    def DATABASE_URL(self) -> str:
-        return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+    # Response Compression Configuration
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # Bytes; smaller bodies are sent as-is
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # Used when the brotli package is installed
+
+    # Profiler Configuration
+    PROFILER_ENABLED: bool = True
+    PROFILER_OUTPUT_DIR: str = "profiles"
+    PROFILER_MAX_PROFILES: int = 50
+
+    # Event Stream Configuration
+    EVENTS_BROKER_URL: Optional[str] = None  # e.g. redis://localhost:6379/0 for cross-worker fan-out
+    EVENTS_CHANNEL: str = "vms-events"
+    EVENTS_MAX_QUEUE: int = 100
+    EVENTS_HEARTBEAT_SECONDS: int = 15
+
+    # Idempotency-Key Configuration (POST retries from kiosks and scanners)
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_CACHE_SIZE: int = 1000
+
+    # Expected Arrivals Configuration (guard desk feed)
+    EXPECTED_ARRIVALS_BUCKET_SECONDS: int = 60  # Window start is rounded down to this; one cache entry per bucket
+    EXPECTED_ARRIVALS_GRACE_MINUTES: int = 30  # Late visitors stay in the window this long
+    EXPECTED_ARRIVALS_LIMIT: int = 500
+
+    # Visitor Delta Sync Configuration (GET /visitors/changes)
+    SYNC_TOKEN_MAX_AGE_DAYS: int = 30  # Older tokens get 410 and a full resync; tombstones are kept this long
+    SYNC_COMMIT_LAG_SECONDS: int = 5  # Rows stamped this recently may belong to uncommitted transactions
+
+    # Host Notification Configuration (outbox.py); nothing is sent without SMTP_HOST
+    SMTP_HOST: Optional[str] = None  # e.g. localhost with `python -m aiosmtpd -n -l localhost:8025`
+    SMTP_PORT: int = 25
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = False
+    SMTP_FROM: str = "vms@example.com"
+    SMTP_IDLE_SECONDS: int = 60  # The pooled connection is closed after this long unused
+    OUTBOX_POLL_SECONDS: int = 5
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_SECONDS: int = 30  # Doubled after every failed attempt
+    OUTBOX_RETRY_MAX_SECONDS: int = 3600
+    OUTBOX_LEASE_SECONDS: int = 120
+    OUTBOX_COALESCE_SECONDS: float = 2.0  # Wait after a wake-up so bursts share a batch
+    NOTIFICATION_DIGEST_THRESHOLD: int = 3  # Messages per host per batch before they become one digest
+
+    # Webhook Configuration (webhooks.py)
+    WEBHOOK_POLL_SECONDS: int = 5
+    WEBHOOK_BATCH_SIZE: int = 100  # Deliveries claimed per round
+    WEBHOOK_EVENTS_PER_REQUEST: int = 20  # Events batched into one POST to a subscriber
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+    WEBHOOK_MAX_CONNECTIONS: int = 50  # Pooled keep-alive connections across all subscribers
+    WEBHOOK_MAX_ATTEMPTS: int = 10
+    WEBHOOK_RETRY_BASE_SECONDS: int = 10  # Doubled after every failed attempt
+    WEBHOOK_RETRY_MAX_SECONDS: int = 3600
+    WEBHOOK_LEASE_SECONDS: int = 120
+    WEBHOOK_SUBSCRIPTION_CACHE_SECONDS: int = 30  # Other workers see subscription changes after this
+
+    # Bulk Write Configuration
+    BULK_MAX_ROWS: int = 5000  # Rows accepted by one POST /visitors/bulk
+    BULK_CHUNK_SIZE: int = 500  # Rows per executemany statement
+
+    # Export Configuration
+    EXPORT_BATCH_SIZE: int = 1000  # Rows fetched per round trip and sent per chunk
+
+    # Report Configuration
+    REPORT_OUTPUT_DIR: str = "reports"
+    REPORT_WORKERS: int = 2  # Worker processes per app process
+    REPORT_MAX_RUNNING: int = 2  # Jobs running at once across all app processes
+    REPORT_MAX_ACTIVE_PER_USER: int = 5  # Queued or running jobs one admin may have
+    REPORT_MAX_DAYS: int = 400  # Longest period one report may cover
+    REPORT_POLL_SECONDS: float = 2.0
+    REPORT_CACHE_SECONDS: int = 3600  # An identical spec reuses a finished report this long
+    REPORT_RETENTION_HOURS: int = 72  # Artifacts are deleted after this
+    REPORT_STALE_SECONDS: int = 600  # A running job without progress this long is failed
+
+    # Badge Sheet Configuration
+    BADGE_SHEET_WORKERS: int = 2  # QR encoding processes per app process
+    BADGE_SHEET_MAX_BADGES: int = 1000  # Badges one sheet request may print
+
+    # Audit Log Configuration
+    LOG_PAGE_MAX: int = 500  # Largest page GET /logs returns
+    LOG_RETENTION_MONTHS: int = 24  # Whole months of system logs to keep
+    LOG_PARTITIONS_AHEAD: int = 3  # Empty monthly partitions kept ready on MySQL
+    LOG_RETENTION_BATCH_SIZE: int = 5000  # Rows per DELETE where tables are not partitioned
+
+    # Visitor Archive Configuration (visitor_archive.py)
+    VISITOR_ARCHIVE_AFTER_DAYS: int = 180  # Finished visits created this long ago move to visitors_archive
+    VISITOR_ARCHIVE_BATCH_SIZE: int = 1000  # Visitors moved per transaction
+
+    @model_validator(mode="after")
+    def build_database_url(self):
+        if not self.DATABASE_URL:
+            self.DATABASE_URL = f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        return self
+
+    def get_replica_urls(self) -> List[str]:
+        if isinstance(self.DATABASE_REPLICA_URLS, str):
+            return json.loads(self.DATABASE_REPLICA_URLS) if self.DATABASE_REPLICA_URLS else []
+        return self.DATABASE_REPLICA_URLS
 
     def get_cors_origins(self) -> List[str]:
         if self.CORS_ORIGINS == "*":
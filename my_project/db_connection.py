@@ -1,9 +1,20 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 from config import get_settings
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from fastapi import Request
+from typing import Dict, List, Optional
+import hashlib
+import hmac
+import itertools
+import threading
 import logging
+import time
+
+# Registers dialect-specific SQL compilers (e.g. now() on SQLite)
+import sql_functions  # noqa: F401
 
 # Configure logging
 logging.basicConfig(
@@ -19,53 +30,308 @@ logger = logging.getLogger("database")
 settings = get_settings()
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-try:
-    # Create SQLAlchemy engine with MySQL-specific configurations
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        echo=settings.DEBUG,  # Log SQL queries in debug mode
-        pool_pre_ping=True,  # Verify connection before using from pool
-        pool_recycle=3600,  # Recycle connections after an hour
-        pool_size=10,  # Connection pool size
-        max_overflow=20,  # Maximum number of connections to allow in addition to pool_size
-        connect_args={
+def _engine_options(url) -> dict:
+    options = {
+        "echo": settings.DEBUG,  # Log SQL queries in debug mode
+        "pool_pre_ping": True,  # Verify connection before using from pool
+    }
+
+    if url.get_backend_name() == "sqlite":
+        # SQLite connections are shared across FastAPI's threadpool
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": 30  # Seconds to wait on a locked database
+        }
+        return options
+
+    options.update({
+        "pool_recycle": 3600,  # Recycle connections after an hour
+        "pool_size": 10,  # Connection pool size
+        "max_overflow": 20,  # Maximum number of connections to allow in addition to pool_size
+    })
+    if url.get_backend_name() == "mysql":
+        options["connect_args"] = {
             "connect_timeout": 30,  # 30 seconds timeout
             "charset": "utf8mb4"  # Support all Unicode characters
         }
-    )
-    logger.info(f"Database engine created for {SQLALCHEMY_DATABASE_URL.split('@')[1]}")
-    
-    # Create session factory
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    # Base class for models
-    Base = declarative_base()
-    
-    # Initialize the database
-    def init_db():
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer commits
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _create_engine(url: str):
+    url = make_url(url)
+    new_engine = create_engine(url, **_engine_options(url))
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+class ReplicaRouter:
+    """Round-robin over healthy read replicas.
+
+    A replica is probed with SELECT 1 at most once per health check interval;
+    failing replicas are skipped until a later probe succeeds.
+    """
+
+    def __init__(self, engines: List, check_interval: int):
+        self.engines = engines
+        self.check_interval = check_interval
+        self._healthy: Dict[int, bool] = {id(engine): True for engine in engines}
+        self._checked_at: Dict[int, float] = {id(engine): 0.0 for engine in engines}
+        self._cycle = itertools.cycle(engines) if engines else None
+        self._lock = threading.Lock()
+
+    def _probe(self, engine) -> bool:
         try:
-            # Import models here to avoid circular imports
-            from db_models import User, Visitor, VisitorPhoto, Badge, SystemLog
-            
-            # Create tables
-            Base.metadata.create_all(bind=engine)
-            logger.info("Database tables created successfully")
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return True
         except SQLAlchemyError as e:
-            logger.error(f"Error initializing database: {str(e)}")
-            raise
-    
-    # Database dependency for FastAPI
-    def get_db():
+            logger.warning(f"Replica {engine.url.host} failed health check: {str(e)}")
+            return False
+
+    def is_healthy(self, engine) -> bool:
+        key = id(engine)
+        now = time.monotonic()
+        if now - self._checked_at[key] >= self.check_interval:
+            self._checked_at[key] = now
+            healthy = self._probe(engine)
+            if healthy and not self._healthy[key]:
+                logger.info(f"Replica {engine.url.host} is healthy again")
+            self._healthy[key] = healthy
+        return self._healthy[key]
+
+    def mark_unhealthy(self, engine):
+        self._healthy[id(engine)] = False
+        self._checked_at[id(engine)] = time.monotonic()
+
+    def pick(self):
+        """Return a healthy replica engine, or None to use the primary"""
+        if not self._cycle:
+            return None
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self.is_healthy(engine):
+                return engine
+        return None
+
+    def status(self) -> List[dict]:
+        return [
+            {"host": engine.url.host, "healthy": self._healthy[id(engine)]}
+            for engine in self.engines
+        ]
+
+# Read-your-writes: a request that commits a write gets a signed last-write
+# timestamp back (cookie and header). While it is recent, the caller's reads
+# go to the primary, whichever worker serves them.
+LAST_WRITE_COOKIE = "vms_last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+def _last_write_signature(timestamp_ms: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), f"last-write:{timestamp_ms}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def last_write_token(timestamp: float) -> str:
+    timestamp_ms = str(int(timestamp * 1000))
+    return f"{timestamp_ms}.{_last_write_signature(timestamp_ms)}"
+
+def _wrote_recently(request: Optional[Request]) -> bool:
+    """Whether the request carries a valid last-write token inside the window"""
+    if request is None:
+        return False
+    token = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    if not token or "." not in token:
+        return False
+    timestamp_ms, signature = token.split(".", 1)
+    if not timestamp_ms.isdigit() or not hmac.compare_digest(signature, _last_write_signature(timestamp_ms)):
+        return False
+    age = time.time() - int(timestamp_ms) / 1000
+    return 0 <= age < settings.READ_YOUR_WRITES_SECONDS
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that hands a last-write token to callers whose request committed a write"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Request.state writes land in this dict (see _mark_last_write)
+        state = scope.setdefault("state", {})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.get("last_write_at"):
+                token = last_write_token(state["last_write_at"])
+                headers = list(message.get("headers", []))
+                headers.append((LAST_WRITE_HEADER.lower().encode(), token.encode()))
+                headers.append((b"set-cookie", (
+                    f"{LAST_WRITE_COOKIE}={token}; Max-Age={settings.READ_YOUR_WRITES_SECONDS}; "
+                    f"Path=/; HttpOnly; SameSite=Lax"
+                ).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+# Engines are created on first use rather than at import, so importing the
+# app (tests, CLI tools, forking servers) does not load database drivers
+_engine = None
+_replica_engines: List = []
+_replica_router: Optional[ReplicaRouter] = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Return the primary engine, creating it (and the replica engines) on first use"""
+    global _engine, _replica_engines, _replica_router
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is None:
+            try:
+                primary = _create_engine(SQLALCHEMY_DATABASE_URL)
+                logger.info(f"Database engine created for {primary.url.render_as_string(hide_password=True)}")
+
+                _replica_engines = [_create_engine(url) for url in settings.get_replica_urls()]
+                for replica in _replica_engines:
+                    logger.info(f"Read replica engine created for {replica.url.render_as_string(hide_password=True)}")
+                _replica_router = ReplicaRouter(_replica_engines, settings.REPLICA_HEALTH_CHECK_SECONDS)
+            except SQLAlchemyError as e:
+                logger.error(f"Database connection error: {str(e)}")
+                raise
+
+            SessionLocal.configure(bind=primary)
+            _engine = primary
+    return _engine
+
+def get_replica_router() -> ReplicaRouter:
+    get_engine()
+    return _replica_router
+
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker that binds to the primary engine when the first session is made"""
+
+    def __call__(self, **local_kw):
+        if "bind" not in local_kw and self.kw.get("bind") is None:
+            get_engine()
+        return super().__call__(**local_kw)
+
+# Create session factories
+# Objects stay loaded after commit, so responses never need a refresh round trip
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# Base class for models
+Base = declarative_base()
+
+# Track writes so committing sessions pin their caller to the primary
+@event.listens_for(Session, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["has_writes"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    # Audit rows alone (e.g. a badge scan) change nothing the caller reads back
+    if orm_execute_state.execution_options.get("audit_only"):
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["has_writes"] = True
+
+@event.listens_for(Session, "after_commit")
+def _mark_last_write(session):
+    request = session.info.get("request")
+    if session.info.pop("has_writes", False) and request is not None:
+        request.state.last_write_at = time.time()
+
+@event.listens_for(ReadSessionLocal, "before_flush")
+def _reject_replica_writes(session, flush_context, instances):
+    raise SQLAlchemyError("Attempted to write through a read-only replica session")
+
+# Initialize the database
+def init_db():
+    try:
+        # Import models here to avoid circular imports
+        from db_models import (
+            User, Visitor, VisitorPhoto, Badge, SystemLog, VisitorTombstone, IdempotencyKey, OutboxMessage, WebhookSubscription, WebhookDelivery, ReportJob,
+            VisitorArchive, BadgeArchive, VisitorPhotoArchive, VisitorDailyRollup, ImportProgress
+        )
+
+        # Create tables
+        Base.metadata.create_all(bind=get_engine())
+        logger.info("Database tables created successfully")
+    except SQLAlchemyError as e:
+        logger.error(f"Error initializing database: {str(e)}")
+        raise
+
+def dispose_engines(close: bool = True):
+    """Drop pooled connections on the primary and every replica.
+
+    After a fork, pass close=False: the parent's connections are abandoned
+    without closing sockets that the parent process still owns.
+    """
+    if _engine is None:
+        return
+    for pooled_engine in [_engine, *_replica_engines]:
+        pooled_engine.dispose(close=close)
+
+# Database dependency for FastAPI
+def get_db(request: Request = None):
+    db = SessionLocal()
+    db.info["request"] = request
+    try:
+        yield db
+    except SQLAlchemyError as e:
+        logger.error(f"Database session error: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def open_read_session():
+    """Read session that outlives the request, for streamed exports.
+
+    Uses a healthy replica when there is one; a little replication lag is
+    fine for exports, so primary pinning is not applied. The caller closes it.
+    """
+    replica = get_replica_router().pick()
+    if replica is None:
+        return SessionLocal()
+    return ReadSessionLocal(bind=replica)
+
+# Read-only database dependency for listing, stats and verification endpoints
+def get_read_db(request: Request = None):
+    replica = None
+    if not _wrote_recently(request):
+        replica = get_replica_router().pick()
+
+    if replica is None:
         db = SessionLocal()
-        try:
-            yield db
-        except SQLAlchemyError as e:
-            logger.error(f"Database session error: {str(e)}")
-            db.rollback()
-            raise
-        finally:
-            db.close()
-            
-except SQLAlchemyError as e:
-    logger.error(f"Database connection error: {str(e)}")
-    raise
\ No newline at end of file
+        db.info["request"] = request
+    else:
+        db = ReadSessionLocal(bind=replica)
+
+    try:
+        yield db
+    except OperationalError as e:
+        logger.error(f"Database session error: {str(e)}")
+        if replica is not None:
+            # Route subsequent reads elsewhere until the next health check
+            get_replica_router().mark_unhealthy(replica)
+        db.rollback()
+        raise
+    except SQLAlchemyError as e:
+        logger.error(f"Database session error: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text, LargeBinary
+from sqlalchemy import Index, Column, Integer, BigInteger, String, Boolean, Date, DateTime, Float, ForeignKey, Enum, Text, LargeBinary, BINARY
+from sqlalchemy.dialects import mysql, postgresql
 from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 import enum
+import os
+import time
 import uuid
 from datetime import datetime
 from db_connection import Base
@@ -9,7 +13,44 @@ import re
 from sqlalchemy.ext.hybrid import hybrid_property
 
 def generate_uuid():
-    return str(uuid.uuid4())
+    """Time-ordered UUIDv7: 48-bit millisecond timestamp followed by random bits.
+
+    New keys land at the right edge of the clustered index instead of being
+    scattered across it like uuid4.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms << 80) | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # Version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return str(uuid.UUID(int=value))
+
+class BinaryUUID(TypeDecorator):
+    """Stores UUIDs as 16 raw bytes while exposing the usual 36-char string"""
+    impl = BINARY(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.BYTEA())
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        if isinstance(value, bytes):
+            return value
+        try:
+            return uuid.UUID(str(value)).bytes
+        except ValueError:
+            # Malformed ids (e.g. from URLs) must simply match nothing
+            return b""
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
 
 class VisitPurpose(str, enum.Enum):
     MEETING = "meeting"
@@ -29,7 +70,7 @@ class VisitStatus(str, enum.Enum):
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(String(36), primary_key=True, default=generate_uuid)
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
     username = Column(String(50), unique=True, index=True, nullable=False)
     email = Column(String(100), unique=True, index=True, nullable=False)
     full_name = Column(String(100), nullable=False)
@@ -37,8 +78,9 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     is_admin = Column(Boolean, default=False)
     disabled = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Stamped in Python so the flush knows them without reading the row back
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
     visitors_hosting = relationship("Visitor", back_populates="host", cascade="all, delete-orphan")
@@ -60,20 +102,37 @@ class User(Base):
 class Visitor(Base):
     __tablename__ = "visitors"
 
-    id = Column(String(36), primary_key=True, default=generate_uuid)
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
     full_name = Column(String(100), nullable=False)
     email = Column(String(100), nullable=False)
     phone = Column(String(20), nullable=False)
     company = Column(String(100), nullable=True)
     purpose = Column(Enum(VisitPurpose), nullable=False)
     image = Column(String(255), nullable=True)  # URL or path to the image
-    host_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    host_id = Column(BinaryUUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     status = Column(Enum(VisitStatus), default=VisitStatus.PENDING)
     scheduled_time = Column(DateTime, nullable=True)
     check_in_time = Column(DateTime, nullable=True)
     check_out_time = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Stamped in Python so the flush knows them without reading the row back
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Drives delta sync, and marks the rows of a bulk transition on MySQL (visitor_state.py),
+    # so it keeps microseconds there too
+    updated_at = Column(
+        DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"),
+        default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Optimistic concurrency
+
+    # ORM updates and deletes also check and bump `version`
+    __mapper_args__ = {"version_id_col": version}
+
+    # Serves the expected-arrivals window: status equality, then a scheduled_time range;
+    # status then created_at lets visitor_archive.py find old terminal visits without a scan
+    __table_args__ = (
+        Index("ix_visitors_status_scheduled_time", "status", "scheduled_time"),
+        Index("ix_visitors_status_created_at", "status", "created_at"),
+    )
 
     # Relationships
     host = relationship("User", back_populates="visitors_hosting")
@@ -106,8 +165,8 @@ class Visitor(Base):
 class VisitorPhoto(Base):
     __tablename__ = "visitor_photos"
 
-    id = Column(String(36), primary_key=True, default=generate_uuid)
-    visitor_id = Column(String(36), ForeignKey("visitors.id", ondelete="CASCADE"), nullable=False, unique=True)
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
+    visitor_id = Column(BinaryUUID, ForeignKey("visitors.id", ondelete="CASCADE"), nullable=False, unique=True)
     photo_data = Column(LargeBinary(length=(2**32)-1), nullable=False)  # Use LONGBLOB for storing images
     content_type = Column(String(50), nullable=False)  # Store MIME type (e.g., image/jpeg)
     created_at = Column(DateTime, default=func.now())
@@ -118,8 +177,8 @@ class VisitorPhoto(Base):
 class Badge(Base):
     __tablename__ = "badges"
 
-    id = Column(String(36), primary_key=True, default=generate_uuid)
-    visitor_id = Column(String(36), ForeignKey("visitors.id", ondelete="CASCADE"), nullable=False, unique=True)
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
+    visitor_id = Column(BinaryUUID, ForeignKey("visitors.id", ondelete="CASCADE"), nullable=False, unique=True)
     qr_code = Column(String(100), nullable=False, unique=True, index=True)
     expiry_time = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=func.now())
@@ -127,6 +186,183 @@ class Badge(Base):
     # Relationships
     visitor = relationship("Visitor", back_populates="badge")
 
+class VisitorTombstone(Base):
+    """Records deleted visitors so delta sync clients can drop them"""
+    __tablename__ = "visitor_tombstones"
+
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
+    visitor_id = Column(BinaryUUID, nullable=False)
+    host_id = Column(BinaryUUID, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, index=True)  # Same clock as Visitor.updated_at
+
+class VisitorArchive(Base):
+    """Checked-out, rejected and expired visits moved out of `visitors` by visitor_archive.py"""
+    __tablename__ = "visitors_archive"
+
+    # Same columns as visitors, so rows are copied with INSERT ... SELECT
+    id = Column(BinaryUUID, primary_key=True)
+    full_name = Column(String(100), nullable=False)
+    email = Column(String(100), nullable=False)
+    phone = Column(String(20), nullable=False)
+    company = Column(String(100), nullable=True)
+    purpose = Column(Enum(VisitPurpose), nullable=False)
+    image = Column(String(255), nullable=True)
+    host_id = Column(BinaryUUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status = Column(Enum(VisitStatus), nullable=False)
+    scheduled_time = Column(DateTime, nullable=True)
+    check_in_time = Column(DateTime, nullable=True)
+    check_out_time = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, default=func.now())
+
+    # created_at gives the archive's newest visit and serves date ranges
+    __table_args__ = (
+        Index("ix_visitors_archive_created_at", "created_at"),
+        Index("ix_visitors_archive_host_id_created_at", "host_id", "created_at"),
+    )
+
+class BadgeArchive(Base):
+    __tablename__ = "badges_archive"
+
+    id = Column(BinaryUUID, primary_key=True)
+    visitor_id = Column(BinaryUUID, ForeignKey("visitors_archive.id", ondelete="CASCADE"), nullable=False, unique=True)
+    qr_code = Column(String(100), nullable=False, unique=True)
+    expiry_time = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=True)
+
+class VisitorPhotoArchive(Base):
+    __tablename__ = "visitor_photos_archive"
+
+    id = Column(BinaryUUID, primary_key=True)
+    visitor_id = Column(BinaryUUID, ForeignKey("visitors_archive.id", ondelete="CASCADE"), nullable=False, unique=True)
+    photo_data = Column(LargeBinary(length=(2**32)-1), nullable=False)
+    content_type = Column(String(50), nullable=False)
+    created_at = Column(DateTime, nullable=True)
+
+class VisitorDailyRollup(Base):
+    """Per-day counts of archived visits, so stats over old periods need not read the archive"""
+    __tablename__ = "visitor_daily_rollups"
+
+    day = Column(Date, primary_key=True)  # Date of created_at
+    host_id = Column(BinaryUUID, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(Enum(VisitStatus), primary_key=True)
+    purpose = Column(Enum(VisitPurpose), primary_key=True)
+    visitors = Column(Integer, nullable=False, default=0)
+    checked_in = Column(Integer, nullable=False, default=0)  # Visits with a check-in time
+    completed = Column(Integer, nullable=False, default=0)  # Visits with check-in and check-out times
+    visit_minutes = Column(Float, nullable=False, default=0)  # Total duration of the completed visits
+
+class IdempotencyKey(Base):
+    """Response stored for a POST so a retry with the same Idempotency-Key is replayed"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # SHA-256 of caller, method, path and header value
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the request body
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is in flight
+    claim_token = Column(String(32), nullable=True)  # Identifies the attempt holding the key
+    committed_at = Column(DateTime, nullable=True)  # Set in the transaction of the request's writes
+    media_type = Column(String(100), nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class OutboxMessage(Base):
+    """Email staged in the same transaction as the change it reports; sent by outbox.py"""
+    __tablename__ = "outbox_messages"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    recipient = Column(String(100), nullable=False)
+    subject = Column(String(200), nullable=False)
+    body = Column(Text, nullable=False)
+    dedupe_key = Column(String(100), nullable=False, index=True)  # Same key, same email: sent once
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent or dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # Also the claim lease while a worker sends it
+    claim_token = Column(String(32), nullable=True)  # Identifies the claim that set the lease
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    # The dispatcher polls for due pending messages
+    __table_args__ = (Index("ix_outbox_messages_status_next_attempt_at", "status", "next_attempt_at"),)
+
+class WebhookSubscription(Base):
+    """External system (turnstiles, HR) that receives visitor events"""
+    __tablename__ = "webhook_subscriptions"
+
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
+    name = Column(String(100), nullable=False)
+    url = Column(String(500), nullable=False)
+    secret = Column(String(100), nullable=False)  # HMAC key for the X-VMS-Signature header
+    event_types = Column(Text, nullable=False)  # Comma-separated, e.g. "visitor.approved,visitor.checked_in"
+    max_concurrency = Column(Integer, nullable=False, default=1)  # Requests in flight to this subscriber
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=func.now())
+
+    deliveries = relationship("WebhookDelivery", back_populates="subscription", cascade="all, delete-orphan")
+
+class WebhookDelivery(Base):
+    """One event for one subscription, staged with the change that raised it; sent by webhooks.py"""
+    __tablename__ = "webhook_deliveries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subscription_id = Column(BinaryUUID, ForeignKey("webhook_subscriptions.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON event body
+    status = Column(String(20), nullable=False, default="pending")  # pending, delivered or dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # Also the claim lease while a worker sends it
+    claim_token = Column(String(32), nullable=True)  # Identifies the claim that set the lease
+    last_status_code = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    delivered_at = Column(DateTime, nullable=True)
+
+    # The dispatcher polls for due pending deliveries
+    __table_args__ = (Index("ix_webhook_deliveries_status_next_attempt_at", "status", "next_attempt_at"),)
+
+    subscription = relationship("WebhookSubscription", back_populates="deliveries")
+
+class ReportJob(Base):
+    """Report requested through /reports; rendered in a worker process by reports.py"""
+    __tablename__ = "report_jobs"
+
+    id = Column(BinaryUUID, primary_key=True, default=generate_uuid)
+    report_type = Column(String(50), nullable=False)
+    format = Column(String(10), nullable=False)
+    spec = Column(Text, nullable=False)  # Canonical JSON of the request
+    spec_hash = Column(String(64), nullable=False, index=True)  # Identical specs reuse a recent artifact
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed or expired
+    progress = Column(Integer, nullable=False, default=0)  # Percent
+    error = Column(Text, nullable=True)
+    artifact_path = Column(String(500), nullable=True)
+    artifact_size = Column(Integer, nullable=True)
+    requested_by = Column(BinaryUUID, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Touched with every progress update while running
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)  # The artifact is deleted after this
+
+    # The scheduler polls for queued jobs, oldest first
+    __table_args__ = (Index("ix_report_jobs_status_created_at", "status", "created_at"),)
+
+class ImportProgress(Base):
+    """Position of an import_data.py run, advanced in the transaction of every chunk it loads"""
+    __tablename__ = "import_progress"
+
+    key = Column(String(64), primary_key=True)  # SHA-256 of kind and absolute source path
+    kind = Column(String(20), nullable=False)
+    source = Column(Text, nullable=False)
+    source_size = Column(BigInteger, nullable=False)  # A different size means a different file
+    rows_done = Column(Integer, nullable=False, default=0)  # Last input line committed
+    inserted = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
 
@@ -134,10 +370,20 @@ class SystemLog(Base):
     action = Column(String(50), nullable=False)
     entity_type = Column(String(50), nullable=False)  # e.g., "visitor", "user", "badge"
     entity_id = Column(String(50), nullable=False)
-    user_id = Column(String(36), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    user_id = Column(BinaryUUID, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     details = Column(Text, nullable=True)
     ip_address = Column(String(45), nullable=True)  # IPv6 addresses can be up to 45 chars
     created_at = Column(DateTime, default=func.now())
 
+    # Filters of GET /logs, each ending in id for its keyset pagination;
+    # created_at serves time ranges and is the partition key on MySQL (log_retention.py)
+    __table_args__ = (
+        Index("ix_system_logs_entity", "entity_type", "entity_id", "id"),
+        Index("ix_system_logs_user_id", "user_id", "id"),
+        Index("ix_system_logs_action", "action", "id"),
+        Index("ix_system_logs_ip_address", "ip_address", "id"),
+        Index("ix_system_logs_created_at", "created_at"),
+    )
+
     # Relationships
     user = relationship("User", back_populates="system_logs")
\ No newline at end of file
@@ -2,6 +2,7 @@ from fastapi import Request, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from jose.exceptions import JWTError
 import logging
 
@@ -43,6 +44,21 @@ class DuplicateError(Exception):
         self.detail = message
         super().__init__(self.detail)
 
+class ConflictError(Exception):
+    def __init__(self, detail: str = "The resource was modified by another request"):
+        self.detail = detail
+        super().__init__(self.detail)
+
+class GoneError(Exception):
+    def __init__(self, detail: str = "The resource is no longer available"):
+        self.detail = detail
+        super().__init__(self.detail)
+
+class IdempotencyKeyReuseError(Exception):
+    def __init__(self, detail: str = "Idempotency-Key was already used with a different request body"):
+        self.detail = detail
+        super().__init__(self.detail)
+
 # Error handler for database errors
 async def database_error_handler(request: Request, exc: SQLAlchemyError):
     logger.error(f"Database error: {str(exc)}")
@@ -58,8 +74,8 @@ async def integrity_error_handler(request: Request, exc: IntegrityError):
     # Try to extract useful information from the error message
     error_message = "A data integrity error occurred."
     
-    if "Duplicate entry" in str(exc):
-        # MySQL specific error message for duplicate entries
+    if "Duplicate entry" in str(exc) or "UNIQUE constraint failed" in str(exc):
+        # MySQL and SQLite error messages for duplicate entries
         error_message = "A record with the same unique values already exists."
     
     return JSONResponse(
@@ -67,6 +83,14 @@ async def integrity_error_handler(request: Request, exc: IntegrityError):
         content={"detail": error_message}
     )
 
+# Error handler for optimistic concurrency failures (version mismatch on flush)
+async def stale_data_error_handler(request: Request, exc: StaleDataError):
+    logger.info(f"Stale data error: {str(exc)}")
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": "The resource was modified by another request. Please reload and try again."}
+    )
+
 # Error handler for validation errors
 async def validation_error_handler(request: Request, exc: RequestValidationError):
     logger.warning(f"Validation error: {str(exc)}")
@@ -126,13 +150,41 @@ async def duplicate_error_handler(request: Request, exc: DuplicateError):
         content={"detail": exc.detail}
     )
 
+# Error handler for state transition conflicts
+async def conflict_error_handler(request: Request, exc: ConflictError):
+    logger.info(f"Conflict error: {exc.detail}")
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": exc.detail}
+    )
+
+# Error handler for expired sync tokens and the like
+async def gone_error_handler(request: Request, exc: GoneError):
+    logger.info(f"Gone error: {exc.detail}")
+    return JSONResponse(
+        status_code=status.HTTP_410_GONE,
+        content={"detail": exc.detail}
+    )
+
+# Error handler for idempotency keys replayed with a different payload
+async def idempotency_key_reuse_error_handler(request: Request, exc: IdempotencyKeyReuseError):
+    logger.info(f"Idempotency key reuse: {exc.detail}")
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"detail": exc.detail}
+    )
+
 # Configure exception handlers for FastAPI app
 def configure_exception_handlers(app):
     app.add_exception_handler(SQLAlchemyError, database_error_handler)
     app.add_exception_handler(IntegrityError, integrity_error_handler)
+    app.add_exception_handler(StaleDataError, stale_data_error_handler)
     app.add_exception_handler(RequestValidationError, validation_error_handler)
     app.add_exception_handler(JWTError, jwt_error_handler)
     app.add_exception_handler(NotFoundError, not_found_error_handler)
     app.add_exception_handler(AuthorizationError, authorization_error_handler)
     app.add_exception_handler(BadRequestError, bad_request_error_handler)
-    app.add_exception_handler(DuplicateError, duplicate_error_handler)
\ No newline at end of file
+    app.add_exception_handler(DuplicateError, duplicate_error_handler)
+    app.add_exception_handler(ConflictError, conflict_error_handler)
+    app.add_exception_handler(GoneError, gone_error_handler)
+    app.add_exception_handler(IdempotencyKeyReuseError, idempotency_key_reuse_error_handler)
\ No newline at end of file
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional, Set
+
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger("events")
+
+settings = get_settings()
+
+# Visitor event types pushed to dashboards
+VISITOR_CREATED = "visitor.created"
+VISITOR_UPDATED = "visitor.updated"
+VISITOR_APPROVED = "visitor.approved"
+VISITOR_REJECTED = "visitor.rejected"
+VISITOR_CHECKED_IN = "visitor.checked_in"
+VISITOR_CHECKED_OUT = "visitor.checked_out"
+VISITOR_EXPIRED = "visitor.expired"
+VISITOR_DELETED = "visitor.deleted"
+BADGE_INVALIDATED = "badge.invalidated"
+
+# Backoff between attempts to reach the Redis broker
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 30
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return str(value)
+
+
+def visitor_event(event_type: str, visitor) -> dict:
+    """Build an event payload from a visitor.
+
+    Call this before committing: the payload must not depend on attributes
+    that are expired (or deleted) once the transaction ends.
+    """
+    return {
+        "type": event_type,
+        "visitor_id": visitor.id,
+        "host_id": visitor.host_id,
+        "full_name": visitor.full_name,
+        "status": visitor.status.value if visitor.status else None,
+        "scheduled_time": visitor.scheduled_time,
+        "check_in_time": visitor.check_in_time,
+        "check_out_time": visitor.check_out_time,
+        "timestamp": datetime.utcnow()
+    }
+
+
+class Subscription:
+    """A single stream consumer with a bounded queue"""
+
+    def __init__(self, user_id: str, sees_all: bool, max_queue: int):
+        self.user_id = user_id
+        self.sees_all = sees_all
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def accepts(self, event: dict) -> bool:
+        return self.sees_all or event.get("host_id") == self.user_id
+
+
+class LocalBackplane:
+    """Default fan-out: events only reach subscribers of this worker"""
+
+    async def start(self, broker: "EventBroker"):
+        pass
+
+    async def stop(self):
+        pass
+
+    def send(self, message: str):
+        pass
+
+
+class RedisBackplane:
+    """Cross-worker fan-out over a Redis pub/sub channel.
+
+    Any Redis-protocol server works as the broker, so a local instance can
+    stand in during development. Each worker tags its messages with its own
+    id and ignores them on the way back in. A lost connection is retried
+    with backoff; events published while it is down reach only this
+    worker's subscribers.
+    """
+
+    def __init__(self, url: str, channel: str):
+        self.url = url
+        self.channel = channel
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self._broker: Optional["EventBroker"] = None
+        # Publishes in flight, referenced until done so they are not collected
+        self._sends: Set[asyncio.Task] = set()
+
+    async def start(self, broker: "EventBroker"):
+        import redis.asyncio as redis
+
+        self._broker = broker
+        self._redis = redis.from_url(self.url)
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        if self._redis:
+            await self._redis.close()
+            self._redis = None
+
+    def send(self, message: str):
+        if self._redis is not None:
+            task = asyncio.create_task(self._redis.publish(self.channel, message))
+            self._sends.add(task)
+            task.add_done_callback(self._sent)
+
+    def _sent(self, task: asyncio.Task):
+        self._sends.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Event fan-out publish failed: {str(task.exception())}")
+
+    async def _listen(self):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                logger.info(f"Event fan-out connected to {self.channel}")
+                delay = RECONNECT_MIN_SECONDS
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        envelope = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    if envelope.get("origin") != self._broker.worker_id:
+                        self._broker.deliver(envelope["event"])
+                # The server closed the subscription
+                raise ConnectionError("subscription ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event fan-out lost {self.channel}: {str(e)}; retrying in {delay}s")
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+
+class EventBroker:
+    """In-process pub/sub for visitor state changes"""
+
+    def __init__(self, backplane, max_queue: int):
+        self.backplane = backplane
+        self.max_queue = max_queue
+        self.worker_id: Optional[str] = None
+        self._subscriptions: Set[Subscription] = set()
+        self._listeners: List[Callable[[dict], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        # Generated here, not at import: workers forked from a preloaded app
+        # would otherwise share one id and drop each other's events as their own
+        self.worker_id = str(uuid.uuid4())
+        self._loop = asyncio.get_running_loop()
+        await self.backplane.start(self)
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, user_id: str, sees_all: bool) -> Subscription:
+        subscription = Subscription(user_id, sees_all, self.max_queue)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def add_listener(self, callback: Callable[[dict], None]):
+        """Call `callback` for every delivered event, including other workers' events"""
+        self._listeners.append(callback)
+
+    def publish(self, event: dict):
+        """Publish an event from this worker; safe to call from any thread"""
+        event = json.loads(json.dumps(event, default=_json_default))
+        if self._loop is None:
+            self.deliver(event)
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._publish(event)
+        else:
+            self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: dict):
+        self.deliver(event)
+        self.backplane.send(json.dumps({"origin": self.worker_id, "event": event}))
+
+    def deliver(self, event: dict):
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Event listener failed: {str(e)}")
+
+        for subscription in self._subscriptions:
+            if subscription.overflowed or not subscription.accepts(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: stop feeding it, the stream tells the client to resync
+                subscription.overflowed = True
+
+
+def _create_backplane():
+    url = settings.EVENTS_BROKER_URL
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url, settings.EVENTS_CHANNEL)
+    return LocalBackplane()
+
+
+broker = EventBroker(_create_backplane(), settings.EVENTS_MAX_QUEUE)
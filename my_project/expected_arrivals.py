@@ -0,0 +1,123 @@
+"""Expected-arrivals feed for the guard desk.
+
+Approved visitors scheduled inside a time window, oldest first, read through
+the (status, scheduled_time) index. The window start is rounded down to a
+time bucket so every guard polling within the same bucket shares one cached,
+already-encoded payload. Visitor events clear the cache (the broker also
+delivers other workers' events), so approvals, pre-approvals, check-ins and
+badge changes show up on the next poll.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
+import threading
+
+from db_models import User, Visitor, Badge, VisitStatus
+from config import get_settings
+from responses import dumps
+import events
+
+settings = get_settings()
+
+# Events that cannot change who is expected
+_IGNORED_EVENTS = {events.VISITOR_CHECKED_OUT}
+
+
+def window_for(now: datetime, hours: int) -> Tuple[datetime, datetime]:
+    """Bucket-aligned window covering late visitors and the next `hours`"""
+    bucket = settings.EXPECTED_ARRIVALS_BUCKET_SECONDS
+    epoch = datetime(1970, 1, 1)
+    seconds = int((now - epoch).total_seconds()) // bucket * bucket
+    bucket_start = epoch + timedelta(seconds=seconds)
+    return (
+        bucket_start - timedelta(minutes=settings.EXPECTED_ARRIVALS_GRACE_MINUTES),
+        bucket_start + timedelta(hours=hours)
+    )
+
+
+def load_expected(db: Session, start: datetime, end: datetime, host_id: Optional[str] = None) -> dict:
+    query = (
+        db.query(
+            Visitor.id,
+            Visitor.full_name,
+            Visitor.company,
+            Visitor.purpose,
+            Visitor.host_id,
+            Visitor.scheduled_time,
+            User.full_name.label("host_name"),
+            Badge.qr_code
+        )
+        .outerjoin(User, User.id == Visitor.host_id)
+        # visitor_id is unique on badges, so the join cannot duplicate rows
+        .outerjoin(Badge, Badge.visitor_id == Visitor.id)
+        .filter(
+            Visitor.status == VisitStatus.APPROVED,
+            Visitor.scheduled_time >= start,
+            Visitor.scheduled_time < end
+        )
+    )
+    if host_id:
+        query = query.filter(Visitor.host_id == host_id)
+
+    rows = query.order_by(Visitor.scheduled_time).limit(settings.EXPECTED_ARRIVALS_LIMIT).all()
+    return {
+        "window_start": start,
+        "window_end": end,
+        "visitors": [
+            {
+                "id": row.id,
+                "full_name": row.full_name,
+                "company": row.company,
+                "purpose": row.purpose,
+                "host_id": row.host_id,
+                "host_name": row.host_name or "Unknown",
+                "scheduled_time": row.scheduled_time,
+                "qr_code": row.qr_code
+            }
+            for row in rows
+        ]
+    }
+
+
+class ExpectedArrivalsCache:
+    """Encoded payloads keyed by (window start, hours, host scope)"""
+
+    def __init__(self):
+        self._entries: Dict[tuple, bytes] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, now: datetime, hours: int, host_id: Optional[str] = None) -> bytes:
+        start, end = window_for(now, hours)
+        key = (start, hours, host_id)
+        with self._lock:
+            body = self._entries.get(key)
+            generation = self._generation
+        if body is not None:
+            return body
+
+        body = dumps(load_expected(db, start, end, host_id))
+        with self._lock:
+            # Skip the store if an event arrived while the query ran
+            if generation == self._generation:
+                # Entries from earlier buckets can never be asked for again
+                self._entries = {k: v for k, v in self._entries.items() if k[0] >= start}
+                self._entries[key] = body
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._generation += 1
+
+    def on_event(self, event: dict):
+        if event.get("type") in _IGNORED_EVENTS:
+            return
+        # Self-registrations start out pending and stay off the feed until approved
+        if event.get("type") == events.VISITOR_CREATED and event.get("status") != VisitStatus.APPROVED.value:
+            return
+        self.clear()
+
+
+cache = ExpectedArrivalsCache()
+events.broker.add_listener(cache.on_event)
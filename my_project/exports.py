@@ -0,0 +1,118 @@
+"""Streaming CSV/NDJSON exports.
+
+Rows are read with `yield_per`, which also turns on `stream_results`, so
+drivers with server-side cursors fetch EXPORT_BATCH_SIZE rows per round
+trip instead of buffering the whole result. Each batch is encoded and
+yielded as one chunk of a StreamingResponse, and the compression
+middleware gzips chunk by chunk, so memory stays flat whatever the row
+count.
+
+FastAPI closes yield dependencies before a streamed body is sent, so the
+generator opens its own read session and closes it when the stream ends
+or the client goes away.
+"""
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+from datetime import date, datetime
+from typing import Callable, Iterator, Sequence
+import csv
+import enum
+import io
+import logging
+
+from config import get_settings
+from db_connection import open_read_session
+from responses import dumps
+
+# Configure logging
+logger = logging.getLogger("exports")
+
+settings = get_settings()
+
+CSV = "csv"
+NDJSON = "ndjson"
+FORMATS = (CSV, NDJSON)
+
+_MEDIA_TYPES = {
+    CSV: "text/csv; charset=utf-8",
+    NDJSON: "application/x-ndjson",
+}
+
+
+# Leading characters that make a spreadsheet read a cell as a formula
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def spreadsheet_safe(value):
+    """`value` with a leading ' if a spreadsheet would otherwise run it as a formula.
+
+    Names, companies and emails come from the public self-registration
+    form, and exported files are opened in spreadsheets.
+    """
+    # A lone "-" (the reports' "no value") cannot be a formula
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES) and value != "-":
+        return "'" + value
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return spreadsheet_safe(value.value)
+    return spreadsheet_safe(value)
+
+
+def _stream_rows(
+    build_query: Callable[[Session], Query],
+    row_to_dict: Callable[[object], dict],
+    columns: Sequence[str],
+    export_format: str
+) -> Iterator[bytes]:
+    db = open_read_session()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == CSV:
+            writer.writerow(columns)
+
+        result = db.execute(
+            build_query(db).statement,
+            execution_options={"yield_per": settings.EXPORT_BATCH_SIZE}
+        )
+        for batch in result.partitions():
+            if export_format == CSV:
+                writer.writerows([_csv_value(value) for value in row_to_dict(row).values()] for row in batch)
+                chunk = buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                chunk = b"".join(dumps(row_to_dict(row)) + b"\n" for row in batch)
+            yield chunk
+
+        if export_format == CSV and buffer.tell():
+            # Header of an empty export
+            yield buffer.getvalue().encode("utf-8")
+    except Exception as e:
+        # Headers are already sent; the client sees a truncated body
+        logger.error(f"Export failed: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+def export_response(
+    build_query: Callable[[Session], Query],
+    row_to_dict: Callable[[object], dict],
+    columns: Sequence[str],
+    export_format: str,
+    filename: str
+) -> StreamingResponse:
+    """Stream the rows of `build_query(session)` as `export_format`; `row_to_dict` yields `columns` in order"""
+    return StreamingResponse(
+        _stream_rows(build_query, row_to_dict, columns, export_format),
+        media_type=_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
@@ -0,0 +1,291 @@
+"""Idempotency-Key support for POST endpoints.
+
+Kiosks and badge scanners retry POSTs on flaky networks. A client sends
+the same `Idempotency-Key` header on every attempt; the first attempt runs
+normally and its response is stored, later attempts get the stored
+response back (with `Idempotent-Replayed: true`) without touching the
+database again.
+
+Keys are scoped to the caller, method and path. Completed responses are
+kept in a per-worker LRU and in the `idempotency_keys` table, which is also
+what makes a key claimable by only one worker at a time.
+
+Each claim carries a token. The endpoint's UnitOfWork marks the key
+committed in the same transaction as its writes, and only while that
+token still holds the key, so the writes and the mark succeed or fail
+together. A retry after a crash between that commit and storing the
+response gets a conflict, never a second execution. An attempt whose
+lease lapsed and whose key a retry has taken over fails its commit.
+"""
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy.exc import IntegrityError
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from config import get_settings
+from db_connection import SessionLocal
+from db_models import IdempotencyKey
+from error_handlers import BadRequestError, ConflictError, IdempotencyKeyReuseError
+
+# Configure logging
+logger = logging.getLogger("idempotency")
+
+settings = get_settings()
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL_SECONDS = 60
+IN_FLIGHT_LEASE_SECONDS = 60  # A crashed attempt that wrote nothing frees its key after this
+
+
+class StoredResponse:
+    def __init__(self, fingerprint: str, status_code: Optional[int], media_type: Optional[str],
+                 body: Optional[bytes], expires_at: datetime, committed: bool = False):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.media_type = media_type
+        self.body = body
+        self.expires_at = expires_at
+        self.committed = committed
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+    def to_response(self) -> Response:
+        return Response(
+            content=self.body,
+            status_code=self.status_code,
+            media_type=self.media_type,
+            headers={REPLAYED_HEADER: "true"}
+        )
+
+
+def _scope_key(request: Request, key: str) -> str:
+    # The bearer token identifies the user without a database lookup;
+    # anonymous kiosks are told apart by address
+    caller = request.headers.get("Authorization") or (request.client.host if request.client else "")
+    return hashlib.sha256(f"{caller}|{request.method}|{request.url.path}|{key}".encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: int, cache_size: int):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def _cached(self, scope: str, now: datetime) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._cache.get(scope)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del self._cache[scope]
+                return None
+            self._cache.move_to_end(scope)
+            return entry
+
+    def _remember(self, scope: str, entry: StoredResponse):
+        with self._lock:
+            self._cache[scope] = entry
+            self._cache.move_to_end(scope)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _purge_expired(self, db, now: datetime):
+        # At most once a minute per worker; the expires_at index keeps it cheap
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = time.monotonic()
+        deleted = db.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= now).delete(synchronize_session=False)
+        if deleted:
+            logger.info(f"Purged {deleted} expired idempotency keys")
+
+    def claim(self, scope: str, fingerprint: str, token: str) -> Optional[StoredResponse]:
+        """Claim `scope` for this request under `token`.
+
+        Returns None when the caller should run the request, or the stored
+        response to replay. Raises ConflictError while another attempt is in
+        flight or when one wrote without storing a response, and
+        IdempotencyKeyReuseError when the body differs. Blocking; call it
+        off the event loop.
+        """
+        now = datetime.utcnow()
+        entry = self._cached(scope, now)
+        if entry is None:
+            entry = self._claim_in_db(scope, fingerprint, token, now)
+            if entry is None:
+                return None
+
+        if entry.fingerprint != fingerprint:
+            raise IdempotencyKeyReuseError()
+        if not entry.completed:
+            if entry.committed:
+                raise ConflictError("A request with this Idempotency-Key was already processed but its response was not stored")
+            raise ConflictError("A request with this Idempotency-Key is still being processed")
+        return entry
+
+    def _claim_in_db(self, scope: str, fingerprint: str, token: str, now: datetime) -> Optional[StoredResponse]:
+        db = SessionLocal()
+        try:
+            self._purge_expired(db, now)
+            # A committed key's expiry is the full TTL, so only lapsed
+            # in-flight claims and expired responses are taken over
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.key == scope, IdempotencyKey.expires_at <= now
+            ).delete(synchronize_session=False)
+            db.add(IdempotencyKey(
+                key=scope,
+                fingerprint=fingerprint,
+                claim_token=token,
+                expires_at=now + timedelta(seconds=IN_FLIGHT_LEASE_SECONDS)
+            ))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+
+            # Another attempt got there first, in this worker or another one
+            row = db.query(IdempotencyKey).filter(IdempotencyKey.key == scope).first()
+            if row is None:
+                raise ConflictError("A request with this Idempotency-Key is still being processed")
+            entry = StoredResponse(
+                row.fingerprint, row.status_code, row.media_type, row.response_body, row.expires_at,
+                committed=row.committed_at is not None
+            )
+            if entry.completed:
+                self._remember(scope, entry)
+            return entry
+        finally:
+            db.close()
+
+    def mark_committed(self, db, request: Optional[Request]):
+        """Mark the request's key as written, inside the transaction `db` is about to commit.
+
+        Called by UnitOfWork.commit. Raises ConflictError, so nothing is
+        committed, when this attempt no longer holds its key.
+        """
+        claim = getattr(request.state, "idempotency_claim", None) if request is not None else None
+        if claim is None:
+            return
+        scope, token = claim
+        now = datetime.utcnow()
+        updated = db.query(IdempotencyKey).filter(
+            IdempotencyKey.key == scope,
+            IdempotencyKey.claim_token == token,
+            IdempotencyKey.committed_at.is_(None)
+        ).update({
+            IdempotencyKey.committed_at: now,
+            IdempotencyKey.expires_at: now + self.ttl
+        }, synchronize_session=False)
+        if not updated:
+            raise ConflictError("A retry with this Idempotency-Key took over this request; nothing was saved")
+
+    def complete(self, scope: str, token: str, fingerprint: str, response: Response):
+        """Store the response to replay; blocking, call it off the event loop"""
+        entry = StoredResponse(
+            fingerprint,
+            response.status_code,
+            response.headers.get("content-type"),
+            bytes(response.body),
+            datetime.utcnow() + self.ttl
+        )
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.key == scope, IdempotencyKey.claim_token == token
+            ).update({
+                IdempotencyKey.status_code: entry.status_code,
+                IdempotencyKey.media_type: entry.media_type,
+                IdempotencyKey.response_body: entry.body,
+                IdempotencyKey.expires_at: entry.expires_at
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self._remember(scope, entry)
+
+    def release(self, scope: str, token: str):
+        """Forget an unfinished claim that wrote nothing, so the next retry runs the request again"""
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.key == scope,
+                IdempotencyKey.claim_token == token,
+                IdempotencyKey.committed_at.is_(None)
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to release idempotency key: {str(e)}")
+        finally:
+            db.close()
+
+    def _release_later(self, scope: str, token: str):
+        # In a thread, not awaited: the endpoint's session is closed only after
+        # the handler returns, and until then it may hold locks the release
+        # needs (on SQLite, the database write lock)
+        asyncio.get_running_loop().run_in_executor(None, self.release, scope, token)
+
+    async def run(self, request: Request, key: str, handler: Callable) -> Response:
+        if len(key) > MAX_KEY_LENGTH:
+            raise BadRequestError(f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+        scope = _scope_key(request, key)
+        # The body is cached on the request, so the handler can still read it
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+        token = uuid.uuid4().hex
+        stored = await asyncio.to_thread(self.claim, scope, fingerprint, token)
+        if stored is not None:
+            logger.info(f"Replaying stored response for {request.method} {request.url.path}")
+            return stored.to_response()
+
+        # The endpoint's UnitOfWork marks the key committed with its writes
+        request.state.idempotency_claim = (scope, token)
+        try:
+            response = await handler(request)
+        except Exception:
+            # A claim whose writes committed is kept, so a retry cannot repeat them
+            self._release_later(scope, token)
+            raise
+
+        # Server errors are retryable and streamed bodies cannot be stored
+        if response.status_code >= 500 or not hasattr(response, "body"):
+            self._release_later(scope, token)
+        else:
+            try:
+                await asyncio.to_thread(self.complete, scope, token, fingerprint, response)
+            except Exception as e:
+                # The writes are committed and the key marked, so retries get a conflict
+                logger.error(f"Failed to store idempotent response: {str(e)}")
+        return response
+
+
+store = IdempotencyStore(settings.IDEMPOTENCY_TTL_SECONDS, settings.IDEMPOTENCY_CACHE_SIZE)
+
+
+class IdempotentRoute(APIRoute):
+    """Route class that honours the Idempotency-Key header on POST requests"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if request.method != "POST" or not key:
+                return await handler(request)
+            return await store.run(request, key, handler)
+
+        return idempotent_handler
@@ -0,0 +1,401 @@
+"""Bulk import of staff users and visitor history from another system.
+
+Rows are streamed from a CSV (header row) or NDJSON file and validated
+with the API schemas (UserCreate, VisitorImport) in a process pool, where
+user passwords are also bcrypt-hashed in parallel. Legacy exports that
+already hold bcrypt hashes can provide a `hashed_password` column instead
+of `password`. Visitor hosts are resolved through an in-memory map of user
+ids, usernames and emails, and rows are loaded with chunked multi-row
+INSERTs, one transaction per chunk.
+
+Every chunk's transaction also advances the import's row in
+import_progress, so an interrupted import resumes after the last committed
+chunk when run again with the same arguments, and never loads a row twice.
+Rejected rows, including lines that are not valid JSON objects, are
+written to an NDJSON errors file with their line number in the input
+(lines rejected in a chunk that did not commit are listed again on resume).
+
+Usage:
+    python import_data.py users staff.csv
+    python import_data.py visitors history.ndjson --workers 8 --chunk-size 2000
+    python import_data.py visitors history.csv --restart   # ignore the saved progress
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from datetime import datetime
+from pydantic import ValidationError
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from config import get_settings
+
+logger = logging.getLogger("import_data")
+
+settings = get_settings()
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Stream (line number, row, error) from a CSV or NDJSON file.
+
+    A line that cannot be read has an error instead of a row. For CSV the
+    number is the line a record ends on, so the header is line 1.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, None, f"invalid JSON: {e.msg} (column {e.colno})"
+                    continue
+                if isinstance(row, dict):
+                    yield number, row, None
+                else:
+                    yield number, None, f"expected a JSON object, got {type(row).__name__}"
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Empty cells mean "not given"
+                yield reader.line_num, {key: value for key, value in row.items() if key and value not in ("", None)}, None
+
+
+def _errors(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Fix timezone issue
+    return value.replace(tzinfo=None) if value else None
+
+
+# Pool workers: validate (and hash) one chunk, return (rows, errors)
+
+def prepare_users(chunk: List[Tuple[int, dict]]) -> Tuple[List[Tuple[int, dict]], List[Tuple[int, List[str]]]]:
+    from schemas import UserBase, UserCreate
+    from auth import get_password_hash
+
+    rows, errors = [], []
+    for number, raw in chunk:
+        try:
+            if raw.get("hashed_password"):
+                user = UserBase.model_validate(raw)
+                hashed_password = raw["hashed_password"]
+                if not hashed_password.startswith(BCRYPT_PREFIXES):
+                    errors.append((number, ["hashed_password: must be a bcrypt hash"]))
+                    continue
+            else:
+                user = UserCreate.model_validate(raw)
+                hashed_password = get_password_hash(user.password)
+        except ValidationError as e:
+            errors.append((number, _errors(e)))
+            continue
+
+        rows.append((number, {
+            "username": user.username,
+            "email": user.email,
+            "full_name": user.full_name,
+            "department": user.department,
+            "hashed_password": hashed_password,
+            "is_admin": str(raw.get("is_admin", "")).lower() in ("1", "true", "yes")
+        }))
+    return rows, errors
+
+
+def prepare_visitors(chunk: List[Tuple[int, dict]]) -> Tuple[List[Tuple[int, dict]], List[Tuple[int, List[str]]]]:
+    from schemas import VisitorImport
+
+    rows, errors = [], []
+    for number, raw in chunk:
+        try:
+            visitor = VisitorImport.model_validate(raw)
+        except ValidationError as e:
+            errors.append((number, _errors(e)))
+            continue
+
+        rows.append((number, {
+            "full_name": visitor.full_name,
+            "email": visitor.email,
+            "phone": visitor.phone,
+            "company": visitor.company,
+            "purpose": visitor.purpose,
+            "image": visitor.photo_url,
+            "host_id": visitor.host_id,  # Resolved against the host map before loading
+            "status": visitor.status,
+            "scheduled_time": _naive(visitor.scheduled_time),
+            "check_in_time": _naive(visitor.check_in_time),
+            "check_out_time": _naive(visitor.check_out_time),
+            "created_at": _naive(visitor.created_at)
+        }))
+    return rows, errors
+
+
+class Checkpoint:
+    """Rows already committed, kept in import_progress and saved with each chunk"""
+
+    def __init__(self, kind: str, source: str):
+        self.kind = kind
+        self.source = os.path.abspath(source)
+        self.source_size = os.path.getsize(source)
+        self.key = hashlib.sha256(f"{kind}:{self.source}".encode()).hexdigest()
+        self.rows_done = 0
+        self.inserted = 0
+        self.rejected = 0
+
+    def load(self, db):
+        from db_models import ImportProgress
+
+        # Databases prepared before import_progress existed
+        ImportProgress.__table__.create(bind=db.get_bind(), checkfirst=True)
+        saved = db.get(ImportProgress, self.key)
+        db.rollback()
+        if saved is None:
+            return
+        if saved.source_size != self.source_size:
+            raise SystemExit(f"{self.source} changed since its import was interrupted; pass --restart to start over")
+        self.rows_done = saved.rows_done
+        self.inserted = saved.inserted
+        self.rejected = saved.rejected
+
+    def stage(self, db):
+        """Save the position in the caller's transaction"""
+        from db_models import ImportProgress
+
+        values = {"rows_done": self.rows_done, "inserted": self.inserted, "rejected": self.rejected}
+        updated = db.execute(
+            ImportProgress.__table__.update().where(ImportProgress.key == self.key).values(**values)
+        ).rowcount
+        if not updated:
+            db.execute(ImportProgress.__table__.insert().values(
+                key=self.key, kind=self.kind, source=self.source, source_size=self.source_size, **values
+            ))
+
+    def discard(self, db):
+        from db_models import ImportProgress
+
+        ImportProgress.__table__.create(bind=db.get_bind(), checkfirst=True)
+        db.execute(ImportProgress.__table__.delete().where(ImportProgress.key == self.key))
+        db.commit()
+
+
+class Loader:
+    """Resolves references and inserts prepared chunks, one transaction each"""
+
+    def __init__(self, kind: str, source: str, dry_run: bool):
+        from db_connection import SessionLocal
+        from db_models import User
+
+        self.kind = kind
+        self.source = os.path.basename(source)[:50]
+        self.dry_run = dry_run
+        self.db = SessionLocal()
+        users = self.db.query(User.id, User.username, User.email).all()
+        # Existing accounts: reject duplicates up front instead of failing a whole chunk
+        self.usernames = {user.username for user in users}
+        self.emails = {user.email.lower() for user in users}
+        # Host map: legacy exports reference hosts by id, username or email
+        self.hosts: Dict[str, str] = {}
+        for user in users:
+            self.hosts[user.id] = user.id
+            self.hosts[user.username] = user.id
+            self.hosts[user.email.lower()] = user.id
+
+    def close(self):
+        self.db.close()
+
+    def _resolve_users(self, rows):
+        accepted, errors = [], []
+        for number, row in rows:
+            if row["username"] in self.usernames:
+                errors.append((number, [f"username: {row['username']} already exists"]))
+            elif row["email"].lower() in self.emails:
+                errors.append((number, [f"email: {row['email']} already exists"]))
+            else:
+                self.usernames.add(row["username"])
+                self.emails.add(row["email"].lower())
+                accepted.append(row)
+        return accepted, errors
+
+    def _resolve_visitors(self, rows):
+        accepted, errors = [], []
+        for number, row in rows:
+            host_id = self.hosts.get(row["host_id"]) or self.hosts.get(row["host_id"].lower())
+            if host_id is None:
+                errors.append((number, [f"host_id: no user with id, username or email {row['host_id']}"]))
+                continue
+            accepted.append(dict(row, host_id=host_id))
+        return accepted, errors
+
+    def resolve(self, rows: List[Tuple[int, dict]]) -> Tuple[List[dict], List[Tuple[int, List[str]]]]:
+        """Rows ready to insert, with ids, and the rows rejected against existing data"""
+        from db_models import generate_uuid
+
+        if self.kind == "users":
+            accepted, errors = self._resolve_users(rows)
+        else:
+            accepted, errors = self._resolve_visitors(rows)
+
+        now = datetime.utcnow()
+        for row in accepted:
+            row["id"] = generate_uuid()
+            row["created_at"] = row.get("created_at") or now
+            row["updated_at"] = now
+            if self.kind == "visitors":
+                row["version"] = 1
+            else:
+                # New users can also host the visitors imported after them
+                self.hosts[row["id"]] = row["id"]
+                self.hosts[row["username"]] = row["id"]
+                self.hosts[row["email"].lower()] = row["id"]
+        return accepted, errors
+
+    def insert(self, accepted: List[dict], checkpoint: Checkpoint):
+        """Insert one chunk and advance the checkpoint in a single transaction"""
+        from db_models import User, Visitor, SystemLog
+
+        if self.dry_run:
+            return
+        model = User if self.kind == "users" else Visitor
+        try:
+            if accepted:
+                # insertmanyvalues turns each executemany into multi-row INSERTs
+                for start in range(0, len(accepted), settings.BULK_CHUNK_SIZE):
+                    self.db.execute(model.__table__.insert(), accepted[start:start + settings.BULK_CHUNK_SIZE])
+                self.db.execute(SystemLog.__table__.insert(), {
+                    "action": "import",
+                    "entity_type": "user" if model is User else "visitor",
+                    "entity_id": self.source,
+                    "user_id": None,
+                    "ip_address": "import",
+                    "details": f"Imported {len(accepted)} {self.kind} (import_data.py)"
+                })
+            checkpoint.stage(self.db)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+
+def _chunks(rows: Iterator[Tuple[int, Optional[dict], Optional[str]]], size: int,
+            skip: int) -> Iterator[Tuple[int, List[Tuple[int, List[str]]], List[Tuple[int, dict]]]]:
+    """(last line, unreadable lines with their errors, rows) for every `size` lines after line `skip`"""
+    chunk, unreadable, last = [], [], 0
+    for number, row, error in rows:
+        if number <= skip:
+            continue
+        last = number
+        if error:
+            unreadable.append((number, [error]))
+        else:
+            chunk.append((number, row))
+        if len(chunk) + len(unreadable) >= size:
+            yield last, unreadable, chunk
+            chunk, unreadable = [], []
+    if chunk or unreadable:
+        yield last, unreadable, chunk
+
+
+def run_import(kind: str, path: str, workers: int, chunk_size: int, checkpoint: Checkpoint,
+               errors_path: str, dry_run: bool, restart: bool = False):
+    prepare = prepare_users if kind == "users" else prepare_visitors
+    loader = Loader(kind, path, dry_run)
+    try:
+        # A dry run always reads the whole file and leaves the saved progress alone
+        if restart and not dry_run:
+            checkpoint.discard(loader.db)
+        elif not dry_run:
+            checkpoint.load(loader.db)
+        started = time.monotonic()
+        resumed_from = checkpoint.rows_done
+        if resumed_from:
+            logger.info(f"Resuming after line {resumed_from}")
+
+        # spawn: a forked child would share the loader's database connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool, \
+                open(errors_path, "a") as errors_file:
+            # A bounded window of chunks in flight keeps memory flat on huge files;
+            # chunks are loaded in input order so the checkpoint is a single line number
+            in_flight = deque()
+            for last_line, unreadable, chunk in _chunks(read_rows(path), chunk_size, checkpoint.rows_done):
+                in_flight.append((last_line, unreadable, pool.submit(prepare, chunk)))
+                if len(in_flight) >= workers * 2:
+                    _finish_chunk(in_flight.popleft(), loader, checkpoint, errors_file)
+                    _report(checkpoint, resumed_from, started)
+            while in_flight:
+                _finish_chunk(in_flight.popleft(), loader, checkpoint, errors_file)
+                _report(checkpoint, resumed_from, started)
+
+        if not dry_run:
+            checkpoint.discard(loader.db)
+    finally:
+        loader.close()
+
+
+def _finish_chunk(entry, loader: Loader, checkpoint: Checkpoint, errors_file):
+    last_line, unreadable, future = entry
+    rows, errors = future.result()
+    accepted, load_errors = loader.resolve(rows)
+    rejected = sorted(unreadable + errors + load_errors)
+
+    # Written before the commit, so a crash in between repeats these lines rather than losing them
+    for number, messages in rejected:
+        errors_file.write(json.dumps({"row": number, "errors": messages}) + "\n")
+    errors_file.flush()
+
+    checkpoint.rows_done = last_line
+    checkpoint.inserted += len(accepted)
+    checkpoint.rejected += len(rejected)
+    loader.insert(accepted, checkpoint)
+
+
+def _report(checkpoint: Checkpoint, resumed_from: int, started: float):
+    elapsed = time.monotonic() - started
+    rate = (checkpoint.rows_done - resumed_from) / elapsed if elapsed else 0.0
+    logger.info(
+        f"{checkpoint.rows_done} lines read, {checkpoint.inserted} inserted, "
+        f"{checkpoint.rejected} rejected ({rate:.0f} lines/s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=["users", "visitors"])
+    parser.add_argument("path", help="CSV file with a header row, or .ndjson/.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="validation/hashing processes")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per transaction")
+    parser.add_argument("--errors", help="rejected rows, NDJSON (default: <path>.errors.ndjson)")
+    parser.add_argument("--restart", action="store_true", help="discard the saved progress of an interrupted import")
+    parser.add_argument("--dry-run", action="store_true", help="validate only: insert nothing, write the errors file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", stream=sys.stderr)
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+
+    checkpoint = Checkpoint(args.kind, args.path)
+    errors_path = args.errors or f"{args.path}.errors.ndjson"
+    if (args.restart or args.dry_run) and os.path.exists(errors_path):
+        os.remove(errors_path)
+
+    run_import(args.kind, args.path, max(1, args.workers), max(1, args.chunk_size), checkpoint, errors_path,
+               args.dry_run, args.restart)
+
+    logger.info(
+        f"Done: {checkpoint.inserted} {args.kind} {'valid' if args.dry_run else 'inserted'}, {checkpoint.rejected} rejected"
+        + (f" (see {errors_path})" if checkpoint.rejected else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
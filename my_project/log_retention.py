@@ -0,0 +1,212 @@
+"""Monthly partitions and retention for system_logs.
+
+On MySQL, `partition` converts system_logs to RANGE COLUMNS partitions on
+created_at, one per month (p202405 holds May 2024). Retention then removes
+whole months with `ALTER TABLE ... DROP PARTITION`, which is a metadata
+change instead of millions of row deletes, and time-range queries on
+/logs only read the partitions they cover. With --archive, an expired
+month is first swapped out with EXCHANGE PARTITION into its own table
+(system_logs_p202405) that can be dumped and dropped at leisure.
+
+MySQL does not allow foreign keys on partitioned tables and needs the
+partition column in the primary key, so `partition` drops the
+system_logs.user_id foreign key and makes the key (id, created_at).
+Deleting a user then leaves its log rows pointing at the old id, which
+/logs shows without a user.
+
+Other databases (and MySQL before `partition`) keep one table; `run`
+deletes expired rows there in LOG_RETENTION_BATCH_SIZE batches.
+
+Usage:
+    python log_retention.py partition [--dry-run]   # MySQL, once
+    python log_retention.py run [--archive] [--dry-run]   # e.g. daily from cron
+"""
+from datetime import date, datetime
+from typing import List, Tuple
+import argparse
+import logging
+
+from sqlalchemy import text
+
+from config import get_settings
+from db_connection import get_engine, SessionLocal
+from db_models import SystemLog
+
+# Configure logging
+logger = logging.getLogger("log_retention")
+
+settings = get_settings()
+
+TABLE = "system_logs"
+
+
+def add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _partition_sql(month: date) -> str:
+    # A partition holds the rows before the first day of the next month
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1):%Y-%m-%d}')"
+
+
+def retention_cutoff(today: date) -> date:
+    """First day of the oldest month that is kept"""
+    return add_months(today.replace(day=1), -settings.LOG_RETENTION_MONTHS)
+
+
+def existing_partitions(connection) -> List[str]:
+    rows = connection.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"table": TABLE})
+    return [row.PARTITION_NAME for row in rows]
+
+
+def build_partition_statements(connection, today: date) -> List[str]:
+    """Statements converting system_logs to monthly partitions"""
+    statements = []
+    constraints = connection.execute(text(
+        "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+        "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+    ), {"table": TABLE})
+    for row in constraints:
+        statements.append(f"ALTER TABLE `{TABLE}` DROP FOREIGN KEY `{row.CONSTRAINT_NAME}`")
+
+    # The partition key must be NOT NULL and part of every unique key
+    statements.append(f"UPDATE `{TABLE}` SET `created_at` = CURRENT_TIMESTAMP WHERE `created_at` IS NULL")
+    statements.append(
+        f"ALTER TABLE `{TABLE}` MODIFY `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        f"DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `created_at`)"
+    )
+
+    oldest = connection.execute(text(f"SELECT MIN(`created_at`) FROM `{TABLE}`")).scalar()
+    month = (oldest.date() if oldest else today).replace(day=1)
+    # Everything past retention shares the first partition, which the next `run` drops
+    month = max(month, add_months(retention_cutoff(today), -1))
+    last = add_months(today.replace(day=1), settings.LOG_PARTITIONS_AHEAD)
+    partitions = []
+    while month <= last:
+        partitions.append(_partition_sql(month))
+        month = add_months(month, 1)
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    statements.append(f"ALTER TABLE `{TABLE}` PARTITION BY RANGE COLUMNS(`created_at`) (\n  " + ",\n  ".join(partitions) + "\n)")
+    return statements
+
+
+def build_retention_statements(partitions: List[str], today: date, archive: bool) -> Tuple[List[str], List[str]]:
+    """(statements, expired partition names) for adding upcoming months and removing expired ones"""
+    statements = []
+    months = sorted(
+        datetime.strptime(name[1:], "%Y%m").date()
+        for name in partitions if name != "pmax"
+    )
+
+    # Keep LOG_PARTITIONS_AHEAD empty months ready so rows never pile up in pmax
+    month = add_months(months[-1], 1) if months else today.replace(day=1)
+    upcoming = []
+    while month <= add_months(today.replace(day=1), settings.LOG_PARTITIONS_AHEAD):
+        upcoming.append(_partition_sql(month))
+        month = add_months(month, 1)
+    if upcoming:
+        statements.append(
+            f"ALTER TABLE `{TABLE}` REORGANIZE PARTITION pmax INTO (\n  "
+            + ",\n  ".join(upcoming + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]) + "\n)"
+        )
+
+    cutoff = retention_cutoff(today)
+    expired = [partition_name(month) for month in months if add_months(month, 1) <= cutoff]
+    for name in expired:
+        if archive:
+            archive_table = f"{TABLE}_{name}"
+            statements.append(f"CREATE TABLE `{archive_table}` LIKE `{TABLE}`")
+            statements.append(f"ALTER TABLE `{archive_table}` REMOVE PARTITIONING")
+            statements.append(f"ALTER TABLE `{TABLE}` EXCHANGE PARTITION {name} WITH TABLE `{archive_table}`")
+        statements.append(f"ALTER TABLE `{TABLE}` DROP PARTITION {name}")
+    return statements, expired
+
+
+def delete_expired(today: date, dry_run: bool) -> int:
+    """Delete rows older than the retention cutoff in bounded batches; returns the count"""
+    cutoff = datetime.combine(retention_cutoff(today), datetime.min.time())
+    db = SessionLocal()
+    try:
+        if dry_run:
+            return db.query(SystemLog.id).filter(SystemLog.created_at < cutoff).count()
+
+        deleted = 0
+        while True:
+            # Short transactions: writers to system_logs only ever wait for one batch
+            ids = [
+                log_id for (log_id,) in db.query(SystemLog.id)
+                .filter(SystemLog.created_at < cutoff)
+                .order_by(SystemLog.id)
+                .limit(settings.LOG_RETENTION_BATCH_SIZE)
+            ]
+            if not ids:
+                return deleted
+            db.query(SystemLog).filter(SystemLog.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            deleted += len(ids)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("partition", "run"))
+    parser.add_argument("--archive", action="store_true", help="keep expired months as system_logs_pYYYYMM tables (partitioned MySQL only)")
+    parser.add_argument("--dry-run", action="store_true", help="print what would be done without doing it")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    today = datetime.utcnow().date()
+    is_mysql = engine.dialect.name == "mysql"
+
+    if args.command == "partition":
+        if not is_mysql:
+            parser.error(f"Partitioning is only supported on MySQL (got {engine.dialect.name}); `run` deletes in batches instead")
+        with engine.connect() as connection:
+            if existing_partitions(connection):
+                parser.error(f"{TABLE} is already partitioned")
+            statements = build_partition_statements(connection, today)
+            for statement in statements:
+                print(statement + ";")
+                if not args.dry_run:
+                    connection.execute(text(statement))
+            if not args.dry_run:
+                connection.commit()
+                logger.info(f"Partitioned {TABLE} by month")
+        return
+
+    partitions = []
+    if is_mysql:
+        with engine.connect() as connection:
+            partitions = existing_partitions(connection)
+
+    if not partitions:
+        if args.archive:
+            parser.error("--archive needs a partitioned MySQL table; run `partition` first")
+        count = delete_expired(today, args.dry_run)
+        print(f"{'Would delete' if args.dry_run else 'Deleted'} {count} log rows before {retention_cutoff(today)}")
+        return
+
+    statements, expired = build_retention_statements(partitions, today, args.archive)
+    with engine.connect() as connection:
+        for statement in statements:
+            print(statement + ";")
+            if not args.dry_run:
+                connection.execute(text(statement))
+        if not args.dry_run:
+            connection.commit()
+    if not args.dry_run:
+        logger.info(f"Removed {len(expired)} expired partition(s) from {TABLE}" + (" into archive tables" if args.archive else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,25 +3,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import logging
 import time
-import uvicorn
 
 # Import configuration
 from config import get_settings
 
 # Import database connection
-from db_connection import init_db
+from db_connection import dispose_engines, get_engine, ReadYourWritesMiddleware
+
+# Import response rendering
+from responses import FastJSONResponse
 
 # Import error handlers
 from error_handlers import configure_exception_handlers
 
-# Import route modules
-from routes_auth import router as auth_router
-from routes_users import router as users_router
-from routes_visitors import router as visitors_router
-from routes_badges import router as badges_router
-from routes_photos import router as photos_router
-from routes_stats import router as stats_router
-
 # Get settings
 settings = get_settings()
 
@@ -35,102 +29,183 @@ logging.basicConfig(
 )
 logger = logging.getLogger("main")
 
-# Create FastAPI application
-app = FastAPI(
-    title="Visitor Management System",
-    description="A complete system for managing visitors in a facility",
-    version="1.0.0",
-    docs_url=f"{settings.API_PREFIX}/docs",
-    redoc_url=f"{settings.API_PREFIX}/redoc",
-    openapi_url=f"{settings.API_PREFIX}/openapi.json"
-)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Configure error handlers
-configure_exception_handlers(app)
-
-# Request timing middleware
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
-
-# Include all routers
-app.include_router(auth_router)
-app.include_router(users_router)
-app.include_router(visitors_router)
-app.include_router(badges_router)
-app.include_router(photos_router)
-app.include_router(stats_router)
-
-# Root endpoint
-@app.get("/")
-async def root():
-    return {"message": "Welcome to the Visitor Management System API"}
-
-# Health check endpoint
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy", "api": "Visitor Management System"}
-
-# Initialize database on startup
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Starting Visitor Management System...")
-    
-    try:
-        # Initialize database
-        init_db()
-        logger.info("Database initialized successfully")
-        
-        # Create initial admin user if needed
-        from auth import get_password_hash
-        from db_connection import get_db
-        from db_models import User
+def create_app() -> FastAPI:
+    """Build the application.
+
+    Route modules are imported here rather than when this module is
+    imported, and database engines are only created in the startup hook.
+    """
+    # Import route modules
+    from routes_auth import router as auth_router
+    from routes_users import router as users_router
+    from routes_visitors import router as visitors_router
+    from routes_badges import router as badges_router
+    from routes_photos import router as photos_router
+    from routes_stats import router as stats_router
+    from routes_events import router as events_router
+    from routes_webhooks import router as webhooks_router
+    from routes_exports import router as exports_router
+    from routes_reports import router as reports_router
+    from routes_logs import router as logs_router
+
+    # Create FastAPI application
+    app = FastAPI(
+        title="Visitor Management System",
+        description="A complete system for managing visitors in a facility",
+        version="1.0.0",
+        docs_url=f"{settings.API_PREFIX}/docs",
+        redoc_url=f"{settings.API_PREFIX}/redoc",
+        openapi_url=f"{settings.API_PREFIX}/openapi.json",
+        default_response_class=FastJSONResponse  # orjson when installed
+    )
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Callers whose request wrote get a last-write token, so their next reads
+    # go to the primary on whichever worker serves them
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    # Compress large JSON/CSV responses for clients on slow links
+    if settings.COMPRESSION_ENABLED:
+        from compression import CompressionMiddleware
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+            gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+            brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+
+    # Configure on-demand profiling (a single flag check while no session is armed)
+    if settings.PROFILER_ENABLED:
+        from profiler import ProfilerMiddleware
+        app.add_middleware(ProfilerMiddleware)
+
+    # Configure error handlers
+    configure_exception_handlers(app)
+
+    # Request timing middleware
+    @app.middleware("http")
+    async def add_process_time_header(request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        response.headers["X-Process-Time"] = str(process_time)
+        return response
+
+    # Include all routers
+    app.include_router(auth_router)
+    app.include_router(users_router)
+    app.include_router(visitors_router)
+    app.include_router(badges_router)
+    app.include_router(photos_router)
+    app.include_router(stats_router)
+    app.include_router(events_router)
+    app.include_router(webhooks_router)
+    app.include_router(exports_router)
+    app.include_router(reports_router)
+    app.include_router(logs_router)
+    if settings.PROFILER_ENABLED:
+        from routes_profiler import router as profiler_router
+        app.include_router(profiler_router)
+
+    # Root endpoint
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to the Visitor Management System API"}
+
+    # Health check endpoint
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "api": "Visitor Management System"}
+
+    # Initialize database on startup
+    @app.on_event("startup")
+    async def startup_event():
+        logger.info("Starting Visitor Management System...")
         
-        db = next(get_db())
+        try:
+            if settings.INIT_DB_ON_STARTUP:
+                from bootstrap import prepare_database
+                prepare_database()
+            else:
+                # Create this worker's engine now rather than on the first request
+                get_engine()
+            
+            # Start visitor event fan-out
+            from events import broker
+            await broker.start()
+
+            # Start sending staged host notifications
+            from outbox import dispatcher
+            await dispatcher.start()
+
+            # Start webhook delivery
+            import webhooks
+            await webhooks.dispatcher.start()
+
+            # Start running queued report jobs
+            import reports
+            await reports.scheduler.start()
+
+            # Follow profiling sessions armed through any worker
+            if settings.PROFILER_ENABLED:
+                from profiler import controller
+                await controller.watch()
+            
+            logger.info("Visitor Management System started successfully")
+        except Exception as e:
+            logger.error(f"Error during startup: {str(e)}")
+            raise
+
+    # Shutdown event
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        logger.info("Shutting down Visitor Management System...")
         
-        # Check if admin user exists
-        admin = db.query(User).filter(User.username == "admin").first()
-        if not admin:
-            # Create admin user
-            admin_user = User(
-                username="admin",
-                email="admin@example.com",
-                full_name="Admin User",
-                department="IT",
-                hashed_password=get_password_hash("Admin123!"),
-                is_admin=True
-            )
-            db.add(admin_user)
-            db.commit()
-            logger.info("Created default admin user")
-        
-        db.close()
-        
-        logger.info("Visitor Management System started successfully")
-    except Exception as e:
-        logger.error(f"Error during startup: {str(e)}")
-        raise
+        from events import broker
+        await broker.stop()
+
+        from outbox import dispatcher
+        await dispatcher.stop()
 
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Shutting down Visitor Management System...")
+        import webhooks
+        await webhooks.dispatcher.stop()
 
-# Run the application
+        import reports
+        await reports.scheduler.stop()
+
+        if settings.PROFILER_ENABLED:
+            from profiler import controller
+            await controller.unwatch()
+
+        import badge_sheets
+        badge_sheets.shutdown()
+        
+        # Requests have drained by now; close pooled connections cleanly
+        dispose_engines()
+        logger.info("Database connections closed")
+
+    return app
+
+def __getattr__(name):
+    # `main:app` is built on first access, so importing main for create_app
+    # (server.py, tests, tooling) does not load every route module
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Run the application (development; use server.py in production)
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app", 
         host="0.0.0.0", 
@@ -0,0 +1,110 @@
+"""Convert CHAR(36) UUID keys to BINARY(16) on an existing MySQL database.
+
+Existing ids keep their value (only the storage changes), so URLs, QR codes
+and audit log entity ids stay valid. New rows get time-ordered UUIDv7 keys.
+
+Usage:
+    python migrate_binary_ids.py            # apply
+    python migrate_binary_ids.py --dry-run  # print the statements only
+"""
+import argparse
+import logging
+
+from sqlalchemy import bindparam, text
+
+from db_connection import get_engine
+
+logger = logging.getLogger("migrate_binary_ids")
+
+# (table, column, nullable) for every UUID key and reference
+UUID_COLUMNS = [
+    ("users", "id", False),
+    ("visitors", "id", False),
+    ("visitors", "host_id", False),
+    ("visitor_photos", "id", False),
+    ("visitor_photos", "visitor_id", False),
+    ("badges", "id", False),
+    ("badges", "visitor_id", False),
+    ("visitor_tombstones", "id", False),
+    ("visitor_tombstones", "visitor_id", False),
+    ("visitor_tombstones", "host_id", False),
+    ("system_logs", "user_id", True),
+]
+
+# (table, column, referenced table, ON DELETE) as declared in db_models
+FOREIGN_KEYS = [
+    ("visitors", "host_id", "users", "CASCADE"),
+    ("visitor_photos", "visitor_id", "visitors", "CASCADE"),
+    ("badges", "visitor_id", "visitors", "CASCADE"),
+    ("system_logs", "user_id", "users", "SET NULL"),
+]
+
+
+def _existing_foreign_keys(connection):
+    statement = text(
+        "SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+        "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME IN :tables"
+    ).bindparams(bindparam("tables", expanding=True))
+    tables = sorted({table for table, _, _, _ in FOREIGN_KEYS})
+    rows = connection.execute(statement, {"tables": tables})
+    return [(row.TABLE_NAME, row.CONSTRAINT_NAME) for row in rows]
+
+
+def _needs_conversion(connection, table: str, column: str) -> bool:
+    data_type = connection.execute(text(
+        "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column"
+    ), {"table": table, "column": column}).scalar()
+    # Missing tables are created with the new types by init_db
+    return data_type in ("char", "varchar")
+
+
+def build_statements(connection):
+    statements = ["SET FOREIGN_KEY_CHECKS = 0"]
+
+    # Foreign keys must be dropped while the referenced columns change type
+    for table, constraint in _existing_foreign_keys(connection):
+        statements.append(f"ALTER TABLE `{table}` DROP FOREIGN KEY `{constraint}`")
+
+    for table, column, nullable in UUID_COLUMNS:
+        if not _needs_conversion(connection, table, column):
+            continue
+        null_sql = "NULL" if nullable else "NOT NULL"
+        # VARBINARY first so UNHEX output is not validated as utf8mb4 text;
+        # MODIFY keeps the primary key, unique and secondary indexes in place
+        statements.append(f"ALTER TABLE `{table}` MODIFY `{column}` VARBINARY(36) {null_sql}")
+        statements.append(f"UPDATE `{table}` SET `{column}` = UNHEX(REPLACE(`{column}`, '-', '')) WHERE `{column}` IS NOT NULL")
+        statements.append(f"ALTER TABLE `{table}` MODIFY `{column}` BINARY(16) {null_sql}")
+
+    for table, column, referenced, on_delete in FOREIGN_KEYS:
+        statements.append(
+            f"ALTER TABLE `{table}` ADD CONSTRAINT `fk_{table}_{column}` FOREIGN KEY (`{column}`) "
+            f"REFERENCES `{referenced}` (`id`) ON DELETE {on_delete}"
+        )
+
+    statements.append("SET FOREIGN_KEY_CHECKS = 1")
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without executing them")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if engine.dialect.name != "mysql":
+        parser.error(f"Only MySQL databases need migrating (got {engine.dialect.name}); recreate other databases instead")
+
+    with engine.connect() as connection:
+        statements = build_statements(connection)
+        for statement in statements:
+            print(statement + ";")
+            if not args.dry_run:
+                connection.execute(text(statement))
+        if not args.dry_run:
+            connection.commit()
+            logger.info("Converted UUID columns to BINARY(16)")
+
+
+if __name__ == "__main__":
+    main()
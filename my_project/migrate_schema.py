@@ -0,0 +1,112 @@
+"""Bring an existing database up to the current models.
+
+`init_db` creates missing tables with all their columns and indexes, but
+never alters a table that already exists. This adds the columns and
+indexes introduced since such a table was created, and on MySQL widens
+DATETIME columns that now keep microseconds. Every step checks the
+live schema first, so running it again (as `bootstrap.prepare_database`
+does on every start) changes nothing.
+
+Usage:
+    python migrate_schema.py            # apply
+    python migrate_schema.py --dry-run  # print the statements only
+"""
+from typing import List
+import argparse
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from db_connection import Base, get_engine
+
+# Configure logging
+logger = logging.getLogger("migrate_schema")
+
+# (table, column) for columns added to existing tables; the DDL comes from
+# the model, and NOT NULL columns need a server_default to fill existing rows
+ADDED_COLUMNS = [
+    ("visitors", "version"),
+    ("idempotency_keys", "claim_token"),
+    ("idempotency_keys", "committed_at"),
+    ("outbox_messages", "claim_token"),
+    ("webhook_deliveries", "claim_token"),
+]
+
+# (table, column) declared DATETIME(6) on MySQL since the table was created;
+# plain DATETIME there drops the microseconds
+FRACTIONAL_DATETIME_COLUMNS = [
+    ("visitors", "updated_at"),
+]
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = column.type.compile(dialect=dialect)
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    return ddl + (" NULL" if column.nullable else " NOT NULL")
+
+
+def build_statements(connection) -> List[str]:
+    """DDL for the columns and indexes missing from existing tables"""
+    # Registers every model on Base.metadata
+    import db_models  # noqa: F401
+
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    statements = []
+
+    for table, column in ADDED_COLUMNS:
+        if table not in tables:
+            continue
+        if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+            ddl = _column_ddl(Base.metadata.tables[table].columns[column], connection.dialect)
+            statements.append(
+                f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(column)} {ddl}"
+            )
+
+    if connection.dialect.name == "mysql":
+        for table, column in FRACTIONAL_DATETIME_COLUMNS:
+            if table not in tables:
+                continue
+            existing = next((item for item in inspector.get_columns(table) if item["name"] == column), None)
+            if existing is not None and not getattr(existing["type"], "fsp", None):
+                ddl = _column_ddl(Base.metadata.tables[table].columns[column], connection.dialect)
+                statements.append(
+                    f"ALTER TABLE {preparer.quote(table)} MODIFY COLUMN {preparer.quote(column)} {ddl}"
+                )
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                statements.append(str(CreateIndex(index).compile(dialect=connection.dialect)))
+    return statements
+
+
+def upgrade(dry_run: bool = False) -> List[str]:
+    """Apply (or with dry_run only return) the missing DDL"""
+    with get_engine().connect() as connection:
+        statements = build_statements(connection)
+        if not dry_run:
+            for statement in statements:
+                logger.info(f"Migrating schema: {statement}")
+                connection.execute(text(statement))
+            connection.commit()
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without executing them")
+    args = parser.parse_args()
+
+    for statement in upgrade(dry_run=args.dry_run):
+        print(statement + ";")
+
+
+if __name__ == "__main__":
+    main()
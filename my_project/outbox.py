@@ -0,0 +1,293 @@
+"""Transactional outbox for host notification emails.
+
+Write endpoints stage notifications through `UnitOfWork.notify()`; the
+email row is inserted in the same transaction as the visitor change, so a
+notification exists exactly when the change does, and the request never
+waits on SMTP.
+
+The dispatcher is a background task in every worker. Each round it claims
+a batch of due messages (one conditional UPDATE that pushes
+`next_attempt_at` forward as a lease, so only one worker sends a
+message), sends them over a single reused SMTP connection and records
+the outcome. Failures are retried with exponential backoff until
+OUTBOX_MAX_ATTEMPTS, then left as "dead".
+A message whose dedupe key was already sent is marked sent without sending,
+and a host with several messages in one batch gets a single digest; after
+a wake-up the dispatcher waits OUTBOX_COALESCE_SECONDS so a burst of
+registrations lands in the same batch.
+"""
+from email.message import EmailMessage
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import random
+import smtplib
+import time
+import uuid
+
+from config import get_settings
+from db_connection import SessionLocal
+from db_models import OutboxMessage, User
+
+# Configure logging
+logger = logging.getLogger("outbox")
+
+settings = get_settings()
+
+# Notification kinds
+VISITOR_REGISTERED = "visitor_registered"
+VISITOR_APPROVED = "visitor_approved"
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+
+
+def host_notifications(db: Session, notifications: List[Tuple[str, object]]) -> List[dict]:
+    """Build outbox row dicts telling visitors' hosts about (kind, visitor) pairs.
+
+    Hosts are looked up with one query; hosts without an email are skipped.
+    """
+    host_ids = list({visitor.host_id for _, visitor in notifications})
+    hosts = {
+        row.id: row
+        for row in db.query(User.id, User.email, User.full_name).filter(User.id.in_(host_ids))
+    }
+
+    now = datetime.utcnow()
+    messages = []
+    for kind, visitor in notifications:
+        host = hosts.get(visitor.host_id)
+        if not host or not host.email:
+            continue
+
+        if kind == VISITOR_REGISTERED:
+            subject = f"Visitor awaiting approval: {visitor.full_name}"
+            body = f"{visitor.full_name} has registered to visit you and is waiting for your approval."
+        else:
+            subject = f"Visitor approved: {visitor.full_name}"
+            body = f"{visitor.full_name} has been approved to visit you."
+
+        messages.append({
+            "kind": kind,
+            "recipient": host.email,
+            "subject": subject,
+            "body": f"Hello {host.full_name},\n\n{body}\n",
+            # One email per visitor version: a replayed transition cannot mail twice
+            "dedupe_key": f"{kind}:{visitor.id}:{visitor.version}",
+            "next_attempt_at": now
+        })
+    return messages
+
+
+def retry_delay(attempts: int, base_seconds: int, max_seconds: int) -> timedelta:
+    """Exponential backoff after `attempts` failures"""
+    delay = min(base_seconds * 2 ** (attempts - 1), max_seconds)
+    # Jitter keeps a burst of failures from retrying in lockstep
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_due(db: Session, model, now: datetime, limit: int, lease_seconds: int, *criteria) -> list:
+    """Claim up to `limit` pending rows of `model` that are due, and commit the claim.
+
+    `model` needs `id`, `status`, `next_attempt_at` and `claim_token`
+    columns; `criteria` further restrict the rows claimed. Claiming moves
+    next_attempt_at forward by the lease; a row whose sender dies becomes
+    due again when the lease runs out.
+    """
+    due_ids = [
+        row.id for row in db.query(model.id)
+        .filter(model.status == PENDING, model.next_attempt_at <= now, *criteria)
+        .order_by(model.next_attempt_at, model.id)
+        .limit(limit)
+    ]
+    if not due_ids:
+        return []
+
+    # One UPDATE for the batch. Rows another worker claimed since the SELECT
+    # no longer match its conditions; the token tells ours apart from theirs
+    token = uuid.uuid4().hex
+    claimed = (
+        db.query(model)
+        .filter(model.id.in_(due_ids), model.status == PENDING, model.next_attempt_at <= now)
+        .update({
+            model.next_attempt_at: now + timedelta(seconds=lease_seconds),
+            model.claim_token: token
+        }, synchronize_session=False)
+    )
+    db.commit()
+
+    if not claimed:
+        return []
+    return db.query(model).filter(model.id.in_(due_ids), model.claim_token == token).order_by(model.id).all()
+
+
+def _build_email(recipient: str, messages: List[OutboxMessage]) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = settings.SMTP_FROM
+    email["To"] = recipient
+    if len(messages) == 1:
+        email["Subject"] = messages[0].subject
+        # A stable Message-ID lets mail clients drop a resend after a crash mid-batch
+        digest = hashlib.sha256(messages[0].dedupe_key.encode()).hexdigest()[:32]
+        email["Message-ID"] = f"<{digest}@vms>"
+        email.set_content(messages[0].body)
+    else:
+        email["Subject"] = f"{len(messages)} visitor updates"
+        email.set_content("\n".join(f"- {message.subject}" for message in messages))
+    return email
+
+
+class SMTPConnection:
+    """One SMTP session reused across sends; reopened after a disconnect"""
+
+    def __init__(self):
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=30)
+        if settings.SMTP_STARTTLS:
+            smtp.starttls()
+        if settings.SMTP_USERNAME:
+            smtp.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD or "")
+        return smtp
+
+    def send(self, email: EmailMessage):
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the idle session; retry once on a new one
+            self._smtp = self._connect()
+            self._smtp.send_message(email)
+        self._last_used = time.monotonic()
+
+    def close(self, idle_only: bool = False):
+        if self._smtp is None:
+            return
+        if idle_only and time.monotonic() - self._last_used < settings.SMTP_IDLE_SECONDS:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+
+class OutboxDispatcher:
+    def __init__(self):
+        self._connection = SMTPConnection()
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        if not settings.SMTP_HOST:
+            logger.info("SMTP_HOST not set; host notifications stay in the outbox")
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self._connection.close)
+
+    def wake(self):
+        """Send staged messages now instead of at the next poll; safe from any thread"""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self.dispatch_once)
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {str(e)}")
+                claimed = 0
+
+            # A full batch means more may be due already
+            if claimed >= settings.OUTBOX_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._connection.close, True)
+                continue
+            # Let a burst of registrations land in one batch (and one digest)
+            await asyncio.sleep(settings.OUTBOX_COALESCE_SECONDS)
+            self._wake.clear()
+
+    def dispatch_once(self) -> int:
+        """Claim and send one batch; returns the number of messages claimed"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            messages = claim_due(db, OutboxMessage, now, settings.OUTBOX_BATCH_SIZE, settings.OUTBOX_LEASE_SECONDS)
+            if not messages:
+                return 0
+
+            already_sent = {
+                key for (key,) in db.query(OutboxMessage.dedupe_key).filter(
+                    OutboxMessage.dedupe_key.in_({message.dedupe_key for message in messages}),
+                    OutboxMessage.status == SENT
+                )
+            }
+            by_recipient: Dict[str, List[OutboxMessage]] = {}
+            for message in messages:
+                if message.dedupe_key in already_sent:
+                    message.status = SENT
+                    message.sent_at = now
+                    continue
+                already_sent.add(message.dedupe_key)
+                by_recipient.setdefault(message.recipient, []).append(message)
+
+            for recipient, group in by_recipient.items():
+                if len(group) >= settings.NOTIFICATION_DIGEST_THRESHOLD:
+                    self._send(recipient, group)
+                else:
+                    for message in group:
+                        self._send(recipient, [message])
+
+            db.commit()
+            return len(messages)
+        finally:
+            db.close()
+
+    def _send(self, recipient: str, messages: List[OutboxMessage]):
+        try:
+            self._connection.send(_build_email(recipient, messages))
+        except Exception as e:
+            logger.warning(f"Sending {len(messages)} message(s) to {recipient} failed: {str(e)}")
+            self._connection.close()
+            now = datetime.utcnow()
+            for message in messages:
+                message.attempts += 1
+                message.last_error = str(e)
+                if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    message.status = DEAD
+                else:
+                    message.next_attempt_at = now + retry_delay(
+                        message.attempts, settings.OUTBOX_RETRY_BASE_SECONDS, settings.OUTBOX_RETRY_MAX_SECONDS
+                    )
+            return
+
+        sent_at = datetime.utcnow()
+        for message in messages:
+            message.status = SENT
+            message.sent_at = sent_at
+            message.attempts += 1
+
+
+dispatcher = OutboxDispatcher()
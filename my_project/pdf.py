@@ -0,0 +1,139 @@
+"""Minimal PDF writer for reports and badge sheets.
+
+Enough of PDF 1.4 for text in the standard Helvetica fonts, lines and
+filled rectangles, with no third-party dependency. Objects are emitted as
+they are produced: `header()`, then `page()` per page, then `trailer()`,
+so a document can be written or streamed page by page without holding it
+in memory. The page tree is written last; pages point at its object
+number, which is reserved up front.
+"""
+from typing import List, Tuple
+import zlib
+
+A4 = (595.28, 841.89)  # Points
+
+_CATALOG_ID = 1
+_PAGES_ID = 2
+_FONT_IDS = {False: 3, True: 4}  # bold -> font object
+_FIRST_FREE_ID = 5
+
+# Average Helvetica glyph width as a fraction of the font size, for truncation
+AVERAGE_CHAR_WIDTH = 0.52
+
+
+def _escape(text: str) -> bytes:
+    # The standard fonts are single-byte; WinAnsi is close enough to latin-1
+    raw = text.encode("latin-1", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"").replace(b"\n", b" ")
+
+
+def _number(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def fit(text: str, width: float, size: float) -> str:
+    """Truncate `text` so it roughly fits in `width` points at font `size`"""
+    max_chars = max(1, int(width / (size * AVERAGE_CHAR_WIDTH)))
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "~"
+
+
+class Canvas:
+    """Drawing operations for one page; y grows upwards from the bottom edge"""
+
+    def __init__(self, width: float, height: float):
+        self.width = width
+        self.height = height
+        self._ops: List[str] = []
+
+    def text(self, x: float, y: float, text: str, size: float = 10, bold: bool = False):
+        font = "F2" if bold else "F1"
+        self._ops.append(f"BT /{font} {_number(size)} Tf {_number(x)} {_number(y)} Td (")
+        self._ops.append(_escape(text).decode("latin-1"))
+        self._ops.append(") Tj ET\n")
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, width: float = 0.5):
+        self._ops.append(f"{_number(width)} w {_number(x1)} {_number(y1)} m {_number(x2)} {_number(y2)} l S\n")
+
+    def rect(self, x: float, y: float, width: float, height: float, fill: bool = True):
+        self._ops.append(f"{_number(x)} {_number(y)} {_number(width)} {_number(height)} re {'f' if fill else 'S'}\n")
+
+    def gray(self, level: float):
+        """Fill and stroke colour; 0 is black, 1 is white"""
+        self._ops.append(f"{_number(level)} g {_number(level)} G\n")
+
+    def content(self) -> bytes:
+        return "".join(self._ops).encode("latin-1")
+
+
+class PDFWriter:
+    def __init__(self, page_size: Tuple[float, float] = A4, title: str = ""):
+        self.page_size = page_size
+        self.title = title
+        self._offset = 0
+        self._offsets = {}
+        self._page_ids: List[int] = []
+        self._next_id = _FIRST_FREE_ID
+
+    def canvas(self) -> Canvas:
+        return Canvas(*self.page_size)
+
+    def _object(self, object_id: int, body: bytes) -> bytes:
+        data = f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n"
+        self._offsets[object_id] = self._offset
+        self._offset += len(data)
+        return data
+
+    def _allocate(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def header(self) -> bytes:
+        # The binary comment line marks the file as binary for transfer tools
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._offset += len(data)
+        for bold, object_id in _FONT_IDS.items():
+            name = "Helvetica-Bold" if bold else "Helvetica"
+            data += self._object(
+                object_id,
+                f"<< /Type /Font /Subtype /Type1 /BaseFont /{name} /Encoding /WinAnsiEncoding >>".encode()
+            )
+        return data
+
+    def page(self, canvas: Canvas) -> bytes:
+        stream = zlib.compress(canvas.content(), 6)
+        content_id = self._allocate()
+        page_id = self._allocate()
+        self._page_ids.append(page_id)
+        data = self._object(
+            content_id,
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream"
+        )
+        data += self._object(page_id, (
+            f"<< /Type /Page /Parent {_PAGES_ID} 0 R "
+            f"/MediaBox [0 0 {_number(self.page_size[0])} {_number(self.page_size[1])}] "
+            f"/Resources << /Font << /F1 {_FONT_IDS[False]} 0 R /F2 {_FONT_IDS[True]} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode())
+        return data
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+
+    def trailer(self) -> bytes:
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        data = self._object(_PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode())
+        data += self._object(_CATALOG_ID, f"<< /Type /Catalog /Pages {_PAGES_ID} 0 R >>".encode())
+        info_id = self._allocate()
+        data += self._object(info_id, b"<< /Title (" + _escape(self.title) + b") /Producer (VMS) >>")
+
+        xref_offset = self._offset
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, self._next_id):
+            lines.append(f"{self._offsets[object_id]:010d} 00000 n \n")
+        lines.append(
+            f"trailer\n<< /Size {self._next_id} /Root {_CATALOG_ID} 0 R /Info {info_id} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n"
+        )
+        return data + "".join(lines).encode()
@@ -0,0 +1,415 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from config import get_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker process, the thread lock suffices
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger("profiler")
+
+settings = get_settings()
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+PROFILE_SUFFIX = ".speedscope.json"
+META_SUFFIX = ".meta.json"
+SESSION_FILE = "session.json"
+
+# How long a worker trusts its copy of the shared session before re-reading it
+SESSION_REFRESH_SECONDS = 1.0
+
+
+class StackSampler:
+    """Samples the call stack of a single thread from a background thread.
+
+    Only the sampling thread does any work; the profiled thread is never
+    interrupted, so overhead is limited to the GIL hand-offs of the sampler.
+    With a `root_frame`, only samples taken while that frame is on the stack
+    are kept: on an event loop thread, the ticks when the profiled request's
+    task is running rather than another request's.
+    """
+
+    def __init__(self, thread_id: int, interval: float, root_frame=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_frame = root_frame
+        self.frames: List[dict] = []
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self._frame_index: Dict[tuple, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vms-profiler", daemon=True)
+        self.started_at = 0.0
+        self.stopped_at = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stopped_at = time.perf_counter()
+
+    def _frame_id(self, frame) -> int:
+        code = frame.f_code
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = len(self.frames)
+            self._frame_index[key] = index
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                last = now
+                continue
+
+            # Walk leaf -> root, speedscope wants root -> leaf
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            if self.root_frame is not None and not any(frame is self.root_frame for frame in frames):
+                last = now
+                continue
+            stack = [self._frame_id(frame) for frame in reversed(frames)]
+
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def to_speedscope(self, name: str) -> dict:
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.stopped_at - self.started_at,
+                "samples": self.samples,
+                "weights": self.weights
+            }],
+            "name": name,
+            "exporter": "vms-profiler"
+        }
+
+
+class ProfilerController:
+    """Holds the armed profiling session and the stored profiles.
+
+    The session lives in output_dir/session.json, shared by every worker:
+    arming, disarming and counting down max_requests rewrite it under a file
+    lock, so "the next N requests" means N across all workers. `armed` is a
+    local copy that a task on each worker's loop refreshes from the file
+    every SESSION_REFRESH_SECONDS; it is the only attribute read on the
+    request path while no session is active, which keeps the disabled cost
+    to a single attribute check.
+    Profiles are indexed by listing output_dir, where each one has a small
+    metadata file next to it, so every worker sees the profiles of all.
+    """
+
+    def __init__(self, output_dir: str, max_profiles: int):
+        self.armed = False
+        self.output_dir = output_dir
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._session: Optional[dict] = None
+        self._pattern = None
+        self._file_state = None
+        self._refresh_at = 0.0
+        self._active = False
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _session_path(self) -> str:
+        return os.path.join(self.output_dir, SESSION_FILE)
+
+    @contextlib.contextmanager
+    def _session_lock(self):
+        """Exclusive access to session.json across threads and worker processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(self._session_path() + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_session(self) -> Optional[dict]:
+        try:
+            with open(self._session_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_session(self, session: Optional[dict]):
+        if session is None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._session_path())
+        else:
+            os.makedirs(self.output_dir, exist_ok=True)
+            # Replaced whole, so workers reading without the lock never see half a file
+            temporary = f"{self._session_path()}.{os.getpid()}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(session, f)
+            os.replace(temporary, self._session_path())
+        # Under the session lock, so the file still holds `session`
+        self._use(session, self._file_state_now())
+
+    def _file_state_now(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._session_path())
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _use(self, session: Optional[dict], file_state: Optional[tuple]):
+        """Make `session`, read from the file in `file_state`, this worker's copy"""
+        if session is not None and self._session is not None and session["id"] == self._session["id"]:
+            pattern = self._pattern
+        else:
+            pattern = re.compile(session["route_pattern"]) if session else None
+        self._session = session
+        self._pattern = pattern
+        self.armed = self._is_live(session)
+        self._file_state = file_state
+        self._refresh_at = time.monotonic() + SESSION_REFRESH_SECONDS
+
+    @staticmethod
+    def _is_live(session: Optional[dict]) -> bool:
+        return (
+            session is not None
+            and session["remaining"] != 0
+            and datetime.fromisoformat(session["expires_at"]) > datetime.utcnow()
+        )
+
+    def refresh(self):
+        """Re-read the shared session if another worker may have changed it"""
+        if time.monotonic() < self._refresh_at:
+            return
+        # Taken before reading: a write in between makes the next refresh read again
+        file_state = self._file_state_now()
+        with self._lock:
+            if file_state == self._file_state:
+                # Unchanged, but a session can still expire
+                self.armed = self._is_live(self._session)
+                self._refresh_at = time.monotonic() + SESSION_REFRESH_SECONDS
+                return
+        session = self._read_session() if file_state else None
+        with self._lock:
+            self._use(session, file_state)
+
+    async def watch(self):
+        """Keep `armed` in step with the shared session on this worker"""
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def unwatch(self):
+        if self._watcher:
+            self._watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._watcher
+            self._watcher = None
+
+    async def _watch(self):
+        while True:
+            try:
+                # A stat per interval; the file is only read after it changed
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing the profiler session: {str(e)}")
+            await asyncio.sleep(SESSION_REFRESH_SECONDS)
+
+    def arm(self, route_pattern: str, max_requests: Optional[int] = None,
+            sample_rate: Optional[float] = None, interval_ms: int = 5, duration_seconds: int = 3600):
+        re.compile(route_pattern)
+        session = {
+            "id": str(uuid.uuid4()),
+            "route_pattern": route_pattern,
+            "remaining": max_requests,
+            "sample_rate": sample_rate,
+            "interval_ms": interval_ms,
+            "expires_at": (datetime.utcnow() + timedelta(seconds=duration_seconds)).isoformat()
+        }
+        with self._session_lock():
+            self._write_session(session)
+        logger.info(f"Profiler armed for {route_pattern} (requests={max_requests}, rate={sample_rate})")
+
+    def disarm(self):
+        with self._session_lock():
+            self._write_session(None)
+        logger.info("Profiler disarmed")
+
+    def status(self) -> dict:
+        """The shared session; blocking, call it off the event loop"""
+        session = self._read_session()
+        return {
+            "armed": self._is_live(session),
+            "route_pattern": session["route_pattern"] if session else None,
+            "remaining_requests": session["remaining"] if session else None,
+            "sample_rate": session["sample_rate"] if session else None,
+            "interval_ms": session["interval_ms"] if session else None,
+            "expires_at": session["expires_at"] if session else None,
+            "stored_profiles": len(self._metadata_files())
+        }
+
+    def claim(self, path: str) -> bool:
+        """Decide whether the request for `path` should be profiled"""
+        self.refresh()
+        with self._lock:
+            if not self.armed or self._active or not self._pattern.search(path):
+                return False
+            session = self._session
+            if session["remaining"] is None:
+                if random.random() >= session["sample_rate"]:
+                    return False
+                # Samples are only kept while this request's task runs, but one
+                # request per worker at a time keeps the sampler threads few
+                self._active = True
+                return True
+
+        # Counted sessions: take one of the remaining requests from the shared file
+        with self._session_lock():
+            if self._active:
+                return False
+            shared = self._read_session()
+            if not self._is_live(shared) or shared["id"] != session["id"]:
+                self._use(shared, self._file_state_now())
+                return False
+            shared["remaining"] -= 1
+            self._write_session(shared)
+            self._active = True
+            return True
+
+    def start(self, root_frame=None) -> StackSampler:
+        interval = self._session["interval_ms"] / 1000.0 if self._session else 0.005
+        sampler = StackSampler(threading.get_ident(), interval, root_frame)
+        sampler.start()
+        return sampler
+
+    async def finish(self, sampler: StackSampler, method: str, path: str, status_code: Optional[int]):
+        sampler.stop()
+        try:
+            # Serializing and writing the profile stays off the event loop
+            await asyncio.to_thread(self._store, sampler, method, path, status_code)
+        finally:
+            with self._lock:
+                self._active = False
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.output_dir, profile_id + suffix)
+
+    def _metadata_files(self) -> List[os.DirEntry]:
+        try:
+            return [entry for entry in os.scandir(self.output_dir) if entry.name.endswith(META_SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def _store(self, sampler: StackSampler, method: str, path: str, status_code: Optional[int]):
+        profile_id = str(uuid.uuid4())
+        name = f"{method} {path}"
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self._path(profile_id, PROFILE_SUFFIX), "w") as f:
+            json.dump(sampler.to_speedscope(name), f)
+        # Written last: a profile is listed only once its file is complete
+        with open(self._path(profile_id, META_SUFFIX), "w") as f:
+            json.dump({
+                "id": profile_id,
+                "method": method,
+                "path": path,
+                "status_code": status_code,
+                "duration_seconds": sampler.stopped_at - sampler.started_at,
+                "samples": len(sampler.samples),
+                "created_at": datetime.utcnow().isoformat()
+            }, f)
+
+        # Oldest first; other workers may be pruning too
+        stored = sorted(self._metadata_files(), key=lambda entry: entry.stat().st_mtime)
+        for entry in stored[:max(len(stored) - self.max_profiles, 0)]:
+            stale_id = entry.name[:-len(META_SUFFIX)]
+            for suffix in (META_SUFFIX, PROFILE_SUFFIX):
+                try:
+                    os.remove(self._path(stale_id, suffix))
+                except OSError:
+                    pass
+
+        logger.info(f"Stored profile {profile_id} for {name} ({len(sampler.samples)} samples)")
+
+    def list_profiles(self) -> List[dict]:
+        """Stored profiles of every worker, newest first; blocking, call it off the event loop"""
+        profiles = []
+        for entry in self._metadata_files():
+            try:
+                with open(entry.path) as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                # Pruned or still being written by another worker
+                continue
+            profile["created_at"] = datetime.fromisoformat(profile["created_at"])
+            profiles.append(profile)
+        profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+        return profiles
+
+    def get_profile_path(self, profile_id: str) -> Optional[str]:
+        try:
+            # Only ids we generated, so the path cannot leave output_dir
+            profile_id = str(uuid.UUID(profile_id))
+        except ValueError:
+            return None
+        file_path = self._path(profile_id, PROFILE_SUFFIX)
+        return file_path if os.path.exists(self._path(profile_id, META_SUFFIX)) else None
+
+
+controller = ProfilerController(settings.PROFILER_OUTPUT_DIR, settings.PROFILER_MAX_PROFILES)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware that samples requests claimed by the controller"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not controller.armed or scope["type"] != "http" or not controller.claim(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # This call's frame is on the loop thread's stack only while the request's task runs
+        sampler = controller.start(sys._getframe())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await controller.finish(sampler, scope["method"], scope["path"], status_code)
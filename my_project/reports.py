@@ -0,0 +1,519 @@
+"""Background report jobs.
+
+`POST /reports` stores a `report_jobs` row and returns at once. Each app
+process runs a scheduler that claims queued jobs (a conditional UPDATE
+from queued to running, so one process takes a job) while fewer than
+REPORT_MAX_RUNNING jobs run across all processes, and hands them to a
+process pool: the stats queries and PDF rendering run outside the event
+loop and outside the GIL of the serving process. The worker records its
+progress in the row and writes the artifact to REPORT_OUTPUT_DIR under a
+temporary name, renamed into place when complete.
+
+A request for the same spec as a queued, running or recently finished job
+returns that job instead of starting another. Artifacts are deleted after
+REPORT_RETENTION_HOURS, and a running job whose worker stopped reporting
+progress for REPORT_STALE_SECONDS is failed.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from typing import Callable, List, NamedTuple, Optional
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from config import get_settings
+from db_connection import SessionLocal
+from db_models import User, Visitor, ReportJob, VisitStatus
+from error_handlers import BadRequestError
+from exports import spreadsheet_safe
+from sql_functions import minutes_between, date_of
+import pdf
+import visitor_archive
+
+try:
+    import openpyxl
+except ImportError:  # Optional: xlsx reports are refused without it
+    openpyxl = None
+
+# Configure logging
+logger = logging.getLogger("reports")
+
+settings = get_settings()
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+EXPIRED = "expired"
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+_TITLES = {
+    "visitor_summary": "Visitor summary",
+    "host_activity": "Host activity",
+}
+
+# How often the scheduler fails stale jobs and deletes expired artifacts
+_MAINTENANCE_SECONDS = 60
+
+
+class Section(NamedTuple):
+    title: str
+    columns: List[str]
+    rows: List[list]
+
+
+def normalize_spec(report_type: str, report_format: str, start_date: Optional[datetime],
+                   end_date: Optional[datetime], department: Optional[str]) -> dict:
+    """Validated spec with explicit dates, so equal requests hash equally"""
+    if report_format == "xlsx" and openpyxl is None:
+        raise BadRequestError("xlsx reports need the openpyxl package; use pdf or csv")
+
+    if start_date is None and end_date is None:
+        # Previous calendar month
+        first_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end_date = first_of_month
+        start_date = (first_of_month - timedelta(days=1)).replace(day=1)
+    elif start_date is None or end_date is None:
+        raise BadRequestError("Give both start_date and end_date, or neither for the previous month")
+
+    # Fix timezone issue
+    start_date = start_date.replace(tzinfo=None)
+    end_date = end_date.replace(tzinfo=None)
+    if end_date <= start_date:
+        raise BadRequestError("end_date must be after start_date")
+    if end_date - start_date > timedelta(days=settings.REPORT_MAX_DAYS):
+        raise BadRequestError(f"A report may cover at most {settings.REPORT_MAX_DAYS} days")
+
+    return {
+        "report_type": report_type,
+        "format": report_format,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "department": department,
+    }
+
+
+def spec_hash(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def _in_scope(query, spec: dict, joined_hosts: bool = False):
+    query = query.filter(
+        Visitor.created_at >= datetime.fromisoformat(spec["start_date"]),
+        Visitor.created_at < datetime.fromisoformat(spec["end_date"])
+    )
+    if spec["department"]:
+        if not joined_hosts:
+            query = query.join(User, User.id == Visitor.host_id)
+        query = query.filter(User.department == spec["department"])
+    return query
+
+
+def _minutes(value) -> str:
+    return f"{float(value):.1f}" if value is not None else "-"
+
+
+def collect(db: Session, spec: dict, progress: Callable[[int], None]) -> List[Section]:
+    """Run the report's queries; progress() is called with a percentage between them"""
+    visit_minutes = minutes_between(Visitor.check_in_time, Visitor.check_out_time)
+    # Archived visits in the period come from daily rollups and are added to each total
+    archived = visitor_archive.archived_totals(
+        db,
+        datetime.fromisoformat(spec["start_date"]),
+        datetime.fromisoformat(spec["end_date"]),
+        end_inclusive=False,
+        department=spec["department"]
+    )
+
+    if spec["report_type"] == "visitor_summary":
+        status_counts = dict(
+            _in_scope(db.query(Visitor.status, func.count(Visitor.id)), spec).group_by(Visitor.status).all()
+        )
+        total_minutes, completed = _in_scope(db.query(func.sum(visit_minutes), func.count(visit_minutes)), spec).one()
+        total_minutes = (total_minutes or 0) + sum(row.visit_minutes for row in archived)
+        completed += sum(row.completed for row in archived)
+        for row in archived:
+            status_counts[row.status] = status_counts.get(row.status, 0) + row.visitors
+        overview = [["Total visitors", sum(status_counts.values())]]
+        overview += [[status.value.replace("_", " ").capitalize(), status_counts.get(status, 0)] for status in VisitStatus]
+        overview.append(["Average visit (minutes)", _minutes(total_minutes / completed if completed else None)])
+        progress(20)
+
+        purposes = dict(
+            _in_scope(db.query(Visitor.purpose, func.count(Visitor.id)), spec)
+            .group_by(Visitor.purpose)
+            .all()
+        )
+        for row in archived:
+            purposes[row.purpose] = purposes.get(row.purpose, 0) + row.visitors
+        progress(35)
+
+        days = {
+            day: [count, checked_in]
+            for day, count, checked_in in _in_scope(db.query(
+                date_of(Visitor.created_at).label("date"),
+                func.count(Visitor.id),
+                func.count(Visitor.check_in_time)
+            ), spec)
+            .group_by(date_of(Visitor.created_at))
+        }
+        for row in archived:
+            totals = days.setdefault(row.day, [0, 0])
+            totals[0] += row.visitors
+            totals[1] += row.checked_in
+        progress(50)
+
+        return [
+            Section("Overview", ["Metric", "Value"], overview),
+            Section("Visitors by purpose", ["Purpose", "Visitors"], [
+                [purpose.value, count]
+                for purpose, count in sorted(purposes.items(), key=lambda item: (-item[1], item[0].value))
+            ]),
+            Section("Visitors by day", ["Date", "Visitors", "Checked in"], [
+                [day.isoformat(), count, checked_in] for day, (count, checked_in) in sorted(days.items())
+            ]),
+        ]
+
+    # host id -> [name, department, visitors, checked in, rejected, total minutes, completed visits]
+    hosts = {
+        host_id: list(totals)
+        for host_id, *totals in _in_scope(db.query(
+            User.id,
+            User.full_name,
+            User.department,
+            func.count(Visitor.id),
+            func.count(Visitor.check_in_time),
+            func.sum(case((Visitor.status == VisitStatus.REJECTED, 1), else_=0)),
+            func.sum(visit_minutes),
+            func.count(visit_minutes)
+        ).join(User, User.id == Visitor.host_id), spec, joined_hosts=True)
+        .group_by(User.id, User.full_name, User.department)
+    }
+    for row in archived:
+        totals = hosts.setdefault(row.host_id, [row.host_name, row.department, 0, 0, 0, 0, 0])
+        totals[2] += row.visitors
+        totals[3] += row.checked_in
+        totals[4] = (totals[4] or 0) + (row.visitors if row.status == VisitStatus.REJECTED else 0)
+        totals[5] = (totals[5] or 0) + row.visit_minutes
+        totals[6] += row.completed
+    sections = [Section(
+        "Visitors by host",
+        ["Host", "Department", "Visitors", "Checked in", "Rejected", "Average visit (minutes)"],
+        [[name, department, count, checked_in, rejected or 0, _minutes(minutes / completed if completed else None)]
+         for name, department, count, checked_in, rejected, minutes, completed
+         in sorted(hosts.values(), key=lambda totals: (-totals[2], totals[0]))]
+    )]
+    progress(35)
+
+    if not spec["department"]:
+        departments = dict(
+            _in_scope(db.query(User.department, func.count(Visitor.id)).join(User, User.id == Visitor.host_id), spec)
+            .group_by(User.department)
+            .all()
+        )
+        for row in archived:
+            departments[row.department] = departments.get(row.department, 0) + row.visitors
+        sections.append(Section("Visitors by department", ["Department", "Visitors"], [
+            [department, count]
+            for department, count in sorted(departments.items(), key=lambda item: (-item[1], item[0] or ""))
+        ]))
+    progress(50)
+    return sections
+
+
+def _title(spec: dict) -> str:
+    title = _TITLES[spec["report_type"]]
+    return f"{title} - {spec['department']}" if spec["department"] else title
+
+
+def _period(spec: dict) -> str:
+    return f"{spec['start_date'][:10]} to {spec['end_date'][:10]} (end exclusive)"
+
+
+def _safe_row(row: list) -> list:
+    # Host names and departments are user-entered text
+    return [spreadsheet_safe(value) for value in row]
+
+
+def _write_csv(spec: dict, sections: List[Section], path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([_title(spec), _period(spec)])
+        for section in sections:
+            writer.writerow([])
+            writer.writerow([section.title])
+            writer.writerow(section.columns)
+            writer.writerows(_safe_row(row) for row in section.rows)
+
+
+def _write_xlsx(spec: dict, sections: List[Section], path: str):
+    workbook = openpyxl.Workbook(write_only=True)
+    for section in sections:
+        # Sheet names are limited to 31 characters
+        sheet = workbook.create_sheet(section.title[:31])
+        sheet.append([_title(spec), _period(spec)])
+        sheet.append([])
+        sheet.append(section.columns)
+        for row in section.rows:
+            sheet.append(_safe_row(row))
+    workbook.save(path)
+
+
+def _write_pdf(spec: dict, sections: List[Section], path: str):
+    margin = 40
+    line_height = 14
+    writer = pdf.PDFWriter(title=_title(spec))
+    width, height = writer.page_size
+    canvas = None
+    y = 0.0
+
+    with open(path, "wb") as f:
+        f.write(writer.header())
+
+        def new_page():
+            nonlocal canvas, y
+            if canvas is not None:
+                f.write(writer.page(canvas))
+            canvas = writer.canvas()
+            canvas.text(margin, height - margin, _title(spec), size=16, bold=True)
+            canvas.text(margin, height - margin - 18, _period(spec), size=9)
+            canvas.text(width - margin - 40, margin / 2, f"Page {writer.page_count + 1}", size=8)
+            y = height - margin - 48
+
+        new_page()
+        for section in sections:
+            column_width = (width - 2 * margin) / len(section.columns)
+            # Keep a heading together with its column header and a first row
+            if y < margin + 4 * line_height:
+                new_page()
+            canvas.text(margin, y, section.title, size=12, bold=True)
+            y -= line_height + 4
+            for number, row in enumerate([section.columns] + section.rows):
+                if y < margin:
+                    new_page()
+                for index, value in enumerate(row):
+                    text = pdf.fit("" if value is None else str(value), column_width - 6, 9)
+                    canvas.text(margin + index * column_width, y, text, size=9, bold=number == 0)
+                if number == 0:
+                    canvas.line(margin, y - 3, width - margin, y - 3)
+                y -= line_height
+            y -= line_height
+        f.write(writer.page(canvas))
+        f.write(writer.trailer())
+
+
+_WRITERS = {
+    "csv": _write_csv,
+    "xlsx": _write_xlsx,
+    "pdf": _write_pdf,
+}
+
+
+def run_job(job_id: str):
+    """Render one claimed job; runs in a report worker process"""
+    db = SessionLocal()
+
+    def update(values: dict):
+        # Only while running: a job failed as stale is not brought back
+        db.query(ReportJob).filter(ReportJob.id == job_id, ReportJob.status == RUNNING).update(
+            values, synchronize_session=False
+        )
+        db.commit()
+
+    def progress(percent: int):
+        update({ReportJob.progress: percent, ReportJob.heartbeat_at: datetime.utcnow()})
+
+    try:
+        job = db.query(ReportJob).filter(ReportJob.id == job_id).first()
+        if job is None or job.status != RUNNING:
+            return
+        spec = json.loads(job.spec)
+        sections = collect(db, spec, progress)
+
+        directory = os.path.abspath(settings.REPORT_OUTPUT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{job_id}.{spec['format']}")
+        _WRITERS[spec["format"]](spec, sections, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+        now = datetime.utcnow()
+        update({
+            ReportJob.status: SUCCEEDED,
+            ReportJob.progress: 100,
+            ReportJob.artifact_path: path,
+            ReportJob.artifact_size: os.path.getsize(path),
+            ReportJob.finished_at: now,
+            ReportJob.expires_at: now + timedelta(hours=settings.REPORT_RETENTION_HOURS)
+        })
+    except Exception as e:
+        logger.error(f"Report {job_id} failed: {str(e)}")
+        db.rollback()
+        update({ReportJob.status: FAILED, ReportJob.error: str(e), ReportJob.finished_at: datetime.utcnow()})
+    finally:
+        db.close()
+
+
+def _fail_job(job_id: str, error: str):
+    db = SessionLocal()
+    try:
+        db.query(ReportJob).filter(ReportJob.id == job_id, ReportJob.status == RUNNING).update(
+            {ReportJob.status: FAILED, ReportJob.error: error, ReportJob.finished_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+class ReportScheduler:
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running: set = set()
+        self._maintained_at = 0.0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: a forked child would share the parent's database connections
+        return ProcessPoolExecutor(
+            max_workers=settings.REPORT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def start(self):
+        self._pool = self._new_pool()
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pool is not None:
+            # Jobs already in a worker finish and record their own result
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def wake(self):
+        """Look for queued jobs now instead of at the next poll; safe from any thread"""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while True:
+            if time.monotonic() - self._maintained_at >= _MAINTENANCE_SECONDS:
+                try:
+                    await asyncio.to_thread(self._maintain)
+                except Exception as e:
+                    logger.error(f"Report maintenance failed: {str(e)}")
+                self._maintained_at = time.monotonic()
+
+            try:
+                job_ids = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                logger.error(f"Report claim failed: {str(e)}")
+                job_ids = []
+
+            for job_id in job_ids:
+                self._running.add(job_id)
+                future = self._loop.run_in_executor(self._pool, run_job, job_id)
+                future.add_done_callback(lambda done, job_id=job_id: self._finished(job_id, done))
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.REPORT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _finished(self, job_id: str, future: asyncio.Future):
+        self._running.discard(job_id)
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            # run_job records its own failures; this is the worker process dying
+            logger.error(f"Report worker for {job_id} failed: {str(error)}")
+            asyncio.create_task(asyncio.to_thread(_fail_job, job_id, f"Report worker failed: {str(error)}"))
+            if isinstance(error, BrokenProcessPool) and self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+        self.wake()
+
+    def _claim(self) -> List[str]:
+        """Move queued jobs to running, up to local and global capacity"""
+        capacity = settings.REPORT_WORKERS - len(self._running)
+        if capacity <= 0:
+            return []
+        db = SessionLocal()
+        try:
+            # Processes can race past the global limit by a job each; it is a soft cap
+            running = db.query(func.count(ReportJob.id)).filter(ReportJob.status == RUNNING).scalar()
+            capacity = min(capacity, settings.REPORT_MAX_RUNNING - running)
+            if capacity <= 0:
+                return []
+
+            queued = (
+                db.query(ReportJob.id)
+                .filter(ReportJob.status == QUEUED)
+                .order_by(ReportJob.created_at)
+                .limit(capacity)
+                .all()
+            )
+            now = datetime.utcnow()
+            claimed = []
+            for (job_id,) in queued:
+                if db.query(ReportJob).filter(ReportJob.id == job_id, ReportJob.status == QUEUED).update(
+                    {ReportJob.status: RUNNING, ReportJob.started_at: now, ReportJob.heartbeat_at: now},
+                    synchronize_session=False
+                ):
+                    claimed.append(job_id)
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _maintain(self):
+        """Fail jobs whose worker went quiet and delete expired artifacts"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.query(ReportJob).filter(
+                ReportJob.status == RUNNING,
+                ReportJob.heartbeat_at < now - timedelta(seconds=settings.REPORT_STALE_SECONDS)
+            ).update({
+                ReportJob.status: FAILED,
+                ReportJob.error: "Report worker stopped responding",
+                ReportJob.finished_at: now
+            }, synchronize_session=False)
+
+            expired = db.query(ReportJob).filter(ReportJob.status == SUCCEEDED, ReportJob.expires_at < now).all()
+            for job in expired:
+                try:
+                    os.remove(job.artifact_path)
+                except FileNotFoundError:
+                    pass
+                job.status = EXPIRED
+                job.artifact_path = None
+            db.commit()
+        finally:
+            db.close()
+
+
+scheduler = ReportScheduler()
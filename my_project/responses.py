@@ -0,0 +1,53 @@
+"""JSON responses rendered with orjson when it is installed.
+
+FastJSONResponse is the app's default response class. trusted_json() is the
+fast path for endpoints that build their payload themselves from database
+rows: returning a Response directly skips FastAPI's re-validation against
+the route's response_model and the jsonable_encoder pass. The response_model
+stays on the route for the OpenAPI schema, so payloads returned this way
+must keep exactly the documented shape.
+"""
+from fastapi.responses import JSONResponse
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+import enum
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib encoder
+    orjson = None
+
+
+def _default(value: Any):
+    # Types orjson (or json) cannot encode natively, encoded the way
+    # FastAPI's jsonable_encoder would
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def trusted_json(content: Any, status_code: int = 200) -> FastJSONResponse:
+    """Serialize a payload built by the endpoint itself, without re-validation"""
+    return FastJSONResponse(content=content, status_code=status_code)
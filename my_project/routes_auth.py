@@ -4,17 +4,16 @@ from sqlalchemy.orm import Session
 from datetime import timedelta
 
 from db_connection import get_db
-from db_models import User, SystemLog
+from db_models import User
 from schemas import Token, UserOut
 from auth import (
     authenticate_user, 
     create_access_token, 
     get_current_active_user,
-    get_password_hash,
-    get_client_ip
+    get_password_hash
 )
 from config import get_settings
-from error_handlers import DuplicateError, NotFoundError, BadRequestError
+from unit_of_work import UnitOfWork
 
 settings = get_settings()
 router = APIRouter(prefix=f"{settings.API_PREFIX}/auth", tags=["Authentication"])
@@ -46,17 +45,9 @@ async def login_for_access_token(
     )
     
     # Log the login
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="login",
-        entity_type="user",
-        entity_id=user.id,
-        user_id=user.id,
-        ip_address=client_ip,
-        details="User logged in"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, user)
+    uow.audit("login", "user", user, "User logged in")
+    uow.commit()
     
     # Convert ORM model to Pydantic model
     user_out = UserOut(
@@ -84,17 +75,9 @@ async def logout(
     request: Request = None
 ):
     # Log the logout (token can't actually be invalidated with JWT, but we can log it)
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="logout",
-        entity_type="user",
-        entity_id=current_user.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details="User logged out"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("logout", "user", current_user, "User logged out")
+    uow.commit()
     
     return {"detail": "Logout successful"}
 
@@ -1,33 +1,104 @@
 from fastapi import APIRouter, Depends, Request, status, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 from typing import Optional
-import qrcode
 from io import BytesIO
 
-from db_connection import get_db
-from db_models import User, Visitor, Badge, SystemLog, VisitStatus
-from auth import get_current_active_user, get_client_ip
+from db_connection import get_db, get_read_db
+from db_models import User, Visitor, Badge, VisitStatus
+from auth import get_current_active_user
 from config import get_settings
 from error_handlers import NotFoundError, BadRequestError
+from schemas import BadgeSheetRequest
+from unit_of_work import UnitOfWork
+from responses import trusted_json
+from idempotency import IdempotentRoute
+import badge_sheets
+import events
+import visitor_state
 
 settings = get_settings()
-router = APIRouter(prefix=f"{settings.API_PREFIX}/badges", tags=["Badges"])
+router = APIRouter(prefix=f"{settings.API_PREFIX}/badges", tags=["Badges"], route_class=IdempotentRoute)
+
+@router.post("/sheet", response_class=Response, responses={200: {"content": {"application/pdf": {}}}})
+async def print_badge_sheet(
+    sheet: BadgeSheetRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Printable PDF of many badges, by visitor ids or by filter, streamed page by page"""
+    query = db.query(
+        Visitor.id.label("visitor_id"),
+        Visitor.full_name.label("visitor_name"),
+        Visitor.company,
+        User.full_name.label("host_name"),
+        Badge.qr_code,
+        Badge.expiry_time
+    ).join(
+        Badge, Badge.visitor_id == Visitor.id
+    ).outerjoin(
+        User, User.id == Visitor.host_id
+    )
+
+    # Regular users can only print badges for their own visitors
+    if not current_user.is_admin:
+        query = query.filter(Visitor.host_id == current_user.id)
+    elif sheet.host_id and not sheet.visitor_ids:
+        query = query.filter(Visitor.host_id == sheet.host_id)
+
+    if sheet.visitor_ids:
+        if len(sheet.visitor_ids) > settings.BADGE_SHEET_MAX_BADGES:
+            raise BadRequestError(f"At most {settings.BADGE_SHEET_MAX_BADGES} badges can be printed at once")
+        query = query.filter(Visitor.id.in_(sheet.visitor_ids))
+    else:
+        if sheet.status:
+            query = query.filter(Visitor.status == sheet.status)
+        else:
+            query = query.filter(Visitor.status.in_([VisitStatus.APPROVED, VisitStatus.CHECKED_IN]))
+        if sheet.scheduled_from:
+            # Fix timezone issue
+            query = query.filter(Visitor.scheduled_time >= sheet.scheduled_from.replace(tzinfo=None))
+        if sheet.scheduled_to:
+            query = query.filter(Visitor.scheduled_time <= sheet.scheduled_to.replace(tzinfo=None))
+        query = query.order_by(Visitor.scheduled_time, Visitor.full_name)
+
+    rows = query.limit(settings.BADGE_SHEET_MAX_BADGES + 1).all()
+    if len(rows) > settings.BADGE_SHEET_MAX_BADGES:
+        raise BadRequestError(f"More than {settings.BADGE_SHEET_MAX_BADGES} badges match; narrow the filters")
+    if not rows:
+        raise NotFoundError("Badge", "for the requested visitors")
+
+    badges = [row._asdict() for row in rows]
+    if sheet.visitor_ids:
+        order = {visitor_id: index for index, visitor_id in enumerate(sheet.visitor_ids)}
+        badges.sort(key=lambda badge: order.get(badge["visitor_id"], len(order)))
+
+    return StreamingResponse(
+        badge_sheets.render(badges),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="badges-{datetime.utcnow():%Y%m%d-%H%M%S}.pdf"'}
+    )
 
 @router.get("/{qr_code}/verify")
 async def verify_badge(
     qr_code: str,
     db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
     request: Request = None
 ):
-    # Find the badge by QR code
-    badge = db.query(Badge).filter(Badge.qr_code == qr_code).first()
+    # Find the badge by QR code, falling back to the primary for badges
+    # that have not replicated yet
+    badge = read_db.query(Badge).filter(Badge.qr_code == qr_code).first()
+    if not badge:
+        read_db = db
+        badge = db.query(Badge).filter(Badge.qr_code == qr_code).first()
     if not badge:
         raise NotFoundError("Badge", f"with QR code {qr_code}")
     
     # Get the visitor
-    visitor = db.query(Visitor).filter(Visitor.id == badge.visitor_id).first()
+    visitor = read_db.query(Visitor).filter(Visitor.id == badge.visitor_id).first()
     if not visitor:
         raise NotFoundError("Visitor", badge.visitor_id)
     
@@ -35,38 +106,35 @@ async def verify_badge(
     is_expired = badge.expiry_time < datetime.utcnow()
     
     # Log the verification
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="verify_badge",
-        entity_type="badge",
-        entity_id=badge.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Verified badge for visitor: {visitor.full_name}, Valid: {not is_expired}"
-    )
-    db.add(log_entry)
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("verify_badge", "badge", badge.id, f"Verified badge for visitor: {visitor.full_name}, Valid: {not is_expired}")
     
     # If expired, update visitor status
     if is_expired and visitor.status != VisitStatus.CHECKED_OUT:
-        visitor.status = VisitStatus.EXPIRED
-        db.commit()
+        if visitor.status != VisitStatus.EXPIRED:
+            # The visitor may come from a replica, so write through the primary;
+            # concurrent scans expire the visitor (and publish the event) once
+            expired = visitor_state.transition(db, visitor.id, visitor_state.EXPIRE, required=False)
+            if expired is not None:
+                uow.publish(events.VISITOR_EXPIRED, expired)
+        uow.commit()
         
-        return {
+        return trusted_json({
             "valid": False,
             "message": "Badge has expired",
             "badge_id": badge.id,
             "visitor_id": visitor.id,
             "visitor_name": visitor.full_name,
             "expiry_time": badge.expiry_time
-        }
+        })
     
     # Get host information
     host = None
     if visitor.host_id:
-        host = db.query(User).filter(User.id == visitor.host_id).first()
+        host = read_db.query(User).filter(User.id == visitor.host_id).first()
     
     # Commit the log
-    db.commit()
+    uow.commit()
     
     result = {
         "valid": not is_expired and visitor.status not in [VisitStatus.REJECTED, VisitStatus.EXPIRED, VisitStatus.CHECKED_OUT],
@@ -87,7 +155,7 @@ async def verify_badge(
         "check_out_time": visitor.check_out_time
     }
     
-    return result
+    return trusted_json(result)
 
 @router.get("/{qr_code}/image", response_class=Response)
 async def get_badge_qr_code(
@@ -105,7 +173,8 @@ async def get_badge_qr_code(
     if not visitor:
         raise NotFoundError("Visitor", badge.visitor_id)
     
-    # Generate QR code image
+    # Generate QR code image (qrcode pulls in PIL, so it is imported on first use)
+    import qrcode
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -192,6 +261,7 @@ async def extend_badge_expiry(
     
     # Extend the expiry time
     from datetime import timedelta
+    uow = UnitOfWork(db, request, current_user)
     
     # If expired, start from current time
     if badge.expiry_time < datetime.utcnow():
@@ -199,23 +269,16 @@ async def extend_badge_expiry(
         
         # If the visitor status was EXPIRED, update it back to APPROVED or CHECKED_IN
         if visitor.status == VisitStatus.EXPIRED:
-            visitor.status = VisitStatus.APPROVED if not visitor.check_in_time else VisitStatus.CHECKED_IN
+            reinstated = visitor_state.transition(db, visitor.id, visitor_state.REINSTATE, required=False)
+            if reinstated is not None:
+                uow.publish(events.VISITOR_UPDATED, reinstated)
     else:
         # Otherwise, add to existing expiry time
         badge.expiry_time = badge.expiry_time + timedelta(minutes=extend_minutes)
     
     # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="extend_badge",
-        entity_type="badge",
-        entity_id=badge.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Extended badge expiry for visitor: {visitor.full_name} by {extend_minutes} minutes"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow.audit("extend_badge", "badge", badge.id, f"Extended badge expiry for visitor: {visitor.full_name} by {extend_minutes} minutes")
+    uow.commit()
     
     return {
         "detail": f"Badge expiry extended by {extend_minutes} minutes",
@@ -246,23 +309,17 @@ async def invalidate_badge(
         raise BadRequestError("Not authorized to invalidate this badge")
     
     # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="invalidate_badge",
-        entity_type="badge",
-        entity_id=badge.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Invalidated badge for visitor: {visitor.full_name}"
-    )
-    db.add(log_entry)
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("invalidate_badge", "badge", badge.id, f"Invalidated badge for visitor: {visitor.full_name}")
     
     # Set visitor status to EXPIRED if currently APPROVED
-    if visitor.status == VisitStatus.APPROVED:
-        visitor.status = VisitStatus.EXPIRED
+    expired = visitor_state.transition(db, visitor.id, visitor_state.INVALIDATE, required=False)
+    if expired is not None:
+        uow.publish(events.VISITOR_EXPIRED, expired)
+    uow.publish(events.BADGE_INVALIDATED, expired if expired is not None else visitor)
     
     # Delete the badge
-    db.delete(badge)
-    db.commit()
+    uow.delete(badge)
+    uow.commit()
     
     return None
\ No newline at end of file
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from typing import Optional
+import asyncio
+import json
+
+from db_connection import SessionLocal
+from auth import get_user_from_token
+from config import get_settings
+from events import broker
+
+settings = get_settings()
+router = APIRouter(prefix=f"{settings.API_PREFIX}/events", tags=["Events"])
+
+# EventSource cannot send headers, so the token may also come as a query parameter
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/auth/token", auto_error=False)
+
+def _format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@router.get("/visitors")
+async def stream_visitor_events(
+    request: Request,
+    token: Optional[str] = None,
+    header_token: Optional[str] = Depends(optional_oauth2_scheme)
+):
+    """Server-Sent Events stream of visitor state changes.
+
+    Hosts receive events for their own visitors; admins and Security receive
+    all events. Streams hold no database session while idle.
+    """
+    access_token = header_token or token
+    if not access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Authenticate with a short-lived session rather than a request-scoped one,
+    # which would otherwise stay checked out for the lifetime of the stream
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(db, access_token)
+        user_id = user.id
+        sees_all = user.is_admin or user.department == "Security"
+        disabled = user.disabled
+    finally:
+        db.close()
+
+    if disabled:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account is disabled")
+
+    subscription = broker.subscribe(user_id, sees_all)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if subscription.overflowed:
+                    # Client fell behind; ask it to re-fetch and reconnect
+                    yield _format_event({"type": "resync"})
+                    break
+
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        timeout=settings.EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+
+                yield _format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
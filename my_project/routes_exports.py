@@ -0,0 +1,112 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+
+from db_models import User, Visitor, VisitorArchive, SystemLog, VisitStatus, VisitPurpose
+from auth import get_current_active_user, get_admin_user
+from config import get_settings
+from error_handlers import BadRequestError
+from visitor_fields import parse_fields, visitor_query, visitor_row_to_dict, filter_visitors
+import exports
+import visitor_archive
+
+settings = get_settings()
+router = APIRouter(prefix=f"{settings.API_PREFIX}/exports", tags=["Exports"])
+
+LOG_COLUMNS = (
+    "id", "created_at", "action", "entity_type", "entity_id",
+    "user_id", "username", "ip_address", "details"
+)
+
+
+def _export_format(export_format: str) -> str:
+    if export_format not in exports.FORMATS:
+        raise BadRequestError(f"Unknown format: {export_format}. Available: {', '.join(exports.FORMATS)}")
+    return export_format
+
+
+@router.get("/visitors")
+async def export_visitors(
+    export_format: str = Query("csv", alias="format", description="csv or ndjson"),
+    status: Optional[VisitStatus] = None,
+    purpose: Optional[VisitPurpose] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    host_id: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to export, e.g. full_name,status,host_name"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Stream every visitor matching the list filters, oldest first, with host names"""
+    export_format = _export_format(export_format)
+    fields = parse_fields(fields)
+
+    def build_query(db: Session):
+        # created_at is selected for the ordering; row_to_dict only emits `fields`
+        selected = fields + ("created_at",)
+        query = filter_visitors(
+            visitor_query(db, selected), current_user, status, purpose, start_date, end_date, host_id
+        )
+        if visitor_archive.needs_archive(db, start_date):
+            query = query.union_all(filter_visitors(
+                visitor_query(db, selected, VisitorArchive),
+                current_user, status, purpose, start_date, end_date, host_id, VisitorArchive
+            ))
+        return query.order_by(Visitor.created_at, Visitor.id)
+
+    return exports.export_response(
+        build_query,
+        lambda row: visitor_row_to_dict(row, fields),
+        fields,
+        export_format,
+        f"visitors-{datetime.utcnow():%Y%m%d-%H%M%S}"
+    )
+
+
+@router.get("/logs")
+async def export_logs(
+    export_format: str = Query("csv", alias="format", description="csv or ndjson"),
+    action: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: User = Depends(get_admin_user)
+):
+    """Stream system logs in id order, with usernames - admin only"""
+    export_format = _export_format(export_format)
+
+    def build_query(db: Session):
+        query = db.query(
+            SystemLog.id,
+            SystemLog.created_at,
+            SystemLog.action,
+            SystemLog.entity_type,
+            SystemLog.entity_id,
+            SystemLog.user_id,
+            User.username,
+            SystemLog.ip_address,
+            SystemLog.details
+        ).outerjoin(User, User.id == SystemLog.user_id)
+
+        if action:
+            query = query.filter(SystemLog.action == action)
+        if entity_type:
+            query = query.filter(SystemLog.entity_type == entity_type)
+        if user_id:
+            query = query.filter(SystemLog.user_id == user_id)
+        if start_date:
+            # Fix timezone issue
+            query = query.filter(SystemLog.created_at >= start_date.replace(tzinfo=None))
+        if end_date:
+            # Fix timezone issue
+            query = query.filter(SystemLog.created_at <= end_date.replace(tzinfo=None))
+        return query.order_by(SystemLog.id)
+
+    return exports.export_response(
+        build_query,
+        lambda row: dict(zip(LOG_COLUMNS, row)),
+        LOG_COLUMNS,
+        export_format,
+        f"system-logs-{datetime.utcnow():%Y%m%d-%H%M%S}"
+    )
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session, contains_eager
+from datetime import datetime
+from typing import Optional
+import base64
+import binascii
+
+from db_connection import get_read_db
+from db_models import User, SystemLog
+from schemas import SystemLogPage
+from auth import get_admin_user
+from config import get_settings
+from error_handlers import BadRequestError
+
+settings = get_settings()
+router = APIRouter(prefix=f"{settings.API_PREFIX}/logs", tags=["Audit Logs"])
+
+
+def _encode_cursor(log_id: int) -> str:
+    return base64.urlsafe_b64encode(str(log_id).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadRequestError("Invalid cursor")
+
+
+@router.get("/", response_model=SystemLogPage)
+async def list_logs(
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    ip_address: Optional[str] = Query(None, description="Exact address, or a prefix ending in * (e.g. 10.0.3.*)"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Search system logs, newest first, one keyset page at a time - admin only"""
+    if limit > settings.LOG_PAGE_MAX:
+        raise BadRequestError(f"limit must be at most {settings.LOG_PAGE_MAX}")
+    if entity_id and not entity_type:
+        raise BadRequestError("entity_id needs entity_type")
+
+    query = db.query(SystemLog).outerjoin(SystemLog.user).options(contains_eager(SystemLog.user))
+
+    # Each filter has a composite index ending in id, so the page is an index range scan
+    if entity_type:
+        query = query.filter(SystemLog.entity_type == entity_type)
+    if entity_id:
+        query = query.filter(SystemLog.entity_id == entity_id)
+    if user_id:
+        query = query.filter(SystemLog.user_id == user_id)
+    if action:
+        query = query.filter(SystemLog.action == action)
+    if ip_address:
+        if ip_address.endswith("*"):
+            query = query.filter(SystemLog.ip_address.startswith(ip_address[:-1], autoescape=True))
+        else:
+            query = query.filter(SystemLog.ip_address == ip_address)
+    if start_date:
+        # Fix timezone issue
+        query = query.filter(SystemLog.created_at >= start_date.replace(tzinfo=None))
+    if end_date:
+        query = query.filter(SystemLog.created_at <= end_date.replace(tzinfo=None))
+    if cursor:
+        query = query.filter(SystemLog.id < _decode_cursor(cursor))
+
+    # One extra row tells whether there is a next page
+    logs = query.order_by(SystemLog.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(logs[limit - 1].id) if len(logs) > limit else None
+    return {"items": logs[:limit], "next_cursor": next_cursor}
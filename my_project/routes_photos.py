@@ -2,10 +2,11 @@ from fastapi import APIRouter, Depends, Request, status, Response
 from sqlalchemy.orm import Session
 
 from db_connection import get_db
-from db_models import User, Visitor, VisitorPhoto, SystemLog
+from db_models import User, Visitor, VisitorPhoto
 from auth import get_current_active_user
 from config import get_settings
 from error_handlers import NotFoundError, AuthorizationError
+from unit_of_work import UnitOfWork
 
 settings = get_settings()
 router = APIRouter(prefix=f"{settings.API_PREFIX}/photos", tags=["Photos"])
@@ -77,21 +78,10 @@ async def delete_visitor_photo(
     if not current_user.is_admin and visitor.host_id != current_user.id:
         raise AuthorizationError("Not authorized to delete this visitor's photo")
     
-    # Log the action
-    from auth import get_client_ip
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="delete",
-        entity_type="photo",
-        entity_id=photo.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Deleted photo for visitor: {visitor.full_name}"
-    )
-    db.add(log_entry)
-    
-    # Delete the photo
-    db.delete(photo)
-    db.commit()
+    # Log the action and delete the photo
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("delete", "photo", photo.id, f"Deleted photo for visitor: {visitor.full_name}")
+    uow.delete(photo)
+    uow.commit()
     
     return None
\ No newline at end of file
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import FileResponse
+import asyncio
+import re
+
+from db_models import User
+from schemas import ProfilerArm
+from auth import get_admin_user
+from config import get_settings
+from error_handlers import NotFoundError, BadRequestError
+from profiler import controller
+
+settings = get_settings()
+router = APIRouter(prefix=f"{settings.API_PREFIX}/profiler", tags=["Profiler"])
+
+@router.post("/session", status_code=status.HTTP_200_OK)
+async def arm_profiler(
+    session: ProfilerArm,
+    current_user: User = Depends(get_admin_user)
+):
+    """Profile the next N requests (or a sampled fraction) matching a route pattern - admin only"""
+    if session.max_requests is None and session.sample_rate is None:
+        raise BadRequestError("Either max_requests or sample_rate must be provided")
+    if session.max_requests is not None and session.sample_rate is not None:
+        raise BadRequestError("Provide max_requests or sample_rate, not both")
+
+    try:
+        await asyncio.to_thread(
+            controller.arm,
+            session.route_pattern,
+            max_requests=session.max_requests,
+            sample_rate=session.sample_rate,
+            interval_ms=session.interval_ms,
+            duration_seconds=session.duration_seconds
+        )
+    except re.error as e:
+        raise BadRequestError(f"Invalid route pattern: {str(e)}")
+
+    return await asyncio.to_thread(controller.status)
+
+@router.get("/session")
+async def get_profiler_status(
+    current_user: User = Depends(get_admin_user)
+):
+    """Get the current profiling session - admin only"""
+    return await asyncio.to_thread(controller.status)
+
+@router.delete("/session", status_code=status.HTTP_204_NO_CONTENT)
+async def disarm_profiler(
+    current_user: User = Depends(get_admin_user)
+):
+    """Stop profiling further requests on every worker - admin only"""
+    await asyncio.to_thread(controller.disarm)
+    return None
+
+@router.get("/profiles")
+async def list_profiles(
+    current_user: User = Depends(get_admin_user)
+):
+    """List stored profiles, newest first - admin only"""
+    return await asyncio.to_thread(controller.list_profiles)
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    current_user: User = Depends(get_admin_user)
+):
+    """Download a profile in speedscope format - admin only"""
+    file_path = await asyncio.to_thread(controller.get_profile_path, profile_id)
+    if not file_path:
+        raise NotFoundError("Profile", profile_id)
+
+    return FileResponse(
+        file_path,
+        media_type="application/json",
+        filename=f"{profile_id}.speedscope.json"
+    )
@@ -0,0 +1,143 @@
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, and_
+from datetime import datetime, timedelta
+from typing import List, Optional
+import json
+import os
+
+from db_connection import get_db
+from db_models import User, ReportJob
+from schemas import ReportRequest, ReportJobOut
+from auth import get_admin_user
+from config import get_settings
+from error_handlers import NotFoundError, BadRequestError, ConflictError
+from unit_of_work import UnitOfWork
+import reports
+
+settings = get_settings()
+router = APIRouter(prefix=f"{settings.API_PREFIX}/reports", tags=["Reports"])
+
+
+def _job_to_dict(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "report_type": job.report_type,
+        "format": job.format,
+        "spec": json.loads(job.spec),
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "artifact_size": job.artifact_size,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+        "download_url": f"{settings.API_PREFIX}/reports/{job.id}/download" if job.status == reports.SUCCEEDED else None
+    }
+
+
+@router.post("/", response_model=ReportJobOut, status_code=status.HTTP_202_ACCEPTED)
+async def request_report(
+    report: ReportRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user),
+    request: Request = None
+):
+    """Queue a report - admin only. An identical recent request returns the existing job (200)."""
+    spec = reports.normalize_spec(report.report_type, report.format, report.start_date, report.end_date, report.department)
+    spec_hash = reports.spec_hash(spec)
+    now = datetime.utcnow()
+
+    existing = (
+        db.query(ReportJob)
+        .filter(
+            ReportJob.spec_hash == spec_hash,
+            or_(
+                ReportJob.status.in_([reports.QUEUED, reports.RUNNING]),
+                and_(
+                    ReportJob.status == reports.SUCCEEDED,
+                    ReportJob.finished_at >= now - timedelta(seconds=settings.REPORT_CACHE_SECONDS)
+                )
+            )
+        )
+        .order_by(ReportJob.created_at.desc())
+        .first()
+    )
+    if existing and (existing.status != reports.SUCCEEDED or os.path.exists(existing.artifact_path)):
+        response.status_code = status.HTTP_200_OK
+        return _job_to_dict(existing)
+
+    active = db.query(func.count(ReportJob.id)).filter(
+        ReportJob.requested_by == current_user.id,
+        ReportJob.status.in_([reports.QUEUED, reports.RUNNING])
+    ).scalar()
+    if active >= settings.REPORT_MAX_ACTIVE_PER_USER:
+        raise ConflictError(f"You already have {active} reports in progress; wait for one to finish")
+
+    job = ReportJob(
+        report_type=spec["report_type"],
+        format=spec["format"],
+        spec=json.dumps(spec, sort_keys=True),
+        spec_hash=spec_hash,
+        requested_by=current_user.id
+    )
+
+    uow = UnitOfWork(db, request, current_user)
+    uow.add(job)
+    uow.audit("create", "report", job, f"Requested {spec['report_type']} report ({spec['format']}) for {spec['start_date']} to {spec['end_date']}")
+    uow.after_commit(reports.scheduler.wake)
+    uow.commit()
+
+    return _job_to_dict(job)
+
+
+@router.get("/", response_model=List[ReportJobOut])
+async def list_reports(
+    job_status: Optional[str] = Query(None, alias="status"),
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """List report jobs, newest first - admin only"""
+    query = db.query(ReportJob)
+    if job_status:
+        query = query.filter(ReportJob.status == job_status)
+    jobs = query.order_by(ReportJob.created_at.desc()).offset(skip).limit(limit).all()
+    return [_job_to_dict(job) for job in jobs]
+
+
+@router.get("/{job_id}", response_model=ReportJobOut)
+async def get_report(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Poll a report job's status and progress - admin only"""
+    job = db.query(ReportJob).filter(ReportJob.id == job_id).first()
+    if not job:
+        raise NotFoundError("Report", job_id)
+    return _job_to_dict(job)
+
+
+@router.get("/{job_id}/download")
+async def download_report(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Download a finished report - admin only"""
+    job = db.query(ReportJob).filter(ReportJob.id == job_id).first()
+    if not job:
+        raise NotFoundError("Report", job_id)
+    if job.status != reports.SUCCEEDED:
+        raise BadRequestError(f"Report is {job.status}, not ready for download")
+    if not job.artifact_path or not os.path.exists(job.artifact_path):
+        raise NotFoundError("Report file", job_id)
+
+    spec = json.loads(job.spec)
+    filename = f"{job.report_type}-{spec['start_date'][:10]}-{spec['end_date'][:10]}.{job.format}"
+    return FileResponse(job.artifact_path, media_type=reports.MEDIA_TYPES[job.format], filename=filename)
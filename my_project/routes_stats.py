@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, Request, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, case
+from sqlalchemy import func, and_, case, text
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
-from db_connection import get_db
-from db_models import User, Visitor, Badge, SystemLog, VisitStatus, VisitPurpose
+from db_connection import get_db, get_read_db, get_replica_router
+from db_models import User, Visitor, Badge, SystemLog, VisitorDailyRollup, VisitStatus, VisitPurpose
+from sql_functions import minutes_between, date_of
+from responses import trusted_json
 from auth import get_admin_user
 from config import get_settings
+import visitor_archive
 
 settings = get_settings()
 router = APIRouter(prefix=f"{settings.API_PREFIX}/stats", tags=["Statistics"])
@@ -16,7 +19,7 @@ router = APIRouter(prefix=f"{settings.API_PREFIX}/stats", tags=["Statistics"])
 async def get_visitor_stats(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_user)
 ):
     """Get visitor statistics - admin only"""
@@ -40,6 +43,11 @@ async def get_visitor_stats(
     status_counts = {status.value: 0 for status in VisitStatus}
     for result in query:
         status_counts[result.status.value] = result.count
+
+    # Archived visits in the range, from daily rollups
+    archived = visitor_archive.archived_totals(db, start_date, end_date)
+    for row in archived:
+        status_counts[row.status.value] += row.visitors
     
     # Get total count
     total_count = sum(status_counts.values())
@@ -57,45 +65,50 @@ async def get_visitor_stats(
     purpose_counts = {purpose.value: 0 for purpose in VisitPurpose}
     for result in purpose_query:
         purpose_counts[result.purpose.value] = result.count
+    for row in archived:
+        purpose_counts[row.purpose.value] += row.visitors
     
-    # Calculate average visit duration for completed visits
+    # Calculate average visit duration for completed visits, as a total and
+    # a count so archived visits can be added in
+    visit_minutes = minutes_between(Visitor.check_in_time, Visitor.check_out_time)
     duration_query = db.query(
-        func.avg(
-            func.timestampdiff(
-                'minute',
-                Visitor.check_in_time,
-                Visitor.check_out_time
-            )
-        ).label('avg_duration')
+        func.sum(visit_minutes).label('total_minutes'),
+        func.count(visit_minutes).label('completed')
     ).filter(
         Visitor.check_in_time.isnot(None),
         Visitor.check_out_time.isnot(None),
         Visitor.created_at.between(start_date, end_date)
     )
     
-    avg_duration_result = duration_query.first()
-    avg_duration = avg_duration_result.avg_duration if avg_duration_result.avg_duration else 0
+    duration_result = duration_query.first()
+    total_minutes = float(duration_result.total_minutes or 0) + sum(row.visit_minutes for row in archived)
+    completed = duration_result.completed + sum(row.completed for row in archived)
+    avg_duration = total_minutes / completed if completed else 0
     
     # Calculate visitors per day
     daily_query = db.query(
-        func.date(Visitor.created_at).label('date'),
+        date_of(Visitor.created_at).label('date'),
         func.count(Visitor.id).label('count')
     ).filter(
         Visitor.created_at.between(start_date, end_date)
     ).group_by(
-        func.date(Visitor.created_at)
+        date_of(Visitor.created_at)
     ).order_by(
-        func.date(Visitor.created_at)
+        date_of(Visitor.created_at)
     )
     
+    counts_by_date = {result.date: result.count for result in daily_query}
+    for row in archived:
+        counts_by_date[row.day] = counts_by_date.get(row.day, 0) + row.visitors
+    
     daily_counts = []
-    for result in daily_query:
+    for day in sorted(counts_by_date):
         daily_counts.append({
-            "date": result.date.isoformat(),
-            "count": result.count
+            "date": day.isoformat(),
+            "count": counts_by_date[day]
         })
     
-    return {
+    return trusted_json({
         "total_visitors": total_count,
         "date_range": {
             "start_date": start_date,
@@ -105,14 +118,14 @@ async def get_visitor_stats(
         "purpose_counts": purpose_counts,
         "average_visit_duration_minutes": float(avg_duration) if avg_duration else 0,
         "daily_counts": daily_counts
-    }
+    })
 
 @router.get("/hosts")
 async def get_host_stats(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_user)
 ):
     """Get host statistics - admin only"""
@@ -137,16 +150,31 @@ async def get_host_stats(
         Visitor.host_id, User.full_name, User.department
     ).order_by(
         func.count(Visitor.id).desc()
-    ).limit(limit)
+    )
+    
+    # Archived visits in the range, from daily rollups; with any, every
+    # host is ranked on the combined counts
+    archived = visitor_archive.archived_totals(db, start_date, end_date)
+    if not archived:
+        hosts_query = hosts_query.limit(limit)
     
-    top_hosts = []
+    hosts = {}
     for result in hosts_query:
-        top_hosts.append({
+        hosts[result.host_id] = {
             "host_id": result.host_id,
             "host_name": result.host_name,
             "department": result.department,
             "visitor_count": result.visitor_count
+        }
+    for row in archived:
+        host = hosts.setdefault(row.host_id, {
+            "host_id": row.host_id,
+            "host_name": row.host_name,
+            "department": row.department,
+            "visitor_count": 0
         })
+        host["visitor_count"] += row.visitors
+    top_hosts = sorted(hosts.values(), key=lambda host: host["visitor_count"], reverse=True)[:limit]
     
     # Query for departments
     departments_query = db.query(
@@ -162,32 +190,38 @@ async def get_host_stats(
         func.count(Visitor.id).desc()
     )
     
+    counts_by_department = {result.department: result.visitor_count for result in departments_query}
+    for row in archived:
+        counts_by_department[row.department] = counts_by_department.get(row.department, 0) + row.visitors
+    
     departments = []
-    for result in departments_query:
+    for department, visitor_count in sorted(counts_by_department.items(), key=lambda item: item[1], reverse=True):
         departments.append({
-            "department": result.department,
-            "visitor_count": result.visitor_count
+            "department": department,
+            "visitor_count": visitor_count
         })
     
-    return {
+    return trusted_json({
         "date_range": {
             "start_date": start_date,
             "end_date": end_date
         },
         "top_hosts": top_hosts,
         "departments": departments
-    }
+    })
 
 @router.get("/system")
 async def get_system_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_user)
 ):
     """Get system statistics - admin only"""
     
     # Get counts of various entities
     users_count = db.query(func.count(User.id)).scalar()
+    # Archived visitors are counted from their rollups, not the archive itself
     visitors_count = db.query(func.count(Visitor.id)).scalar()
+    visitors_count += int(db.query(func.coalesce(func.sum(VisitorDailyRollup.visitors), 0)).scalar())
     active_badges_count = db.query(func.count(Badge.id)).filter(
         Badge.expiry_time > datetime.utcnow()
     ).scalar()
@@ -227,7 +261,7 @@ async def get_system_stats(
         Visitor.scheduled_time.between(today_start, today_end)
     ).scalar()
     
-    return {
+    return trusted_json({
         "counts": {
             "users": users_count,
             "visitors": visitors_count,
@@ -238,7 +272,7 @@ async def get_system_stats(
         },
         "recent_activity": recent_activity,
         "system_time": datetime.utcnow()
-    }
+    })
 
 @router.get("/health")
 async def health_check():
@@ -249,7 +283,8 @@ async def health_check():
         # Check database connection
         db = next(get_db())
         db_status = "healthy"
-        db.execute("SELECT 1")
+        db.execute(text("SELECT 1"))
+        db.close()
     except SQLAlchemyError as e:
         db_status = f"unhealthy: {str(e)}"
     
@@ -280,6 +315,7 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow(),
         "database": db_status,
+        "replicas": get_replica_router().status(),
         "system": {
             "memory": memory_usage,
             "cpu_percent": cpu_percent,
@@ -4,17 +4,17 @@ from sqlalchemy.exc import IntegrityError
 from typing import List
 
 from db_connection import get_db
-from db_models import User, SystemLog
+from db_models import User
 from schemas import UserCreate, UserOut, UserUpdate, UserChangePassword
 from auth import (
     get_current_active_user, 
     get_admin_user, 
     get_password_hash, 
-    verify_password,
-    get_client_ip
+    verify_password
 )
 from config import get_settings
 from error_handlers import NotFoundError, DuplicateError, BadRequestError, AuthorizationError
+from unit_of_work import UnitOfWork
 
 settings = get_settings()
 router = APIRouter(prefix=f"{settings.API_PREFIX}/users", tags=["Users"])
@@ -47,22 +47,10 @@ async def create_user(
     )
     
     try:
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        
-        # Log the action
-        client_ip = get_client_ip(request) if request else "unknown"
-        log_entry = SystemLog(
-            action="create",
-            entity_type="user",
-            entity_id=new_user.id,
-            user_id=current_user.id,
-            ip_address=client_ip,
-            details=f"Created user: {new_user.username}"
-        )
-        db.add(log_entry)
-        db.commit()
+        uow = UnitOfWork(db, request, current_user)
+        uow.add(new_user)
+        uow.audit("create", "user", new_user, f"Created user: {new_user.username}")
+        uow.commit()
         
         return new_user
     except IntegrityError:
@@ -122,21 +110,9 @@ async def update_user(
     for field, value in update_data.items():
         setattr(db_user, field, value)
     
-    db.commit()
-    db.refresh(db_user)
-    
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="update",
-        entity_type="user",
-        entity_id=db_user.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Updated user: {db_user.username}"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("update", "user", db_user, f"Updated user: {db_user.username}")
+    uow.commit()
     
     return db_user
 
@@ -164,20 +140,10 @@ async def change_password(
     
     # Update password
     db_user.hashed_password = get_password_hash(password_change.new_password)
-    db.commit()
-    
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="change_password",
-        entity_type="user",
-        entity_id=db_user.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Changed password for user: {db_user.username}"
-    )
-    db.add(log_entry)
-    db.commit()
+    
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("change_password", "user", db_user, f"Changed password for user: {db_user.username}")
+    uow.commit()
     
     return {"detail": "Password changed successfully"}
 
@@ -197,21 +163,10 @@ async def delete_user(
     if current_user.id == user_id:
         raise BadRequestError("Cannot delete your own account")
     
-    # Log the action before deleting the user
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="delete",
-        entity_type="user",
-        entity_id=db_user.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Deleted user: {db_user.username}"
-    )
-    db.add(log_entry)
-    db.commit()
-    
-    # Delete the user
-    db.delete(db_user)
-    db.commit()
+    # Log the action and delete the user in one transaction
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("delete", "user", db_user.id, f"Deleted user: {db_user.username}")
+    uow.delete(db_user)
+    uow.commit()
     
     return None
\ No newline at end of file
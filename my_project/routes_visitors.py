@@ -1,23 +1,39 @@
-from fastapi import APIRouter, Depends, Request, status, File, UploadFile, Form
+from fastapi import APIRouter, Depends, Query, Request, Response, status, File, UploadFile, Form
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional
+from sqlalchemy import or_, and_
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+import base64
 import uuid
 
-from db_connection import get_db
-from db_models import User, Visitor, VisitorPhoto, Badge, SystemLog, VisitStatus, VisitPurpose
-from schemas import VisitorCreate, VisitorOut, VisitorUpdate, VisitApproval, PreApprovalCreate
+from db_connection import get_db, get_read_db
+from db_models import User, Visitor, VisitorArchive, VisitorPhoto, Badge, VisitorTombstone, VisitStatus, VisitPurpose, generate_uuid
+from schemas import (
+    VisitorCreate, VisitorOut, VisitorUpdate, VisitApproval, PreApprovalCreate, VisitorChanges,
+    ExpectedArrivals, BulkRegistrationOut, BulkVisitorAction, BulkActionOut
+)
 from auth import (
-    get_current_active_user, get_client_ip, 
+    get_current_active_user, 
     check_visitor_read_permission, check_visitor_write_permission, 
-    check_visitor_checkin_permission, check_visitor_photo_permission
+    check_visitor_photo_permission
 )
 from config import get_settings
-from error_handlers import NotFoundError, BadRequestError, AuthorizationError
+from error_handlers import NotFoundError, BadRequestError, AuthorizationError, ConflictError, GoneError
+from unit_of_work import UnitOfWork
+from responses import trusted_json
+from visitor_fields import parse_fields, visitor_query, visitor_row_to_dict, filter_visitors
+from idempotency import IdempotentRoute
+import events
+import expected_arrivals
+import outbox
+import visitor_archive
+import visitor_bulk
+import visitor_state
 
 settings = get_settings()
-router = APIRouter(prefix=f"{settings.API_PREFIX}/visitors", tags=["Visitors"])
+# POSTs honour the Idempotency-Key header so kiosk and scanner retries are safe
+router = APIRouter(prefix=f"{settings.API_PREFIX}/visitors", tags=["Visitors"], route_class=IdempotentRoute)
 
 @router.post("/", response_model=VisitorOut, status_code=status.HTTP_201_CREATED)
 async def register_visitor(
@@ -42,22 +58,11 @@ async def register_visitor(
         scheduled_time=visitor.scheduled_time
     )
     
-    db.add(new_visitor)
-    db.commit()
-    db.refresh(new_visitor)
-    
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="create",
-        entity_type="visitor",
-        entity_id=new_visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Registered visitor: {new_visitor.full_name} for host: {host.full_name}"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.add(new_visitor)
+    uow.audit("create", "visitor", new_visitor, f"Registered visitor: {new_visitor.full_name} for host: {host.full_name}")
+    uow.publish(events.VISITOR_CREATED, new_visitor)
+    uow.commit()
     
     # Prepare response data
     result = {
@@ -76,11 +81,164 @@ async def register_visitor(
         "created_at": new_visitor.created_at,
         "has_photo": False,
         "has_badge": False,
-        "visit_duration": None
+        "visit_duration": None,
+        "version": new_visitor.version
     }
     
     return result
 
+@router.post(
+    "/bulk",
+    response_model=BulkRegistrationOut,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": VisitorCreate.model_json_schema()}},
+        "text/csv": {"schema": {"type": "string", "description": f"Header row with {', '.join(visitor_bulk.CSV_COLUMNS)}"}}
+    }}}
+)
+async def register_visitors_bulk(
+    request: Request,
+    pre_approve: bool = False,
+    visit_duration_minutes: int = Query(60, ge=15, le=480),
+    atomic: bool = Query(False, description="Register nothing if any row is invalid"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Register a guest list (JSON or CSV) in one transaction, with a result per row.
+
+    With `pre_approve`, every visitor is approved and gets a badge valid from
+    their scheduled time for `visit_duration_minutes`.
+    """
+    rows = visitor_bulk.parse_rows(request.headers.get("content-type", ""), await request.body())
+    valid, errors, hosts = visitor_bulk.validate_rows(db, rows, pre_approve)
+
+    results = {number: {"row": number, "status": "error", "errors": messages} for number, messages in errors.items()}
+    if errors and atomic:
+        for number in valid:
+            results[number] = {"row": number, "status": "skipped"}
+        valid = {}
+
+    if valid:
+        uow = UnitOfWork(db, request, current_user)
+        results.update(visitor_bulk.register_visitors(uow, valid, hosts, pre_approve, visit_duration_minutes))
+        uow.commit()
+
+    return trusted_json({
+        "created": len(valid),
+        "failed": len(errors),
+        "results": [results[number] for number in sorted(results)]
+    })
+
+def _bulk_transition(
+    action: visitor_state.Transition,
+    pending_statuses: List[VisitStatus],
+    body: BulkVisitorAction,
+    db: Session,
+    current_user: User,
+    values: Optional[dict] = None
+):
+    """Transition the requested visitors set-based; returns (rows, failure reasons by id)"""
+    if body.visitor_ids is not None:
+        if len(body.visitor_ids) > settings.BULK_MAX_ROWS:
+            raise BadRequestError(f"At most {settings.BULK_MAX_ROWS} visitors can be changed at once")
+        rows = visitor_state.transition_many(db, action, user=current_user, visitor_ids=body.visitor_ids, values=values)
+        changed = {row.id for row in rows}
+        unchanged = [visitor_id for visitor_id in dict.fromkeys(body.visitor_ids) if visitor_id not in changed]
+        return rows, visitor_state.explain_failures(db, unchanged, action, current_user)
+
+    if body.host_id is None and not body.all_hosts:
+        raise BadRequestError("Provide visitor_ids, host_id or all_hosts")
+    # Without ids only visitors still waiting for this action are targeted
+    rows = visitor_state.transition_many(
+        db, action, user=current_user, host_id=body.host_id, sources=pending_statuses, values=values
+    )
+    return rows, {}
+
+def _bulk_result(rows, failures: dict, extra: Optional[dict] = None) -> dict:
+    results = [
+        dict({"visitor_id": row.id, "status": row.status, "version": row.version}, **(extra or {}).get(row.id, {}))
+        for row in rows
+    ]
+    results.extend({"visitor_id": visitor_id, "error": reason} for visitor_id, reason in failures.items())
+    return {"succeeded": len(rows), "failed": len(failures), "results": results}
+
+@router.post("/bulk/approve", response_model=BulkActionOut)
+async def approve_visitors_bulk(
+    body: BulkVisitorAction,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    request: Request = None
+):
+    """Approve many visitors at once and issue the missing badges"""
+    rows, failures = _bulk_transition(visitor_state.APPROVE, [VisitStatus.PENDING], body, db, current_user)
+
+    # Existing badges are kept, the rest are created with one multi-row insert
+    approved_ids = [row.id for row in rows]
+    badges = {}
+    for start in range(0, len(approved_ids), settings.BULK_CHUNK_SIZE):
+        chunk = approved_ids[start:start + settings.BULK_CHUNK_SIZE]
+        badges.update(db.query(Badge.visitor_id, Badge.qr_code).filter(Badge.visitor_id.in_(chunk)).all())
+    expiry_time = datetime.utcnow() + timedelta(days=1)
+    new_badges = [
+        {"id": generate_uuid(), "visitor_id": visitor_id, "qr_code": f"VMS-{str(uuid.uuid4())}", "expiry_time": expiry_time}
+        for visitor_id in approved_ids if visitor_id not in badges
+    ]
+    badges.update((badge["visitor_id"], badge["qr_code"]) for badge in new_badges)
+
+    uow = UnitOfWork(db, request, current_user)
+    uow.insert_many(Badge, new_badges)
+    for row in rows:
+        uow.audit("approve", "visitor", row, f"Approved visitor: {row.full_name} (bulk)")
+        uow.publish(events.VISITOR_APPROVED, row)
+        if row.host_id != current_user.id:
+            uow.notify(outbox.VISITOR_APPROVED, row)
+    uow.commit()
+
+    return trusted_json(_bulk_result(rows, failures, {visitor_id: {"qr_code": qr_code} for visitor_id, qr_code in badges.items()}))
+
+@router.post("/bulk/reject", response_model=BulkActionOut)
+async def reject_visitors_bulk(
+    body: BulkVisitorAction,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    request: Request = None
+):
+    """Reject many visitors at once"""
+    rows, failures = _bulk_transition(visitor_state.REJECT, [VisitStatus.PENDING], body, db, current_user)
+
+    uow = UnitOfWork(db, request, current_user)
+    for row in rows:
+        log_message = f"Rejected visitor: {row.full_name} (bulk)"
+        if body.notes:
+            log_message += f", Reason: {body.notes}"
+        uow.audit("reject", "visitor", row, log_message)
+        uow.publish(events.VISITOR_REJECTED, row)
+    uow.commit()
+
+    return trusted_json(_bulk_result(rows, failures))
+
+@router.post("/bulk/check-out", response_model=BulkActionOut)
+async def check_out_visitors_bulk(
+    body: BulkVisitorAction,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    request: Request = None
+):
+    """Check out many visitors at once, e.g. everyone still on site at closing time"""
+    timestamp = datetime.utcnow()
+    rows, failures = _bulk_transition(
+        visitor_state.CHECK_OUT, [VisitStatus.CHECKED_IN], body, db, current_user,
+        values={"check_out_time": timestamp}
+    )
+
+    uow = UnitOfWork(db, request, current_user)
+    for row in rows:
+        visit_duration = (timestamp - row.check_in_time.replace(tzinfo=None)).total_seconds() / 60
+        uow.audit("check_out", "visitor", row, f"Checked out visitor: {row.full_name}, Duration: {visit_duration:.1f} minutes (bulk)")
+        uow.publish(events.VISITOR_CHECKED_OUT, row)
+    uow.commit()
+
+    return trusted_json(_bulk_result(rows, failures))
+
 @router.post("/self-register", status_code=status.HTTP_201_CREATED)
 async def self_register_visitor(
     visitor: VisitorCreate,
@@ -108,24 +266,13 @@ async def self_register_visitor(
             status=VisitStatus.PENDING
         )
         
-        db.add(new_visitor)
-        db.commit()
-        db.refresh(new_visitor)
-        
-        # Log the action
-        client_ip = get_client_ip(request) if request else "unknown"
-        log_entry = SystemLog(
-            action="self_register",
-            entity_type="visitor",
-            entity_id=new_visitor.id,
-            user_id=None,  # No user for self-registration
-            ip_address=client_ip,
-            details=f"Self-registered visitor: {new_visitor.full_name} for host: {host.full_name}"
-        )
-        db.add(log_entry)
-        db.commit()
-        
-        # Send notification email to host (optional - would implement here)
+        # No user for self-registration
+        uow = UnitOfWork(db, request)
+        uow.add(new_visitor)
+        uow.audit("self_register", "visitor", new_visitor, f"Self-registered visitor: {new_visitor.full_name} for host: {host.full_name}")
+        uow.publish(events.VISITOR_CREATED, new_visitor)
+        uow.notify(outbox.VISITOR_REGISTERED, new_visitor)
+        uow.commit()
         
         return {
             "message": "Registration successful. Your request has been sent to the host for approval.",
@@ -141,7 +288,7 @@ async def self_register_visitor(
 
 @router.get("/hosts", status_code=status.HTTP_200_OK)
 async def get_hosts(
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Public endpoint to get list of hosts for self-registration"""
     try:
@@ -171,59 +318,110 @@ async def list_visitors(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     host_id: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. full_name,status,host_name"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    fields = parse_fields(fields)
+
+    def build_query(source):
+        # created_at orders the merge with archived visits
+        return filter_visitors(
+            visitor_query(db, fields + ("created_at",), source),
+            current_user, status, purpose, start_date, end_date, host_id, source
+        )
+
+    # Pagination and ordering; archived visits only when the range reaches them
+    rows = visitor_archive.newest_first(db, build_query, start_date, skip, limit)
+
+    # Rows are built to match VisitorOut already; skip re-validating them
+    return trusted_json([visitor_row_to_dict(row, fields) for row in rows])
+
+def _encode_sync_token(timestamp: datetime, visitor_id: str = "") -> str:
+    raw = f"{timestamp.isoformat()}|{visitor_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_sync_token(token: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        timestamp, visitor_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), visitor_id
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequestError("Invalid sync token")
+
+@router.get("/changes", response_model=VisitorChanges)
+async def get_visitor_changes(
+    since: Optional[str] = None,
+    limit: int = 500,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    query = db.query(Visitor)
+    """Visitors created, updated or deleted since a sync token.
 
-    # Modified permissions - allow security to view all visitors
-    if current_user.department == "Security":
-        # Security can view all visitors (read-only access)
-        pass  # Don't filter by host
-    elif not current_user.is_admin:
-        # Regular faculty can only see their own visitors
-        query = query.filter(Visitor.host_id == current_user.id)
-    elif host_id:
-        # Admin with specific host filter
-        query = query.filter(Visitor.host_id == host_id)
-
-    # Apply query filters
-    if status:
-        query = query.filter(Visitor.status == status)
-    if purpose:
-        query = query.filter(Visitor.purpose == purpose)
-    if start_date:
-        # Fix timezone issue
-        start_date = start_date.replace(tzinfo=None)
-        query = query.filter(Visitor.created_at >= start_date)
-    if end_date:
-        # Fix timezone issue
-        end_date = end_date.replace(tzinfo=None)
-        query = query.filter(Visitor.created_at <= end_date)
-
-    # Pagination and ordering
-    visitors = (
-        query.order_by(Visitor.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    Omit `since` for the initial sync, which lists current visitors and no
+    deletions. Pass the returned token on the next call; while `has_more`
+    is true, call again immediately. Tokens older than
+    SYNC_TOKEN_MAX_AGE_DAYS get 410 Gone: start again without `since`.
+    """
+    if limit <= 0 or limit > 1000:
+        raise BadRequestError("Limit must be between 1 and 1000")
+
+    since_time = since_id = None
+    if since:
+        since_time, since_id = _decode_sync_token(since)
+        # Tombstones are pruned after this age, so deletions could be missed
+        if since_time < datetime.utcnow() - timedelta(days=settings.SYNC_TOKEN_MAX_AGE_DAYS):
+            raise GoneError("Sync token expired; start a full sync without `since`")
+
+    # updated_at and deleted_at are stamped with the application's clock when
+    # the row is written, not when it commits. Stopping short of now leaves
+    # rows of transactions still in flight (and clock skew between app
+    # servers) for the next poll instead of skipping them.
+    until = datetime.utcnow() - timedelta(seconds=settings.SYNC_COMMIT_LAG_SECONDS)
+
+    query = db.query(
+        Visitor,
+        User.full_name.label("host_name"),
+        Badge.id.label("badge_id")
+    ).outerjoin(
+        User, User.id == Visitor.host_id
+    ).outerjoin(
+        Badge, Badge.visitor_id == Visitor.id
+    ).filter(
+        Visitor.updated_at < until
     )
+    tombstones = db.query(VisitorTombstone.visitor_id).filter(VisitorTombstone.deleted_at < until)
 
-    # Construct output list
-    result = []
-    for visitor in visitors:
-        host = db.query(User).filter(User.id == visitor.host_id).first()
-        has_badge = db.query(Badge).filter(Badge.visitor_id == visitor.id).first() is not None
+    # Same visibility rules as list_visitors
+    if current_user.department != "Security" and not current_user.is_admin:
+        query = query.filter(Visitor.host_id == current_user.id)
+        tombstones = tombstones.filter(VisitorTombstone.host_id == current_user.id)
+
+    if since:
+        query = query.filter(or_(
+            Visitor.updated_at > since_time,
+            and_(Visitor.updated_at == since_time, Visitor.id > since_id)
+        ))
+        tombstones = tombstones.filter(VisitorTombstone.deleted_at >= since_time)
+
+    rows = query.order_by(Visitor.updated_at, Visitor.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
+        last_visitor = rows[-1].Visitor
+        token = _encode_sync_token(last_visitor.updated_at, last_visitor.id)
+        tombstones = tombstones.filter(VisitorTombstone.deleted_at < last_visitor.updated_at)
+    else:
+        token = _encode_sync_token(until)
 
-        # Calculate visit duration if both check-in and check-out times exist
+    changes = []
+    for visitor, host_name, badge_id in rows:
         visit_duration = None
         if visitor.check_in_time and visitor.check_out_time:
-            # Fix timezone issue
-            check_in = visitor.check_in_time.replace(tzinfo=None)
-            check_out = visitor.check_out_time.replace(tzinfo=None)
-            visit_duration = (check_out - check_in).total_seconds() / 60
+            visit_duration = (visitor.check_out_time - visitor.check_in_time).total_seconds() / 60
 
-        result.append({
+        changes.append({
             "id": visitor.id,
             "full_name": visitor.full_name,
             "email": visitor.email,
@@ -231,70 +429,69 @@ async def list_visitors(
             "company": visitor.company,
             "purpose": visitor.purpose,
             "host_id": visitor.host_id,
-            "host_name": host.full_name if host else "Unknown",
+            "photo_url": visitor.image,
+            "host_name": host_name or "Unknown",
             "status": visitor.status,
             "scheduled_time": visitor.scheduled_time,
             "check_in_time": visitor.check_in_time,
             "check_out_time": visitor.check_out_time,
             "created_at": visitor.created_at,
             "has_photo": bool(visitor.image),
-            "has_badge": has_badge,
-            "visit_duration": visit_duration
+            "has_badge": badge_id is not None,
+            "visit_duration": visit_duration,
+            "version": visitor.version
         })
 
-    return result
+    return trusted_json({
+        "changes": changes,
+        # A client without a token has nothing to delete
+        "deleted": [row.visitor_id for row in tombstones] if since else [],
+        "token": token,
+        "has_more": has_more
+    })
 
+@router.get("/expected", response_model=ExpectedArrivals)
+async def get_expected_arrivals(
+    hours: int = Query(4, ge=1, le=24, description="Look-ahead in hours"),
+    host_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Approved visitors expected soon, oldest first, for the guard desk"""
+    if current_user.department == "Security":
+        host_id = None  # The guard desk sees every arrival
+    elif not current_user.is_admin:
+        host_id = current_user.id
+
+    body = expected_arrivals.cache.get(db, datetime.utcnow(), hours, host_id)
+    return Response(content=body, media_type="application/json")
 
 @router.get("/{visitor_id}", response_model=VisitorOut)
 async def get_visitor(
     visitor_id: str,
-    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. full_name,status,host_name"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if not visitor:
+    fields = parse_fields(fields)
+    row = visitor_query(db, fields).filter(Visitor.id == visitor_id).first()
+    if not row:
+        # Finished visits may have moved to the archive
+        row = visitor_query(db, fields, VisitorArchive).filter(VisitorArchive.id == visitor_id).first()
+    if not row:
         raise NotFoundError("Visitor", visitor_id)
     
     # Use the permission check function
-    if not check_visitor_read_permission(current_user, visitor.host_id):
+    if not check_visitor_read_permission(current_user, row.host_id):
         raise AuthorizationError("Not authorized to view this visitor's information")
     
-    host = db.query(User).filter(User.id == visitor.host_id).first()
-    has_photo = db.query(VisitorPhoto).filter(VisitorPhoto.visitor_id == visitor.id).first() is not None
-    has_badge = db.query(Badge).filter(Badge.visitor_id == visitor.id).first() is not None
-    
-    visit_duration = None
-    if visitor.check_in_time and visitor.check_out_time:
-        # Fix timezone issue
-        check_in = visitor.check_in_time.replace(tzinfo=None)
-        check_out = visitor.check_out_time.replace(tzinfo=None)
-        visit_duration = (check_out - check_in).total_seconds() / 60  # Duration in minutes
-    
-    result = {
-        "id": visitor.id,
-        "full_name": visitor.full_name,
-        "email": visitor.email,
-        "phone": visitor.phone,
-        "company": visitor.company,
-        "purpose": visitor.purpose,
-        "host_id": visitor.host_id,
-        "host_name": host.full_name if host else "Unknown",
-        "status": visitor.status,
-        "scheduled_time": visitor.scheduled_time,
-        "check_in_time": visitor.check_in_time,
-        "check_out_time": visitor.check_out_time,
-        "created_at": visitor.created_at,
-        "has_photo": has_photo,
-        "has_badge": has_badge,
-        "visit_duration": visit_duration
-    }
-    
-    return result
+    return trusted_json(visitor_row_to_dict(row, fields))
 
 @router.put("/{visitor_id}", response_model=VisitorOut)
 async def update_visitor(
     visitor_id: str,
     visitor_update: VisitorUpdate,
+    expected_version: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
     request: Request = None
@@ -311,6 +508,13 @@ async def update_visitor(
     if visitor.status in [VisitStatus.CHECKED_IN, VisitStatus.CHECKED_OUT]:
         raise BadRequestError("Cannot update visitor after check-in")
     
+    # Lets clients detect edits made since they loaded the visitor; concurrent
+    # writers are caught by the version column at flush time (StaleDataError)
+    if expected_version is not None and visitor.version != expected_version:
+        raise ConflictError(
+            f"Visitor was modified by another request (version {visitor.version}, expected {expected_version})"
+        )
+    
     # Update visitor fields
     update_data = visitor_update.dict(exclude_unset=True)
     
@@ -324,21 +528,10 @@ async def update_visitor(
     for field, value in update_data.items():
         setattr(visitor, field, value)
     
-    db.commit()
-    db.refresh(visitor)
-    
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="update",
-        entity_type="visitor",
-        entity_id=visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Updated visitor: {visitor.full_name}"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("update", "visitor", visitor, f"Updated visitor: {visitor.full_name}")
+    uow.publish(events.VISITOR_UPDATED, visitor)
+    uow.commit()
     
     # Prepare response
     host = db.query(User).filter(User.id == visitor.host_id).first()
@@ -368,7 +561,8 @@ async def update_visitor(
         "created_at": visitor.created_at,
         "has_photo": has_photo,
         "has_badge": has_badge,
-        "visit_duration": visit_duration
+        "visit_duration": visit_duration,
+        "version": visitor.version
     }
     
     return result
@@ -422,18 +616,9 @@ async def upload_visitor_photo(
         log_action = "create"
         log_message = f"Uploaded photo for visitor: {visitor.full_name}"
     
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action=log_action,
-        entity_type="photo",
-        entity_id=photo_id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=log_message
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit(log_action, "photo", photo_id, log_message)
+    uow.commit()
     
     return {"detail": "Photo uploaded successfully", "photo_id": photo_id}
 
@@ -441,28 +626,21 @@ async def upload_visitor_photo(
 async def approve_or_reject_visitor(
     visitor_id: str,
     approval: VisitApproval,
+    expected_version: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
     request: Request = None
 ):
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if not visitor:
-        raise NotFoundError("Visitor", visitor_id)
-    
-    # Use permission check function
-    if not check_visitor_write_permission(current_user, visitor.host_id):
-        raise AuthorizationError("Not authorized to approve/reject this visitor")
-    
-    # Don't allow approval/rejection for visitors who are already checked in or out
-    if visitor.status in [VisitStatus.CHECKED_IN, VisitStatus.CHECKED_OUT]:
-        raise BadRequestError(f"Cannot approve/reject visitor with status: {visitor.status}")
+    # Checked-in and checked-out visitors are not valid sources, so a racing
+    # check-in wins and this request gets a 409 instead of overwriting it
+    action = visitor_state.APPROVE if approval.approved else visitor_state.REJECT
+    visitor = visitor_state.transition(
+        db, visitor_id, action, user=current_user, expected_version=expected_version
+    )
     
     badge_info = {}
     
-    # Update status based on approval decision
     if approval.approved:
-        visitor.status = VisitStatus.APPROVED
-        
         # Generate badge if it doesn't exist
         existing_badge = db.query(Badge).filter(Badge.visitor_id == visitor_id).first()
         
@@ -478,7 +656,7 @@ async def approve_or_reject_visitor(
             )
             
             db.add(new_badge)
-            db.flush()
+            db.flush()  # Assign the badge id for the response
             
             badge_info = {
                 "badge_id": new_badge.id,
@@ -497,29 +675,24 @@ async def approve_or_reject_visitor(
             
             log_message = f"Approved visitor: {visitor.full_name} with existing badge"
     else:
-        visitor.status = VisitStatus.REJECTED
         log_message = f"Rejected visitor: {visitor.full_name}"
         
         if approval.notes:
             log_message += f", Reason: {approval.notes}"
     
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="approve" if approval.approved else "reject",
-        entity_type="visitor",
-        entity_id=visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=log_message
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("approve" if approval.approved else "reject", "visitor", visitor, log_message)
+    uow.publish(events.VISITOR_APPROVED if approval.approved else events.VISITOR_REJECTED, visitor)
+    if approval.approved and visitor.host_id != current_user.id:
+        # Hosts approving their own visitors need no email about it
+        uow.notify(outbox.VISITOR_APPROVED, visitor)
+    uow.commit()
     
     result = {
         "detail": "Visitor approved" if approval.approved else "Visitor rejected",
         "visitor_id": visitor_id,
-        "status": visitor.status.value
+        "status": visitor.status.value,
+        "version": visitor.version
     }
     
     if approval.approved:
@@ -531,121 +704,78 @@ async def approve_or_reject_visitor(
 async def reject_visitor(
     visitor_id: str,
     rejection: VisitApproval,  # reuse the same model with `approved=False` and optional notes
+    expected_version: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
     request: Request = None
 ):
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if not visitor:
-        raise NotFoundError("Visitor", visitor_id)
-
-    # Use permission check function
-    if not check_visitor_write_permission(current_user, visitor.host_id):
-        raise AuthorizationError("Not authorized to reject this visitor")
-
-    # Cannot reject a visitor who is already checked in or out
-    if visitor.status in [VisitStatus.CHECKED_IN, VisitStatus.CHECKED_OUT]:
-        raise BadRequestError(f"Cannot reject visitor with status: {visitor.status}")
-
-    # Reject the visitor
-    visitor.status = VisitStatus.REJECTED
+    visitor = visitor_state.transition(
+        db, visitor_id, visitor_state.REJECT, user=current_user, expected_version=expected_version
+    )
 
     log_message = f"Rejected visitor: {visitor.full_name}"
     if rejection.notes:
         log_message += f", Reason: {rejection.notes}"
 
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="reject",
-        entity_type="visitor",
-        entity_id=visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=log_message
-    )
-
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("reject", "visitor", visitor, log_message)
+    uow.publish(events.VISITOR_REJECTED, visitor)
+    uow.commit()
 
     return {
         "detail": "Visitor rejected",
         "visitor_id": visitor_id,
-        "status": visitor.status.value
+        "status": visitor.status.value,
+        "version": visitor.version
     }
 
 @router.post("/{visitor_id}/check-in", status_code=status.HTTP_200_OK)
 async def check_in_visitor(
     visitor_id: str,
+    expected_version: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
     request: Request = None
 ):
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if not visitor:
-        raise NotFoundError("Visitor", visitor_id)
-    
-    # Use permission check function - allow security to check in
-    if not check_visitor_checkin_permission(current_user, visitor.host_id):
-        raise AuthorizationError("Not authorized to check in this visitor")
-    
-    # Verify visitor status
-    if visitor.status != VisitStatus.APPROVED:
-        raise BadRequestError(f"Cannot check in visitor with status: {visitor.status}")
-    
-    # Check if photo is captured
-    has_photo = db.query(VisitorPhoto).filter(VisitorPhoto.visitor_id == visitor_id).first() is not None
-    if not has_photo:
-        raise BadRequestError("Photo must be captured before check-in")
-    
-    # Record check-in time
+    # Status, permission and photo checks all happen inside the UPDATE, so two
+    # concurrent scans of the same badge check the visitor in exactly once
     timestamp = datetime.utcnow()
-    visitor.check_in_time = timestamp
-    visitor.status = VisitStatus.CHECKED_IN
-    
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="check_in",
-        entity_type="visitor",
-        entity_id=visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Checked in visitor: {visitor.full_name}"
+    visitor = visitor_state.transition(
+        db, visitor_id, visitor_state.CHECK_IN,
+        user=current_user,
+        expected_version=expected_version,
+        require_photo=True,
+        values={"check_in_time": timestamp}
     )
-    db.add(log_entry)
-    db.commit()
+    
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("check_in", "visitor", visitor, f"Checked in visitor: {visitor.full_name}")
+    uow.publish(events.VISITOR_CHECKED_IN, visitor)
+    uow.commit()
     
     return {
         "detail": "Visitor checked in successfully",
         "visitor_id": visitor_id,
         "check_in_time": timestamp,
-        "status": VisitStatus.CHECKED_IN.value
+        "status": VisitStatus.CHECKED_IN.value,
+        "version": visitor.version
     }
 
 @router.post("/{visitor_id}/check-out", status_code=status.HTTP_200_OK)
 async def check_out_visitor(
     visitor_id: str,
+    expected_version: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
     request: Request = None
 ):
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if not visitor:
-        raise NotFoundError("Visitor", visitor_id)
-    
-    # Use permission check function - allow security to check out
-    if not check_visitor_checkin_permission(current_user, visitor.host_id):
-        raise AuthorizationError("Not authorized to check out this visitor")
-    
-    # Verify visitor status
-    if visitor.status != VisitStatus.CHECKED_IN:
-        raise BadRequestError(f"Cannot check out visitor with status: {visitor.status}")
-    
-    # Record check-out time
     timestamp = datetime.utcnow()
-    visitor.check_out_time = timestamp
-    visitor.status = VisitStatus.CHECKED_OUT
+    visitor = visitor_state.transition(
+        db, visitor_id, visitor_state.CHECK_OUT,
+        user=current_user,
+        expected_version=expected_version,
+        values={"check_out_time": timestamp}
+    )
     
     # Calculate visit duration
     # Fix timezone issue
@@ -654,25 +784,18 @@ async def check_out_visitor(
     delta = check_out - check_in
     visit_duration = delta.total_seconds() / 60  # Duration in minutes
     
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="check_out",
-        entity_type="visitor",
-        entity_id=visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Checked out visitor: {visitor.full_name}, Duration: {visit_duration:.1f} minutes"
-    )
-    db.add(log_entry)
-    db.commit()
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("check_out", "visitor", visitor, f"Checked out visitor: {visitor.full_name}, Duration: {visit_duration:.1f} minutes")
+    uow.publish(events.VISITOR_CHECKED_OUT, visitor)
+    uow.commit()
     
     return {
         "detail": "Visitor checked out successfully",
         "visitor_id": visitor_id,
         "check_out_time": timestamp,
         "status": VisitStatus.CHECKED_OUT.value,
-        "visit_duration": visit_duration
+        "visit_duration": visit_duration,
+        "version": visitor.version
     }
 
 @router.delete("/{visitor_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -694,21 +817,19 @@ async def delete_visitor(
     if visitor.status == VisitStatus.CHECKED_IN:
         raise BadRequestError("Cannot delete a visitor who is currently checked in")
     
-    # Log the action before deleting
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="delete",
-        entity_type="visitor",
-        entity_id=visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Deleted visitor: {visitor.full_name}"
-    )
-    db.add(log_entry)
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("delete", "visitor", visitor.id, f"Deleted visitor: {visitor.full_name}")
+    
+    # Leave a tombstone for delta sync clients, and drop those no valid token can reach
+    uow.add(VisitorTombstone(visitor_id=visitor.id, host_id=visitor.host_id))
+    db.query(VisitorTombstone).filter(
+        VisitorTombstone.deleted_at < datetime.utcnow() - timedelta(days=settings.SYNC_TOKEN_MAX_AGE_DAYS)
+    ).delete(synchronize_session=False)
     
     # Delete the visitor (cascades to photos and badges)
-    db.delete(visitor)
-    db.commit()
+    uow.publish(events.VISITOR_DELETED, visitor)
+    uow.delete(visitor)
+    uow.commit()
     
     return None
 
@@ -738,34 +859,21 @@ async def create_pre_approval(
         status=VisitStatus.APPROVED  # Pre-approved
     )
     
-    db.add(new_visitor)
-    db.flush()
-    
     # Create badge
     qr_code = f"VMS-PRE-{str(uuid.uuid4())}"
     expiry_time = pre_approval.scheduled_time + timedelta(minutes=pre_approval.visit_duration_minutes)
     
     new_badge = Badge(
-        visitor_id=new_visitor.id,
         qr_code=qr_code,
         expiry_time=expiry_time
     )
+    new_visitor.badge = new_badge
     
-    db.add(new_badge)
-    
-    # Log the action
-    client_ip = get_client_ip(request) if request else "unknown"
-    log_entry = SystemLog(
-        action="pre_approve",
-        entity_type="visitor",
-        entity_id=new_visitor.id,
-        user_id=current_user.id,
-        ip_address=client_ip,
-        details=f"Pre-approved visitor: {new_visitor.full_name}, Scheduled: {pre_approval.scheduled_time}"
-    )
-    db.add(log_entry)
-    db.commit()
-    db.refresh(new_visitor)
+    uow = UnitOfWork(db, request, current_user)
+    uow.add(new_visitor)
+    uow.audit("pre_approve", "visitor", new_visitor, f"Pre-approved visitor: {new_visitor.full_name}, Scheduled: {pre_approval.scheduled_time}")
+    uow.publish(events.VISITOR_CREATED, new_visitor)
+    uow.commit()
     
     # Prepare response
     host = db.query(User).filter(User.id == new_visitor.host_id).first()
@@ -787,6 +895,7 @@ async def create_pre_approval(
         "has_photo": False,
         "has_badge": True,
         "visit_duration": None,
+        "version": new_visitor.version,
         "qr_code": qr_code,
         "expiry_time": expiry_time
     }
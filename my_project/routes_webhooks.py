@@ -0,0 +1,176 @@
+from fastapi import APIRouter, Depends, Query, Request, status
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+import secrets
+
+from db_connection import get_db
+from db_models import User, WebhookSubscription, WebhookDelivery
+from schemas import WebhookSubscriptionCreate, WebhookSubscriptionUpdate, WebhookSubscriptionOut, WebhookDeliveryOut
+from auth import get_admin_user
+from config import get_settings
+from error_handlers import NotFoundError, BadRequestError
+from unit_of_work import UnitOfWork
+import webhooks
+
+settings = get_settings()
+router = APIRouter(prefix=f"{settings.API_PREFIX}/webhooks", tags=["Webhooks"])
+
+
+def _validate_event_types(event_types: List[str]) -> str:
+    unknown = set(event_types) - set(webhooks.WEBHOOK_EVENT_TYPES)
+    if unknown:
+        raise BadRequestError(
+            f"Unknown event types: {', '.join(sorted(unknown))}. Available: {', '.join(webhooks.WEBHOOK_EVENT_TYPES)}"
+        )
+    return ",".join(sorted(set(event_types)))
+
+
+def _subscription_to_dict(subscription: WebhookSubscription, include_secret: bool = False) -> dict:
+    return {
+        "id": subscription.id,
+        "name": subscription.name,
+        "url": subscription.url,
+        "event_types": subscription.event_types.split(","),
+        "max_concurrency": subscription.max_concurrency,
+        "active": subscription.active,
+        "created_at": subscription.created_at,
+        "secret": subscription.secret if include_secret else None
+    }
+
+
+@router.post("/subscriptions", response_model=WebhookSubscriptionOut, status_code=status.HTTP_201_CREATED)
+async def create_subscription(
+    subscription: WebhookSubscriptionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user),
+    request: Request = None
+):
+    """Register a webhook receiver - admin only. The signing secret is only shown here."""
+    new_subscription = WebhookSubscription(
+        name=subscription.name,
+        url=subscription.url,
+        secret=secrets.token_urlsafe(32),
+        event_types=_validate_event_types(subscription.event_types),
+        max_concurrency=subscription.max_concurrency
+    )
+
+    uow = UnitOfWork(db, request, current_user)
+    uow.add(new_subscription)
+    uow.audit("create", "webhook", new_subscription, f"Created webhook subscription: {new_subscription.name}")
+    uow.after_commit(webhooks.subscriptions.clear)
+    uow.commit()
+
+    return _subscription_to_dict(new_subscription, include_secret=True)
+
+
+@router.get("/subscriptions", response_model=List[WebhookSubscriptionOut])
+async def list_subscriptions(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """List webhook receivers - admin only"""
+    rows = db.query(WebhookSubscription).order_by(WebhookSubscription.created_at).all()
+    return [_subscription_to_dict(row) for row in rows]
+
+
+@router.put("/subscriptions/{subscription_id}", response_model=WebhookSubscriptionOut)
+async def update_subscription(
+    subscription_id: str,
+    update: WebhookSubscriptionUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user),
+    request: Request = None
+):
+    """Change or pause a webhook receiver - admin only"""
+    subscription = db.query(WebhookSubscription).filter(WebhookSubscription.id == subscription_id).first()
+    if not subscription:
+        raise NotFoundError("Webhook subscription", subscription_id)
+
+    update_data = update.model_dump(exclude_unset=True)
+    if "event_types" in update_data:
+        update_data["event_types"] = _validate_event_types(update_data["event_types"])
+    reactivated = update_data.get("active") is True and not subscription.active
+    for key, value in update_data.items():
+        setattr(subscription, key, value)
+
+    if reactivated:
+        # The backlog built up while paused is due right away
+        db.query(WebhookDelivery).filter(
+            WebhookDelivery.subscription_id == subscription.id,
+            WebhookDelivery.status == webhooks.PENDING
+        ).update({WebhookDelivery.next_attempt_at: datetime.utcnow()}, synchronize_session=False)
+
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("update", "webhook", subscription, f"Updated webhook subscription: {subscription.name}")
+    uow.after_commit(webhooks.subscriptions.clear)
+    if reactivated:
+        uow.after_commit(webhooks.dispatcher.wake)
+    uow.commit()
+
+    return _subscription_to_dict(subscription)
+
+
+@router.delete("/subscriptions/{subscription_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_subscription(
+    subscription_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user),
+    request: Request = None
+):
+    """Remove a webhook receiver and its delivery history - admin only"""
+    subscription = db.query(WebhookSubscription).filter(WebhookSubscription.id == subscription_id).first()
+    if not subscription:
+        raise NotFoundError("Webhook subscription", subscription_id)
+
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("delete", "webhook", subscription.id, f"Deleted webhook subscription: {subscription.name}")
+    uow.delete(subscription)
+    uow.after_commit(webhooks.subscriptions.clear)
+    uow.commit()
+
+    return None
+
+
+@router.get("/deliveries", response_model=List[WebhookDeliveryOut])
+async def list_deliveries(
+    delivery_status: Optional[str] = Query(None, alias="status"),
+    subscription_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """List deliveries, newest first; `status=dead` is the dead-letter queue - admin only"""
+    query = db.query(WebhookDelivery)
+    if delivery_status:
+        query = query.filter(WebhookDelivery.status == delivery_status)
+    if subscription_id:
+        query = query.filter(WebhookDelivery.subscription_id == subscription_id)
+    return query.order_by(WebhookDelivery.id.desc()).offset(skip).limit(limit).all()
+
+
+@router.post("/deliveries/{delivery_id}/retry", response_model=WebhookDeliveryOut)
+async def retry_delivery(
+    delivery_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user),
+    request: Request = None
+):
+    """Re-queue a dead delivery - admin only"""
+    delivery = db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery_id).first()
+    if not delivery:
+        raise NotFoundError("Webhook delivery", str(delivery_id))
+    if delivery.status != webhooks.DEAD:
+        raise BadRequestError("Only dead deliveries can be retried")
+
+    delivery.status = webhooks.PENDING
+    delivery.attempts = 0
+    delivery.next_attempt_at = datetime.utcnow()
+
+    uow = UnitOfWork(db, request, current_user)
+    uow.audit("retry", "webhook_delivery", str(delivery.id), f"Re-queued webhook delivery {delivery.id}")
+    uow.after_commit(webhooks.dispatcher.wake)
+    uow.commit()
+
+    return delivery
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional, List
+from typing import Any, Dict, List, Literal, Optional
 from datetime import datetime
 import re
 from db_models import VisitPurpose, VisitStatus
@@ -87,11 +87,65 @@ class VisitorOut(VisitorBase):
     has_photo: bool
     has_badge: bool
     visit_duration: Optional[float] = None
+    version: Optional[int] = None
 
     model_config = {
         "from_attributes": True
     }
 
+class VisitorChanges(BaseModel):
+    changes: List[VisitorOut]
+    deleted: List[str]
+    token: str
+    has_more: bool
+
+class BulkRowResult(BaseModel):
+    row: int  # 1-based position in the submitted list (CSV: data row, header excluded)
+    status: str  # "created", "error" or "skipped"
+    visitor_id: Optional[str] = None
+    qr_code: Optional[str] = None
+    expiry_time: Optional[datetime] = None
+    errors: Optional[List[str]] = None
+
+class BulkRegistrationOut(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkRowResult]
+
+class BulkVisitorAction(BaseModel):
+    visitor_ids: Optional[List[str]] = Field(None, min_length=1)
+    # Without visitor_ids: every visitor waiting for the action, for one host or for all of them
+    host_id: Optional[str] = None
+    all_hosts: bool = False
+    notes: Optional[str] = None
+
+class BulkActionItem(BaseModel):
+    visitor_id: str
+    status: Optional[VisitStatus] = None  # New status; None when the visitor was left unchanged
+    version: Optional[int] = None
+    qr_code: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkActionOut(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkActionItem]
+
+class ExpectedVisitor(BaseModel):
+    id: str
+    full_name: str
+    company: Optional[str] = None
+    purpose: VisitPurpose
+    host_id: str
+    host_name: str
+    scheduled_time: datetime
+    qr_code: Optional[str] = None
+
+class ExpectedArrivals(BaseModel):
+    window_start: datetime
+    window_end: datetime
+    visitors: List[ExpectedVisitor]
+
 # Badge Schemas
 class BadgeBase(BaseModel):
     visitor_id: str
@@ -106,6 +160,13 @@ class BadgeOut(BadgeBase):
         "from_attributes": True
     }
 
+class BadgeSheetRequest(BaseModel):
+    visitor_ids: Optional[List[str]] = Field(None, min_length=1)  # Printed in this order; filters are ignored
+    host_id: Optional[str] = None  # Admins only
+    status: Optional[VisitStatus] = None  # Defaults to visitors who can still use their badge
+    scheduled_from: Optional[datetime] = None
+    scheduled_to: Optional[datetime] = None
+
 # Approval Schemas
 class VisitApproval(BaseModel):
     approved: bool
@@ -142,6 +203,89 @@ class SystemLogOut(BaseModel):
         "from_attributes": True
     }
 
+class SystemLogPage(BaseModel):
+    items: List[SystemLogOut]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for the next (older) page
+
+# Import Schemas (import_data.py)
+class VisitorImport(VisitorCreate):
+    # host_id may also hold the host's username or email in legacy exports
+    status: VisitStatus = VisitStatus.CHECKED_OUT  # History rows default to completed visits
+    check_in_time: Optional[datetime] = None
+    check_out_time: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+# Webhook Schemas
+class WebhookSubscriptionCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    url: str = Field(..., pattern=r"^https?://", max_length=500)
+    event_types: List[str] = Field(..., min_length=1)
+    max_concurrency: int = Field(1, ge=1, le=20)
+
+class WebhookSubscriptionUpdate(BaseModel):
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    url: Optional[str] = Field(None, pattern=r"^https?://", max_length=500)
+    event_types: Optional[List[str]] = Field(None, min_length=1)
+    max_concurrency: Optional[int] = Field(None, ge=1, le=20)
+    active: Optional[bool] = None
+
+class WebhookSubscriptionOut(BaseModel):
+    id: str
+    name: str
+    url: str
+    event_types: List[str]
+    max_concurrency: int
+    active: bool
+    created_at: datetime
+    secret: Optional[str] = None  # Only returned when the subscription is created
+
+class WebhookDeliveryOut(BaseModel):
+    id: int
+    subscription_id: str
+    event_type: str
+    status: str
+    attempts: int
+    next_attempt_at: datetime
+    last_status_code: Optional[int] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    delivered_at: Optional[datetime] = None
+
+    model_config = {
+        "from_attributes": True
+    }
+
+# Report Schemas
+class ReportRequest(BaseModel):
+    report_type: Literal["visitor_summary", "host_activity"]
+    format: Literal["pdf", "csv", "xlsx"] = "pdf"
+    start_date: Optional[datetime] = None  # Defaults to the previous calendar month
+    end_date: Optional[datetime] = None
+    department: Optional[str] = Field(None, min_length=2, max_length=100)
+
+class ReportJobOut(BaseModel):
+    id: str
+    report_type: str
+    format: str
+    spec: Dict[str, Any]
+    status: str
+    progress: int
+    error: Optional[str] = None
+    artifact_size: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    download_url: Optional[str] = None  # Set once the report has succeeded
+
+# Profiler Schemas
+class ProfilerArm(BaseModel):
+    route_pattern: str = Field(..., min_length=1, max_length=200)
+    max_requests: Optional[int] = Field(None, ge=1, le=1000)
+    sample_rate: Optional[float] = Field(None, gt=0, le=1)
+    interval_ms: int = Field(5, ge=1, le=100)
+    duration_seconds: int = Field(3600, ge=1, le=86400)  # The session ends after this even if not used up
+
 # Error Schemas
 class ErrorResponse(BaseModel):
     detail: str
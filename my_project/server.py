@@ -0,0 +1,117 @@
+"""Production launcher.
+
+Prepares the database once, then serves the app with several worker
+processes: gunicorn with Uvicorn workers when gunicorn is installed
+(the app is preloaded and workers fork from it), or uvicorn's own process
+manager otherwise. uvloop and httptools are used when installed.
+
+Usage:
+    python server.py                      # SERVER_* settings from .env
+    python server.py --workers 4 --port 8080
+"""
+import os
+
+# Workers must not repeat the schema/seed work done below; this has to be
+# set before config is imported anywhere
+os.environ["INIT_DB_ON_STARTUP"] = "false"
+
+import argparse
+import importlib.util
+import logging
+
+from config import get_settings
+from bootstrap import prepare_database
+from db_connection import dispose_engines
+
+logger = logging.getLogger("server")
+
+settings = get_settings()
+
+
+def _gunicorn_worker_class():
+    # The worker moved to the uvicorn-worker package in newer uvicorn releases
+    if importlib.util.find_spec("uvicorn_worker"):
+        return "uvicorn_worker.UvicornWorker"
+    return "uvicorn.workers.UvicornWorker"
+
+
+def _post_fork(server, worker):
+    # Connections opened in the master belong to the master: give each
+    # worker fresh pools without closing the inherited sockets
+    dispose_engines(close=False)
+
+
+def run_gunicorn(host: str, port: int, workers: int):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import create_app
+            return create_app()
+
+    Application({
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": _gunicorn_worker_class(),
+        "preload_app": True,
+        "post_fork": _post_fork,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+        "loglevel": "debug" if settings.DEBUG else "info",
+    }).run()
+
+
+def run_uvicorn(host: str, port: int, workers: int):
+    import uvicorn
+
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT,
+        log_level="debug" if settings.DEBUG else "info"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument(
+        "--server", choices=["auto", "gunicorn", "uvicorn"], default="auto",
+        help="process manager (auto: gunicorn when installed)"
+    )
+    args = parser.parse_args()
+
+    prepare_database()
+    # Nothing opened here should outlive the fork
+    dispose_engines()
+
+    logger.info(
+        f"Event loop: {'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'}, "
+        f"HTTP parser: {'httptools' if importlib.util.find_spec('httptools') else 'h11'}"
+    )
+
+    use_gunicorn = args.server == "gunicorn" or (args.server == "auto" and importlib.util.find_spec("gunicorn"))
+    if use_gunicorn:
+        logger.info(f"Starting gunicorn with {args.workers} workers on {args.host}:{args.port}")
+        run_gunicorn(args.host, args.port, args.workers)
+    else:
+        logger.info(f"Starting uvicorn with {args.workers} workers on {args.host}:{args.port}")
+        run_uvicorn(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from sqlalchemy import Date, Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import functions
+from sqlalchemy.sql.functions import GenericFunction
+
+
+class minutes_between(GenericFunction):
+    """Minutes elapsed between two DATETIME expressions, on any supported dialect"""
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(minutes_between)
+def _minutes_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    # Seconds, so partial minutes count as on the other dialects instead of being truncated
+    return f"(TIMESTAMPDIFF(SECOND, {compiler.process(start, **kw)}, {compiler.process(end, **kw)}) / 60.0)"
+
+
+@compiles(minutes_between, "sqlite")
+def _minutes_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"((julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)})) * 1440.0)"
+
+
+@compiles(minutes_between, "postgresql")
+def _minutes_between_postgresql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"(EXTRACT(EPOCH FROM ({compiler.process(end, **kw)} - {compiler.process(start, **kw)})) / 60.0)"
+
+
+class date_of(GenericFunction):
+    """Calendar date of a DATETIME expression, returned as a Python date"""
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(date_of)
+def _date_of_default(element, compiler, **kw):
+    return f"DATE({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(date_of, "postgresql")
+def _date_of_postgresql(element, compiler, **kw):
+    return f"CAST({compiler.process(element.clauses, **kw)} AS DATE)"
+
+
+@compiles(functions.now, "sqlite")
+def _now_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP has no fractional part, which breaks string comparison
+    # against the microsecond format SQLAlchemy uses for bound datetimes
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
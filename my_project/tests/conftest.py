@@ -0,0 +1,68 @@
+"""Shared test setup.
+
+The application modules live flat in my_project/ and read their settings
+(and `.env`) relative to it, so tests run from there against a throwaway
+SQLite database.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_data_dir = tempfile.mkdtemp(prefix="vms-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_data_dir}/vms.db"
+os.environ["DEBUG"] = "false"
+os.environ["PROFILER_OUTPUT_DIR"] = os.path.join(_data_dir, "profiles")
+os.environ["REPORT_OUTPUT_DIR"] = os.path.join(_data_dir, "reports")
+os.chdir(PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+
+def visitor_payload(host_id: str, **overrides) -> dict:
+    """Body for POST /visitors/ with an email unique to the call"""
+    payload = {
+        "full_name": "Test Visitor",
+        "email": f"visitor-{uuid.uuid4().hex[:12]}@example.com",
+        "phone": "+15550000000",
+        "purpose": "meeting",
+        "host_id": host_id,
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture(scope="session")
+def api() -> str:
+    from config import get_settings
+    return get_settings().API_PREFIX
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    # Entering runs the startup hook: schema, default admin, dispatchers
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client, api) -> dict:
+    response = client.post(f"{api}/auth/token", data={"username": "admin", "password": "Admin123!"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def host_id(client, api, admin_headers) -> str:
+    response = client.post(f"{api}/users/", headers=admin_headers, json={
+        "username": "testhost", "email": "testhost@example.com", "full_name": "Test Host",
+        "department": "Engineering", "password": "TestPass123"
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
@@ -0,0 +1,148 @@
+"""POST /badges/sheet and the QR encoding behind it"""
+import re
+import uuid
+import zlib
+
+import pytest
+
+from conftest import visitor_payload
+
+
+def parse_pdf(data: bytes) -> dict:
+    """Check the cross-reference table and return the page count and the text drawn on each page"""
+    assert data.startswith(b"%PDF-1.4\n") and data.endswith(b"%%EOF\n")
+    xref_offset = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", data).group(1))
+    assert data[xref_offset:].startswith(b"xref\n")
+    count = int(re.match(rb"xref\n0 (\d+)\n", data[xref_offset:]).group(1))
+    entries = re.findall(rb"(\d{10}) 00000 n \n", data[xref_offset:])
+    assert len(entries) == count - 1
+    # Every object is where the table says
+    for object_id, offset in enumerate(entries, start=1):
+        assert data[int(offset):].startswith(f"{object_id} 0 obj\n".encode())
+
+    pages_count = int(re.search(rb"/Type /Pages /Kids \[[^\]]*\] /Count (\d+)", data).group(1))
+    page_objects = re.findall(rb"/Type /Page /Parent", data)
+    assert len(page_objects) == pages_count
+
+    texts = []
+    for match in re.finditer(rb"/Length (\d+) /Filter /FlateDecode >>\nstream\n", data):
+        stream = data[match.end():match.end() + int(match.group(1))]
+        texts.append(zlib.decompress(stream).decode("latin-1"))
+    return {"pages": pages_count, "texts": texts}
+
+
+@pytest.fixture(scope="module")
+def sheet_host(client, api, admin_headers) -> dict:
+    """A non-admin host with twelve approved visitors, so badges were issued"""
+    name = f"sheet{uuid.uuid4().hex[:8]}"
+    response = client.post(f"{api}/users/", headers=admin_headers, json={
+        "username": name, "email": f"{name}@example.com", "full_name": "Sheet Host",
+        "department": "Printing", "password": "SheetPass123"
+    })
+    assert response.status_code == 201, response.text
+    host = response.json()
+
+    visitor_ids = []
+    for number in range(12):
+        response = client.post(f"{api}/visitors/", headers=admin_headers,
+                               json=visitor_payload(host["id"], full_name=f"Sheet Visitor {number:02d}"))
+        assert response.status_code == 201, response.text
+        visitor_id = response.json()["id"]
+        response = client.post(f"{api}/visitors/{visitor_id}/approval", json={"approved": True}, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        visitor_ids.append(visitor_id)
+
+    response = client.post(f"{api}/auth/token", data={"username": name, "password": "SheetPass123"})
+    return {"id": host["id"], "visitor_ids": visitor_ids,
+            "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+
+
+@pytest.mark.parametrize("count", [1, 10, 11, 12])
+def test_sheet_has_ten_badges_a_page(client, api, admin_headers, sheet_host, count):
+    response = client.post(f"{api}/badges/sheet", headers=admin_headers,
+                           json={"visitor_ids": sheet_host["visitor_ids"][:count]})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-disposition"].startswith('attachment; filename="badges-')
+
+    document = parse_pdf(response.content)
+    assert document["pages"] == -(-count // 10)
+    text = "".join(document["texts"])
+    assert text.count("(VISITOR) Tj") == count
+
+
+def test_badges_follow_the_requested_order(client, api, admin_headers, sheet_host):
+    ids = list(reversed(sheet_host["visitor_ids"][:3]))
+    response = client.post(f"{api}/badges/sheet", headers=admin_headers, json={"visitor_ids": ids})
+    text = parse_pdf(response.content)["texts"][0]
+    names = re.findall(r"\((Sheet Visitor \d+)\) Tj", text)
+    assert names == ["Sheet Visitor 02", "Sheet Visitor 01", "Sheet Visitor 00"]
+
+
+def test_host_only_gets_their_own_visitors(client, api, admin_headers, host_id, sheet_host):
+    # Someone else's approved visitor
+    response = client.post(f"{api}/visitors/", headers=admin_headers,
+                           json=visitor_payload(host_id, full_name="Not Their Visitor"))
+    other_id = response.json()["id"]
+    client.post(f"{api}/visitors/{other_id}/approval", json={"approved": True}, headers=admin_headers)
+
+    # By filter: all twelve of theirs, nobody else's, even when asking for another host
+    response = client.post(f"{api}/badges/sheet", headers=sheet_host["headers"], json={"host_id": host_id})
+    assert response.status_code == 200, response.text
+    document = parse_pdf(response.content)
+    text = "".join(document["texts"])
+    assert document["pages"] == 2
+    assert text.count("(VISITOR) Tj") == 12
+    assert "Not Their Visitor" not in text
+
+    # By id: the other host's visitor is left out
+    response = client.post(f"{api}/badges/sheet", headers=sheet_host["headers"],
+                           json={"visitor_ids": [other_id, sheet_host["visitor_ids"][0]]})
+    text = "".join(parse_pdf(response.content)["texts"])
+    assert text.count("(VISITOR) Tj") == 1 and "Not Their Visitor" not in text
+
+    response = client.post(f"{api}/badges/sheet", headers=sheet_host["headers"], json={"visitor_ids": [other_id]})
+    assert response.status_code == 404
+
+
+def test_too_many_badges(client, api, admin_headers, sheet_host, monkeypatch):
+    from config import get_settings
+
+    monkeypatch.setattr(get_settings(), "BADGE_SHEET_MAX_BADGES", 5)
+    response = client.post(f"{api}/badges/sheet", headers=admin_headers,
+                           json={"visitor_ids": sheet_host["visitor_ids"][:6]})
+    assert response.status_code == 400
+    # Matched by filter rather than listed
+    response = client.post(f"{api}/badges/sheet", headers=sheet_host["headers"], json={})
+    assert response.status_code == 400
+    assert "narrow the filters" in response.json()["detail"]
+
+
+def test_no_matching_badges(client, api, admin_headers, sheet_host):
+    response = client.post(f"{api}/badges/sheet", headers=admin_headers, json={"visitor_ids": [str(uuid.uuid4())]})
+    assert response.status_code == 404
+    response = client.post(f"{api}/badges/sheet", headers=sheet_host["headers"], json={"status": "checked_out"})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("value", ["VMS-1234", "x" * 120])
+def test_qr_runs_cover_exactly_the_dark_modules(value):
+    import qrcode
+    from badge_sheets import qr_runs
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=4)
+    qr.add_data(value)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    [(size, runs)] = qr_runs([value])
+    assert size == len(matrix)
+    rebuilt = [[False] * size for _ in range(size)]
+    for row, column, length in runs:
+        assert length > 0
+        # Runs are maximal: never next to another dark module in the same row
+        assert column == 0 or not matrix[row][column - 1]
+        assert column + length == size or not matrix[row][column + length]
+        for x in range(column, column + length):
+            rebuilt[row][x] = True
+    assert rebuilt == [list(map(bool, row)) for row in matrix]
@@ -0,0 +1,67 @@
+"""Exported cells that a spreadsheet would run as formulas"""
+import csv
+import io
+import json
+
+import pytest
+
+from conftest import visitor_payload
+
+
+@pytest.mark.parametrize("value, expected", [
+    ('=HYPERLINK("x") 0', '\'=HYPERLINK("x") 0'),
+    ("+15550000000", "'+15550000000"),
+    ("-2+3", "'-2+3"),
+    ("@SUM(A1)", "'@SUM(A1)"),
+    ("\tTab", "'\tTab"),
+    ("\rReturn", "'\rReturn"),
+    ("Acme = Widgets", "Acme = Widgets"),
+    ("-", "-"),
+    (-5, -5),
+    (None, None),
+])
+def test_spreadsheet_safe(value, expected):
+    from exports import spreadsheet_safe
+
+    assert spreadsheet_safe(value) == expected
+
+
+def test_visitor_export_neutralizes_formulas(client, api, admin_headers, host_id):
+    name = '=HYPERLINK("x") 0'
+    response = client.post(f"{api}/visitors/", headers=admin_headers,
+                           json=visitor_payload(host_id, full_name=name, company="@Evil"))
+    assert response.status_code == 201, response.text
+
+    response = client.get(f"{api}/exports/visitors", headers=admin_headers,
+                          params={"format": "csv", "fields": "full_name,company,phone"})
+    assert response.status_code == 200
+    exported = [row for row in csv.DictReader(io.StringIO(response.text)) if row["full_name"].endswith(name)]
+    assert [row["full_name"] for row in exported] == ["'" + name]
+    assert exported[0]["company"] == "'@Evil"
+    assert exported[0]["phone"] == "'+15550000000"
+
+    # NDJSON is data, not a spreadsheet: values are exported as given
+    response = client.get(f"{api}/exports/visitors", headers=admin_headers,
+                          params={"format": "ndjson", "fields": "full_name"})
+    assert {"full_name": name} in [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_report_writers_neutralize_formulas(tmp_path):
+    import reports
+
+    spec = {"report_type": "host_activity", "start_date": "2024-01-01T00:00:00", "end_date": "2024-02-01T00:00:00",
+            "department": None}
+    sections = [reports.Section("Hosts", ["Host", "Visits"], [['=cmd|"/c calc"!A1', 3], ["Plain", 1]])]
+    path = str(tmp_path / "report.csv")
+    reports._write_csv(spec, sections, path)
+    with open(path, newline="") as f:
+        cells = [cell for row in csv.reader(f) for cell in row]
+    assert '\'=cmd|"/c calc"!A1' in cells
+    assert '=cmd|"/c calc"!A1' not in cells
+
+    if reports.openpyxl is not None:
+        path = str(tmp_path / "report.xlsx")
+        reports._write_xlsx(spec, sections, path)
+        sheet = reports.openpyxl.load_workbook(path).active
+        values = [cell.value for row in sheet.iter_rows() for cell in row]
+        assert '\'=cmd|"/c calc"!A1' in values
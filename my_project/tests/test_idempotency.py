@@ -0,0 +1,94 @@
+"""Idempotency-Key replay, reuse and conflict handling on POST /visitors/self-register"""
+from types import SimpleNamespace
+import uuid
+
+import pytest
+
+from conftest import visitor_payload
+
+
+def _key() -> dict:
+    return {"Idempotency-Key": uuid.uuid4().hex}
+
+
+def _visitors_with_email(client, api, admin_headers, email: str) -> list:
+    response = client.get(f"{api}/visitors/?limit=1000", headers=admin_headers)
+    return [visitor for visitor in response.json() if visitor["email"] == email]
+
+
+def test_retry_replays_the_first_response(client, api, admin_headers, host_id):
+    payload = visitor_payload(host_id)
+    headers = _key()
+
+    first = client.post(f"{api}/visitors/self-register", json=payload, headers=headers)
+    retry = client.post(f"{api}/visitors/self-register", json=payload, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.json() == first.json()
+    assert len(_visitors_with_email(client, api, admin_headers, payload["email"])) == 1
+
+
+def test_replay_survives_a_cold_cache(client, api, host_id):
+    import idempotency
+
+    payload = visitor_payload(host_id)
+    headers = _key()
+    first = client.post(f"{api}/visitors/self-register", json=payload, headers=headers)
+    idempotency.store._cache.clear()
+
+    retry = client.post(f"{api}/visitors/self-register", json=payload, headers=headers)
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry.json() == first.json()
+
+
+def test_key_reused_with_another_body_is_rejected(client, api, host_id):
+    headers = _key()
+    assert client.post(f"{api}/visitors/self-register", json=visitor_payload(host_id), headers=headers).status_code == 201
+
+    response = client.post(f"{api}/visitors/self-register", json=visitor_payload(host_id), headers=headers)
+    assert response.status_code == 422
+
+
+def test_errors_are_not_stored(client, api, admin_headers):
+    headers = dict(admin_headers, **_key())
+    for _ in range(2):
+        response = client.post(f"{api}/visitors/{uuid.uuid4()}/check-in", headers=headers)
+        assert response.status_code == 404
+        assert "Idempotent-Replayed" not in response.headers
+
+
+def test_lost_response_conflicts_instead_of_running_again(client, api, admin_headers, host_id, monkeypatch):
+    import idempotency
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("worker died before storing the response")
+
+    payload = visitor_payload(host_id)
+    headers = _key()
+    monkeypatch.setattr(idempotency.store, "complete", crash)
+    assert client.post(f"{api}/visitors/self-register", json=payload, headers=headers).status_code == 201
+    monkeypatch.undo()
+
+    retry = client.post(f"{api}/visitors/self-register", json=payload, headers=headers)
+    assert retry.status_code == 409
+    assert len(_visitors_with_email(client, api, admin_headers, payload["email"])) == 1
+
+
+def test_attempt_whose_key_was_taken_over_cannot_commit(client, api, host_id):
+    import idempotency
+    from db_connection import SessionLocal
+    from db_models import IdempotencyKey
+    from error_handlers import ConflictError
+
+    client.post(f"{api}/visitors/self-register", json=visitor_payload(host_id), headers=_key())
+    db = SessionLocal()
+    try:
+        scope = db.query(IdempotencyKey.key).first().key
+        stale = SimpleNamespace(state=SimpleNamespace(idempotency_claim=(scope, "not-the-holder")))
+        with pytest.raises(ConflictError):
+            idempotency.store.mark_committed(db, stale)
+    finally:
+        db.rollback()
+        db.close()
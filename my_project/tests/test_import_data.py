@@ -0,0 +1,129 @@
+"""Offline import: unreadable lines, line numbers and resuming from import_progress"""
+import json
+import uuid
+
+import pytest
+
+
+def _visitor(company: str, host: str = "testhost") -> str:
+    return json.dumps({
+        "full_name": "Imported Visitor",
+        "email": f"imported-{uuid.uuid4().hex[:12]}@example.com",
+        "phone": "+15550000000",
+        "purpose": "meeting",
+        "host_id": host,
+        "company": company,
+        "created_at": "2023-01-05T10:00:00"
+    })
+
+
+@pytest.fixture
+def history(tmp_path, host_id):
+    """NDJSON history with a blank, a malformed, a non-object and an unresolvable line"""
+    company = f"Import {uuid.uuid4().hex[:8]}"
+    lines = [
+        _visitor(company),                  # 1
+        "",                                 # 2
+        _visitor(company),                  # 3
+        '{"full_name": "Broken",',          # 4
+        "[1, 2, 3]",                        # 5
+        _visitor(company, host="nobody"),   # 6
+        _visitor(company),                  # 7
+        _visitor(company),                  # 8
+    ]
+    path = tmp_path / "history.ndjson"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path), company
+
+
+def _imported(company: str) -> int:
+    from db_connection import SessionLocal
+    from db_models import Visitor
+
+    db = SessionLocal()
+    try:
+        return db.query(Visitor).filter(Visitor.company == company).count()
+    finally:
+        db.close()
+
+
+def _run(path: str, **kwargs):
+    import import_data
+
+    checkpoint = import_data.Checkpoint("visitors", path)
+    import_data.run_import("visitors", path, 1, 2, checkpoint, path + ".errors.ndjson", False, **kwargs)
+    return checkpoint
+
+
+def test_read_rows_reports_unreadable_lines_by_file_line(history):
+    import import_data
+
+    path, _ = history
+    rows = list(import_data.read_rows(path))
+    assert [number for number, _, _ in rows] == [1, 3, 4, 5, 6, 7, 8]
+    errors = {number: error for number, row, error in rows if error}
+    assert errors[4].startswith("invalid JSON")
+    assert errors[5] == "expected a JSON object, got list"
+
+
+def test_import_rejects_bad_lines_and_loads_the_rest(history):
+    from db_connection import SessionLocal
+    from db_models import ImportProgress
+
+    path, company = history
+    checkpoint = _run(path)
+
+    assert (checkpoint.inserted, checkpoint.rejected) == (4, 3)
+    assert _imported(company) == 4
+    with open(path + ".errors.ndjson") as f:
+        assert [json.loads(line)["row"] for line in f] == [4, 5, 6]
+
+    db = SessionLocal()
+    try:
+        # A finished import leaves no progress behind
+        assert db.get(ImportProgress, checkpoint.key) is None
+    finally:
+        db.close()
+
+
+def test_resume_skips_committed_lines(history):
+    import import_data
+    from db_connection import SessionLocal
+
+    path, company = history
+    # As if an earlier run had committed the chunk ending at line 3 and then died
+    db = SessionLocal()
+    try:
+        checkpoint = import_data.Checkpoint("visitors", path)
+        checkpoint.load(db)
+        checkpoint.rows_done, checkpoint.inserted = 3, 2
+        checkpoint.stage(db)
+        db.commit()
+    finally:
+        db.close()
+
+    checkpoint = _run(path)
+    assert _imported(company) == 2
+    assert (checkpoint.inserted, checkpoint.rejected) == (4, 3)
+
+
+def test_changed_file_is_not_resumed(history):
+    import import_data
+    from db_connection import SessionLocal
+
+    path, _ = history
+    db = SessionLocal()
+    try:
+        checkpoint = import_data.Checkpoint("visitors", path)
+        checkpoint.load(db)
+        checkpoint.rows_done = 3
+        checkpoint.stage(db)
+        db.commit()
+
+        with open(path, "a") as f:
+            f.write(_visitor("Other") + "\n")
+        with pytest.raises(SystemExit):
+            import_data.Checkpoint("visitors", path).load(db)
+        import_data.Checkpoint("visitors", path).discard(db)
+    finally:
+        db.close()
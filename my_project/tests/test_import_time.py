@@ -0,0 +1,64 @@
+"""Import-time budgets for the modules that are deferred until first use.
+
+Each check runs `python -X importtime` in a fresh interpreter and adds up
+the cumulative time of the outermost heavy modules it loaded.
+"""
+import os
+import subprocess
+import sys
+
+from conftest import PROJECT_DIR
+
+# Loaded only by the routes and jobs that need them
+HEAVY_MODULES = {
+    "reports", "pdf", "badge_sheets", "webhooks",
+    "qrcode", "PIL", "reportlab", "openpyxl", "httpx", "passlib", "bcrypt",
+}
+
+# Microseconds
+IMPORT_MAIN_BUDGET = 0
+CREATE_APP_BUDGET = 150_000
+
+
+def heavy_import_time(code: str) -> int:
+    """Cumulative microseconds spent importing HEAVY_MODULES while running `code`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True
+    )
+    # Children are printed before their parent, one level deeper; keep only
+    # the outermost heavy module of each chain so nothing is counted twice
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, int(cumulative), name.strip()))
+
+    total = 0
+    for index, (depth, cumulative, name) in enumerate(entries):
+        if name.split(".")[0] not in HEAVY_MODULES:
+            continue
+        # Parents follow their children: skip it if a later, shallower line is heavy
+        outer = depth
+        nested = False
+        for later_depth, _, later_name in entries[index + 1:]:
+            if later_depth < outer:
+                outer = later_depth
+                if later_name.split(".")[0] in HEAVY_MODULES:
+                    nested = True
+                    break
+        if not nested:
+            total += cumulative
+    return total
+
+
+def test_import_main_skips_heavy_modules():
+    assert heavy_import_time("import main") <= IMPORT_MAIN_BUDGET
+
+
+def test_create_app_heavy_imports_within_budget():
+    assert heavy_import_time("import main; main.create_app()") <= CREATE_APP_BUDGET
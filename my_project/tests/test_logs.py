@@ -0,0 +1,227 @@
+"""GET /logs search and system log retention"""
+from datetime import date, datetime, timedelta
+import uuid
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture(scope="module")
+def seeded_logs(client, host_id) -> dict:
+    """Ten log rows of an entity type no other test uses, one a day from 2025-03-01"""
+    from db_connection import SessionLocal
+    from db_models import SystemLog
+
+    entity_type = f"logtest-{uuid.uuid4().hex[:8]}"
+    addresses = ["10.9.3.1", "10.9.3.25", "10.9.30.4", "192.168.0.7", "10.9.3.%"]
+    db = SessionLocal()
+    try:
+        rows = [
+            SystemLog(
+                action="create" if number % 2 else "update",
+                entity_type=entity_type,
+                entity_id=f"entity-{number % 3}",
+                user_id=host_id if number < 4 else None,
+                ip_address=addresses[number % len(addresses)],
+                details=f"Row {number}",
+                created_at=datetime(2025, 3, 1) + timedelta(days=number)
+            )
+            for number in range(10)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return {"entity_type": entity_type, "ids": sorted((row.id for row in rows), reverse=True)}
+    finally:
+        db.close()
+
+
+def _logs(client, api, headers, **params) -> dict:
+    response = client.get(f"{api}/logs/", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _details(page: dict) -> set:
+    return {item["details"] for item in page["items"]}
+
+
+def test_entity_type_lists_newest_first(client, api, admin_headers, seeded_logs):
+    page = _logs(client, api, admin_headers, entity_type=seeded_logs["entity_type"])
+    assert [item["id"] for item in page["items"]] == seeded_logs["ids"]
+    assert page["next_cursor"] is None
+
+
+@pytest.mark.parametrize("params, numbers", [
+    ({"entity_id": "entity-1"}, {1, 4, 7}),
+    ({"action": "create"}, {1, 3, 5, 7, 9}),
+    ({"ip_address": "10.9.3.25"}, {1, 6}),
+    # A prefix stops at the dot, and LIKE wildcards in it are literal
+    ({"ip_address": "10.9.3.*"}, {0, 1, 4, 5, 6, 9}),
+    ({"ip_address": "10.9.3.%*"}, {4, 9}),
+    ({"start_date": "2025-03-04T00:00:00", "end_date": "2025-03-06T00:00:00"}, {3, 4, 5}),
+])
+def test_filters(client, api, admin_headers, seeded_logs, params, numbers):
+    page = _logs(client, api, admin_headers, entity_type=seeded_logs["entity_type"], **params)
+    assert _details(page) == {f"Row {number}" for number in numbers}
+
+
+def test_user_filter_includes_the_user(client, api, admin_headers, seeded_logs, host_id):
+    page = _logs(client, api, admin_headers, entity_type=seeded_logs["entity_type"], user_id=host_id)
+    assert _details(page) == {f"Row {number}" for number in range(4)}
+    assert all(item["user"]["username"] == "testhost" for item in page["items"])
+
+
+def test_cursor_pages_have_no_gaps_or_repeats(client, api, admin_headers, seeded_logs):
+    seen, cursor = [], None
+    for _ in range(10):
+        params = {"entity_type": seeded_logs["entity_type"], "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = _logs(client, api, admin_headers, **params)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == seeded_logs["ids"]
+
+
+@pytest.mark.parametrize("params", [
+    {"cursor": "not base64!"},
+    {"cursor": "YWJj"},  # "abc"
+    {"entity_id": "entity-1"},  # Without entity_type
+    {"limit": 100000},
+])
+def test_bad_requests(client, api, admin_headers, params):
+    response = client.get(f"{api}/logs/", headers=admin_headers, params=params)
+    assert response.status_code == 400
+
+
+def test_admin_only(client, api, host_id):
+    response = client.post(f"{api}/auth/token", data={"username": "testhost", "password": "TestPass123"})
+    token = response.json()["access_token"]
+    response = client.get(f"{api}/logs/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+class StubConnection:
+    """Answers the information_schema and MIN(created_at) queries of build_partition_statements"""
+
+    def __init__(self, constraints, oldest):
+        self.constraints = constraints
+        self.oldest = oldest
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if "REFERENTIAL_CONSTRAINTS" in sql:
+            return [type("Row", (), {"CONSTRAINT_NAME": name}) for name in self.constraints]
+        assert "MIN(`created_at`)" in sql
+        return type("Result", (), {"scalar": lambda _: self.oldest})()
+
+
+def test_partition_statements(monkeypatch):
+    import log_retention
+
+    monkeypatch.setattr(log_retention.settings, "LOG_RETENTION_MONTHS", 24)
+    monkeypatch.setattr(log_retention.settings, "LOG_PARTITIONS_AHEAD", 3)
+    statements = log_retention.build_partition_statements(
+        StubConnection(["system_logs_ibfk_1"], datetime(2024, 11, 17, 9, 30)), date(2025, 1, 15)
+    )
+    assert statements[0] == "ALTER TABLE `system_logs` DROP FOREIGN KEY `system_logs_ibfk_1`"
+    assert "ADD PRIMARY KEY (`id`, `created_at`)" in statements[2]
+    partitioning = statements[-1]
+    # From the oldest row's month, across the new year, to three months ahead
+    assert "PARTITION p202411 VALUES LESS THAN ('2024-12-01')" in partitioning
+    assert "PARTITION p202412 VALUES LESS THAN ('2025-01-01')" in partitioning
+    assert "PARTITION p202504 VALUES LESS THAN ('2025-05-01')" in partitioning
+    assert "p202505" not in partitioning
+    assert partitioning.rstrip().endswith("PARTITION pmax VALUES LESS THAN (MAXVALUE)\n)")
+
+
+def test_partition_statements_fold_expired_rows_into_the_first_partition(monkeypatch):
+    import log_retention
+
+    monkeypatch.setattr(log_retention.settings, "LOG_RETENTION_MONTHS", 2)
+    monkeypatch.setattr(log_retention.settings, "LOG_PARTITIONS_AHEAD", 1)
+    statements = log_retention.build_partition_statements(StubConnection([], datetime(2019, 6, 1)), date(2025, 5, 10))
+    assert len(statements) == 3
+    # Retention starts at March; February takes everything older and is dropped by the next run
+    assert "PARTITION p202502 VALUES LESS THAN ('2025-03-01')" in statements[-1]
+    assert "p202501" not in statements[-1] and "p2019" not in statements[-1]
+    assert "PARTITION p202506 VALUES LESS THAN ('2025-07-01')" in statements[-1]
+
+
+def test_retention_adds_months_across_the_year_and_drops_expired(monkeypatch):
+    import log_retention
+
+    monkeypatch.setattr(log_retention.settings, "LOG_RETENTION_MONTHS", 2)
+    monkeypatch.setattr(log_retention.settings, "LOG_PARTITIONS_AHEAD", 2)
+    partitions = ["p202409", "p202410", "p202411", "p202412", "pmax"]
+    statements, expired = log_retention.build_retention_statements(partitions, date(2024, 12, 5), archive=False)
+
+    assert expired == ["p202409"]
+    assert statements[0].startswith("ALTER TABLE `system_logs` REORGANIZE PARTITION pmax INTO (")
+    assert "PARTITION p202501 VALUES LESS THAN ('2025-02-01')" in statements[0]
+    assert "PARTITION p202502 VALUES LESS THAN ('2025-03-01')" in statements[0]
+    assert "p202503" not in statements[0]
+    assert statements[1:] == ["ALTER TABLE `system_logs` DROP PARTITION p202409"]
+
+
+def test_retention_archives_before_dropping(monkeypatch):
+    import log_retention
+
+    monkeypatch.setattr(log_retention.settings, "LOG_RETENTION_MONTHS", 1)
+    monkeypatch.setattr(log_retention.settings, "LOG_PARTITIONS_AHEAD", 0)
+    statements, expired = log_retention.build_retention_statements(
+        ["p202402", "p202403", "p202404", "pmax"], date(2024, 4, 20), archive=True
+    )
+    assert expired == ["p202402"]
+    # Nothing ahead is missing, so pmax is left alone
+    assert statements == [
+        "CREATE TABLE `system_logs_p202402` LIKE `system_logs`",
+        "ALTER TABLE `system_logs_p202402` REMOVE PARTITIONING",
+        "ALTER TABLE `system_logs` EXCHANGE PARTITION p202402 WITH TABLE `system_logs_p202402`",
+        "ALTER TABLE `system_logs` DROP PARTITION p202402",
+    ]
+
+
+def test_delete_expired_in_batches(client, monkeypatch):
+    import log_retention
+    from db_connection import SessionLocal
+    from db_models import SystemLog
+
+    monkeypatch.setattr(log_retention.settings, "LOG_RETENTION_MONTHS", 1)
+    monkeypatch.setattr(log_retention.settings, "LOG_RETENTION_BATCH_SIZE", 3)
+    # Long before anything else in the database, so only these rows expire
+    today = date(1990, 6, 15)
+    entity_type = f"retention-{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        db.add_all(
+            SystemLog(action="old", entity_type=entity_type, entity_id=str(number), created_at=datetime(1990, 4, 1 + number))
+            for number in range(7)
+        )
+        # The cutoff is 1990-05-01: the first day of the oldest month kept
+        db.add(SystemLog(action="kept", entity_type=entity_type, entity_id="kept", created_at=datetime(1990, 5, 1)))
+        db.commit()
+    finally:
+        db.close()
+
+    assert log_retention.delete_expired(today, dry_run=True) == 7
+
+    commits = []
+    listener = lambda session: commits.append(session)  # noqa: E731
+    event.listen(Session, "after_commit", listener)
+    try:
+        assert log_retention.delete_expired(today, dry_run=False) == 7
+    finally:
+        event.remove(Session, "after_commit", listener)
+    # One short transaction per batch
+    assert len(commits) == 3
+
+    db = SessionLocal()
+    try:
+        remaining = db.query(SystemLog.action).filter(SystemLog.entity_type == entity_type).all()
+        assert [row.action for row in remaining] == ["kept"]
+    finally:
+        db.close()
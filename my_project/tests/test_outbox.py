@@ -0,0 +1,217 @@
+"""Host notification outbox: staging with the change, claiming, retries, dedupe and digests"""
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+
+from conftest import visitor_payload
+
+# Earlier than anything else in the outbox, so these rows are claimed first
+LONG_AGO = datetime(2000, 1, 1)
+
+
+class RecordingConnection:
+    """Stands in for the pooled SMTP connection"""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.sent = []
+
+    def send(self, email):
+        if self.error:
+            raise self.error
+        self.sent.append(email)
+
+    def close(self, idle_only: bool = False):
+        pass
+
+
+def _stage(*messages, **columns) -> list:
+    """Insert (recipient, dedupe_key) outbox rows, due long ago; returns their ids"""
+    from db_connection import SessionLocal
+    from db_models import OutboxMessage
+
+    db = SessionLocal()
+    try:
+        rows = [
+            OutboxMessage(kind="visitor_registered", recipient=recipient, subject=f"Subject {number}",
+                          body="Body", dedupe_key=key, next_attempt_at=LONG_AGO, **columns)
+            for number, (recipient, key) in enumerate(messages)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+def _rows(ids) -> list:
+    from db_connection import SessionLocal
+    from db_models import OutboxMessage
+
+    db = SessionLocal()
+    try:
+        return db.query(OutboxMessage).filter(OutboxMessage.id.in_(ids)).order_by(OutboxMessage.id).all()
+    finally:
+        db.close()
+
+
+def _dispatch(monkeypatch, batch_size: int, connection: RecordingConnection) -> int:
+    import outbox
+
+    monkeypatch.setattr(outbox.settings, "OUTBOX_BATCH_SIZE", batch_size)
+    dispatcher = outbox.OutboxDispatcher()
+    dispatcher._connection = connection
+    return dispatcher.dispatch_once()
+
+
+def _recipient() -> str:
+    return f"host-{uuid.uuid4().hex[:8]}@example.com"
+
+
+def test_notification_is_staged_with_the_registration(client, api, host_id):
+    from db_connection import SessionLocal
+    from db_models import OutboxMessage
+
+    response = client.post(f"{api}/visitors/self-register", json=visitor_payload(host_id, full_name="Outbox Guest"))
+    assert response.status_code == 201, response.text
+    visitor_id = response.json()["visitor_id"]
+
+    db = SessionLocal()
+    try:
+        message = db.query(OutboxMessage).filter(OutboxMessage.dedupe_key == f"visitor_registered:{visitor_id}:1").one()
+        assert (message.recipient, message.status) == ("testhost@example.com", "pending")
+        assert message.subject == "Visitor awaiting approval: Outbox Guest"
+    finally:
+        db.close()
+
+
+def test_nothing_is_staged_when_the_change_rolls_back(client, host_id, monkeypatch):
+    import outbox
+    import webhooks
+    from db_connection import SessionLocal
+    from db_models import OutboxMessage, Visitor
+    from unit_of_work import UnitOfWork
+
+    def fail(*args):
+        raise RuntimeError("commit interrupted")
+
+    # Runs after the outbox insert and before the commit
+    monkeypatch.setattr(webhooks, "stage_deliveries", fail)
+    db = SessionLocal()
+    try:
+        visitor = Visitor(full_name="Rolled Back", email="rolled@example.com", phone="+15550000000",
+                          purpose="meeting", host_id=host_id)
+        uow = UnitOfWork(db)
+        uow.add(visitor)
+        uow.notify(outbox.VISITOR_REGISTERED, visitor)
+        uow.flush()
+        visitor_id = visitor.id
+        with pytest.raises(RuntimeError):
+            uow.commit()
+        db.rollback()
+
+        assert db.get(Visitor, visitor_id) is None
+        assert db.query(OutboxMessage).filter(OutboxMessage.dedupe_key.like(f"%:{visitor_id}:%")).count() == 0
+    finally:
+        db.close()
+
+
+def test_a_claimed_row_is_not_claimed_again(client):
+    import outbox
+    from db_connection import SessionLocal
+    from db_models import OutboxMessage
+
+    recipient = _recipient()
+    ids = _stage((recipient, f"claim:{recipient}:1"), (recipient, f"claim:{recipient}:2"))
+    only_ours = OutboxMessage.recipient == recipient
+    now = datetime.utcnow()
+
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        claimed = outbox.claim_due(first, OutboxMessage, now, 10, 120, only_ours)
+        assert [row.id for row in claimed] == ids
+        assert len({row.claim_token for row in claimed}) == 1
+        assert all(row.next_attempt_at == now + timedelta(seconds=120) for row in claimed)
+        assert outbox.claim_due(second, OutboxMessage, now, 10, 120, only_ours) == []
+
+        # Once the lease runs out a sender that died no longer holds them
+        later = now + timedelta(seconds=121)
+        reclaimed = outbox.claim_due(second, OutboxMessage, later, 10, 120, only_ours)
+        assert [row.id for row in reclaimed] == ids
+        assert reclaimed[0].claim_token != claimed[0].claim_token
+    finally:
+        first.close()
+        second.close()
+
+
+def test_failures_back_off_then_die(client, monkeypatch):
+    import outbox
+    from db_connection import SessionLocal
+    from db_models import OutboxMessage
+
+    monkeypatch.setattr(outbox.settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(outbox.settings, "OUTBOX_RETRY_BASE_SECONDS", 30)
+    recipient = _recipient()
+    [message_id] = _stage((recipient, f"retry:{recipient}"))
+    connection = RecordingConnection(OSError("connection refused"))
+
+    before = datetime.utcnow()
+    assert _dispatch(monkeypatch, 1, connection) == 1
+    [message] = _rows([message_id])
+    assert (message.status, message.attempts, message.last_error) == ("pending", 1, "connection refused")
+    # 30 seconds, give or take the jitter
+    assert before + timedelta(seconds=24) <= message.next_attempt_at <= datetime.utcnow() + timedelta(seconds=36)
+
+    db = SessionLocal()
+    try:
+        db.query(OutboxMessage).filter(OutboxMessage.id == message_id).update({"next_attempt_at": LONG_AGO})
+        db.commit()
+    finally:
+        db.close()
+    assert _dispatch(monkeypatch, 1, connection) == 1
+    [message] = _rows([message_id])
+    assert (message.status, message.attempts) == ("dead", 2)
+    assert connection.sent == []
+
+
+def test_retry_delay_doubles_up_to_the_maximum():
+    import outbox
+
+    for attempts, expected in [(1, 30), (2, 60), (4, 240), (10, 3600)]:
+        delay = outbox.retry_delay(attempts, 30, 3600).total_seconds()
+        assert expected * 0.8 <= delay <= expected * 1.2
+
+
+def test_already_sent_dedupe_keys_are_skipped(client, monkeypatch):
+    recipient = _recipient()
+    _stage((recipient, f"dedupe:{recipient}:1"), status="sent", sent_at=LONG_AGO)
+    ids = _stage((recipient, f"dedupe:{recipient}:1"), (recipient, f"dedupe:{recipient}:2"),
+                 (recipient, f"dedupe:{recipient}:2"))
+    connection = RecordingConnection()
+
+    assert _dispatch(monkeypatch, 3, connection) == 3
+    assert [row.status for row in _rows(ids)] == ["sent", "sent", "sent"]
+    # Only the first copy of the new key is mailed
+    assert [email["Subject"] for email in connection.sent] == ["Subject 1"]
+    assert [row.attempts for row in _rows(ids)] == [0, 1, 0]
+
+
+def test_hosts_with_many_messages_get_one_digest(client, monkeypatch):
+    import outbox
+
+    monkeypatch.setattr(outbox.settings, "NOTIFICATION_DIGEST_THRESHOLD", 3)
+    busy, quiet = _recipient(), _recipient()
+    ids = _stage(*[(busy, f"digest:{busy}:{number}") for number in range(3)],
+                 *[(quiet, f"digest:{quiet}:{number}") for number in range(2)])
+    connection = RecordingConnection()
+
+    assert _dispatch(monkeypatch, 5, connection) == 5
+    by_recipient = {}
+    for email in connection.sent:
+        by_recipient.setdefault(email["To"], []).append(email)
+    assert [email["Subject"] for email in by_recipient[busy]] == ["3 visitor updates"]
+    assert by_recipient[busy][0].get_content().splitlines() == ["- Subject 0", "- Subject 1", "- Subject 2"]
+    assert [email["Subject"] for email in by_recipient[quiet]] == ["Subject 3", "Subject 4"]
+    assert all(email["Message-ID"] for email in by_recipient[quiet])
+    assert {row.status for row in _rows(ids)} == {"sent"}
@@ -0,0 +1,145 @@
+"""Profiling sessions shared by workers through PROFILER_OUTPUT_DIR"""
+import sys
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two controllers over one directory, as two worker processes would have"""
+    from profiler import ProfilerController
+
+    return ProfilerController(str(tmp_path), 10), ProfilerController(str(tmp_path), 10)
+
+
+def _refresh(controller):
+    controller._refresh_at = 0.0
+    controller.refresh()
+
+
+def _release(controller):
+    # What finish() does once the profile is stored
+    controller._active = False
+
+
+def test_arming_reaches_every_worker(workers):
+    first, second = workers
+    first.arm("^/api/visitors", max_requests=3)
+    assert first.armed and not second.armed
+
+    _refresh(second)
+    assert second.armed
+    assert second.status()["remaining_requests"] == 3
+
+
+def test_max_requests_counts_across_workers(workers):
+    first, second = workers
+    first.arm("^/api/visitors", max_requests=3)
+    _refresh(second)
+
+    claimed = 0
+    for controller in (first, second, first, second, first):
+        if controller.claim("/api/visitors/"):
+            claimed += 1
+            _release(controller)
+    assert claimed == 3
+    assert first.status()["armed"] is False
+
+    # A worker whose copy still says armed re-checks the file before claiming
+    assert not second.claim("/api/visitors/")
+    assert not second.armed
+
+
+def test_one_profiled_request_per_worker(workers):
+    first, _ = workers
+    first.arm("^/api/", max_requests=5)
+    assert first.claim("/api/visitors/")
+    assert not first.claim("/api/visitors/")
+    _release(first)
+    assert first.claim("/api/visitors/")
+
+
+def test_disarm_reaches_the_armed_worker(workers):
+    first, second = workers
+    first.arm("^/api/", sample_rate=1.0)
+    _refresh(second)
+    second.disarm()
+    assert not second.armed
+
+    _refresh(first)
+    assert not first.armed
+    assert not first.claim("/api/visitors/")
+    assert first.status()["route_pattern"] is None
+
+
+def test_session_expires(workers):
+    first, second = workers
+    first.arm("^/api/", sample_rate=1.0, duration_seconds=1)
+    _refresh(second)
+    assert second.armed
+
+    time.sleep(1.1)
+    _refresh(second)
+    assert not second.armed
+    assert second.status()["armed"] is False
+
+
+def test_pattern_must_match(workers):
+    first, _ = workers
+    first.arm("^/api/badges", max_requests=1)
+    assert not first.claim("/api/visitors/")
+    assert first.status()["remaining_requests"] == 1
+
+
+def test_sampler_keeps_only_ticks_under_the_root_frame():
+    from profiler import StackSampler
+
+    def busy(sampler, seconds):
+        sampler.start()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+        sampler.stop()
+
+    def profiled(seconds):
+        sampler = StackSampler(threading.get_ident(), 0.001, sys._getframe())
+        busy(sampler, seconds)
+        return sampler
+
+    assert profiled(0.05).samples
+
+    # A suspended generator's frame is never on the running thread's stack,
+    # like another request's task while this one runs
+    def suspended():
+        yield
+    generator = suspended()
+    next(generator)
+    sampler = StackSampler(threading.get_ident(), 0.001, generator.gi_frame)
+    busy(sampler, 0.05)
+    assert sampler.samples == []
+
+
+def test_session_routes(client, api, admin_headers):
+    response = client.post(f"{api}/profiler/session", headers=admin_headers,
+                           json={"route_pattern": "^/health$", "max_requests": 1, "sample_rate": 0.5})
+    assert response.status_code == 400
+
+    response = client.post(f"{api}/profiler/session", headers=admin_headers,
+                           json={"route_pattern": "^/health$", "max_requests": 1})
+    assert response.status_code == 200, response.text
+    assert response.json()["remaining_requests"] == 1
+
+    assert client.get("/health").status_code == 200
+    session = client.get(f"{api}/profiler/session", headers=admin_headers).json()
+    assert session["armed"] is False and session["remaining_requests"] == 0
+
+    profiles = client.get(f"{api}/profiler/profiles", headers=admin_headers).json()
+    assert profiles and profiles[0]["path"] == "/health"
+    response = client.get(f"{api}/profiler/profiles/{profiles[0]['id']}", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["profiles"][0]["type"] == "sampled"
+
+    assert client.delete(f"{api}/profiler/session", headers=admin_headers).status_code == 204
+    assert client.get(f"{api}/profiler/session", headers=admin_headers).json()["route_pattern"] is None
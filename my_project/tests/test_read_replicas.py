@@ -0,0 +1,124 @@
+"""Replica routing and read-your-writes pinning, with SQLite files standing in for replicas"""
+import time
+
+import pytest
+from sqlalchemy import text
+from starlette.requests import Request
+
+from conftest import visitor_payload
+
+
+@pytest.fixture
+def replicas(tmp_path, monkeypatch):
+    """Two healthy stand-in replicas, installed as the app's replica router"""
+    import db_connection
+
+    db_connection.get_engine()
+    engines = []
+    for name in ("replica-a", "replica-b"):
+        engine = db_connection._create_engine(f"sqlite:///{tmp_path}/{name}.db")
+        with engine.begin() as connection:
+            # Tells the stand-ins apart from each other and from the primary
+            connection.execute(text("CREATE TABLE whoami (name TEXT)"))
+            connection.execute(text("INSERT INTO whoami VALUES (:name)"), {"name": name})
+        engines.append(engine)
+
+    router = db_connection.ReplicaRouter(engines, check_interval=60)
+    monkeypatch.setattr(db_connection, "_replica_router", router)
+    yield router
+    for engine in engines:
+        engine.dispose()
+
+
+def _request(headers: dict = None, cookies: dict = None) -> Request:
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    if cookies:
+        raw.append((b"cookie", "; ".join(f"{name}={value}" for name, value in cookies.items()).encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+
+def _served_by(request=None) -> str:
+    """Which database get_read_db hands out for `request`"""
+    import db_connection
+
+    dependency = db_connection.get_read_db(request)
+    db = next(dependency)
+    try:
+        if db.get_bind() is db_connection.get_engine():
+            return "primary"
+        return db.execute(text("SELECT name FROM whoami")).scalar()
+    finally:
+        dependency.close()
+
+
+def test_reads_go_round_robin_to_healthy_replicas(replicas):
+    assert {_served_by(), _served_by()} == {"replica-a", "replica-b"}
+
+
+def test_unhealthy_replica_is_skipped(replicas):
+    replicas.mark_unhealthy(replicas.engines[0])
+    assert {_served_by() for _ in range(4)} == {"replica-b"}
+
+
+def test_falls_back_to_primary_without_a_healthy_replica(replicas, tmp_path, monkeypatch):
+    import db_connection
+
+    # A replica that cannot be reached fails its probe
+    broken = db_connection._create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+    router = db_connection.ReplicaRouter([broken], check_interval=60)
+    monkeypatch.setattr(db_connection, "_replica_router", router)
+    assert _served_by() == "primary"
+    assert router.status() == [{"host": None, "healthy": False}]
+
+
+def test_recent_write_token_pins_to_primary(replicas):
+    from db_connection import LAST_WRITE_COOKIE, LAST_WRITE_HEADER, last_write_token
+
+    token = last_write_token(time.time())
+    assert _served_by(_request(headers={LAST_WRITE_HEADER: token})) == "primary"
+    assert _served_by(_request(cookies={LAST_WRITE_COOKIE: token})) == "primary"
+
+
+@pytest.mark.parametrize("make_token", [
+    # Signature of another timestamp
+    lambda token, now: f"{int(now * 1000) + 1}.{token.split('.')[1]}",
+    lambda token, now: token[:-1] + ("0" if token[-1] != "0" else "1"),
+    lambda token, now: "not-a-token",
+    lambda token, now: f"soon.{token.split('.')[1]}",
+])
+def test_tampered_token_is_ignored(replicas, make_token):
+    from db_connection import LAST_WRITE_HEADER, last_write_token
+
+    now = time.time()
+    token = make_token(last_write_token(now), now)
+    assert _served_by(_request(headers={LAST_WRITE_HEADER: token})) != "primary"
+
+
+def test_expired_token_is_ignored(replicas):
+    from config import get_settings
+    from db_connection import LAST_WRITE_HEADER, last_write_token
+
+    token = last_write_token(time.time() - get_settings().READ_YOUR_WRITES_SECONDS - 1)
+    assert _served_by(_request(headers={LAST_WRITE_HEADER: token})) != "primary"
+
+
+def test_writes_hand_out_a_token_and_audit_only_commits_do_not(client, api, admin_headers, host_id):
+    from db_connection import LAST_WRITE_HEADER
+
+    client.cookies.clear()
+    response = client.post(f"{api}/visitors/", json=visitor_payload(host_id), headers=admin_headers)
+    assert response.status_code == 201, response.text
+    assert response.headers.get(LAST_WRITE_HEADER)
+    visitor_id = response.json()["id"]
+
+    response = client.post(f"{api}/visitors/{visitor_id}/approval", json={"approved": True}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.headers.get(LAST_WRITE_HEADER)
+
+    qr_code = client.get(f"{api}/badges/visitor/{visitor_id}", headers=admin_headers).json()["qr_code"]
+    client.cookies.clear()
+    # A plain verify only writes its audit row
+    response = client.get(f"{api}/badges/{qr_code}/verify", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert LAST_WRITE_HEADER not in response.headers
+    assert "set-cookie" not in response.headers
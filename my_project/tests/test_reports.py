@@ -0,0 +1,218 @@
+"""Background report jobs: specs, reuse, limits, the job lifecycle and maintenance"""
+from datetime import datetime, timedelta, timezone
+import csv
+import io
+import time
+import uuid
+
+import pytest
+
+from conftest import visitor_payload
+
+
+def _user(client, api, admin_headers, **overrides) -> dict:
+    name = f"report{uuid.uuid4().hex[:8]}"
+    body = {
+        "username": name, "email": f"{name}@example.com", "full_name": "Report User",
+        "department": "Reporting", "password": "ReportPass123"
+    }
+    body.update(overrides)
+    response = client.post(f"{api}/users/", headers=admin_headers, json=body)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _headers(client, api, username: str) -> dict:
+    response = client.post(f"{api}/auth/token", data={"username": username, "password": "ReportPass123"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _wait_for(client, api, headers, job_id: str, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"{api}/reports/{job_id}", headers=headers).json()
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.2)
+
+
+def test_spec_defaults_to_the_previous_month():
+    import reports
+
+    spec = reports.normalize_spec("visitor_summary", "pdf", None, None, None)
+    first_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    assert spec == {
+        "report_type": "visitor_summary",
+        "format": "pdf",
+        "start_date": (first_of_month - timedelta(days=1)).replace(day=1).isoformat(),
+        "end_date": first_of_month.isoformat(),
+        "department": None,
+    }
+
+
+def test_spec_drops_time_zones_so_equal_requests_hash_equally():
+    import reports
+
+    aware = reports.normalize_spec("host_activity", "csv", datetime(2024, 5, 1, tzinfo=timezone.utc),
+                                   datetime(2024, 6, 1, tzinfo=timezone.utc), "IT")
+    naive = reports.normalize_spec("host_activity", "csv", datetime(2024, 5, 1), datetime(2024, 6, 1), "IT")
+    assert aware == naive
+    assert reports.spec_hash(aware) == reports.spec_hash(naive)
+    assert reports.spec_hash(naive) != reports.spec_hash(dict(naive, department="HR"))
+
+
+@pytest.mark.parametrize("start, end, message", [
+    (datetime(2024, 5, 1), None, "Give both"),
+    (None, datetime(2024, 5, 1), "Give both"),
+    (datetime(2024, 5, 1), datetime(2024, 5, 1), "after start_date"),
+    (datetime(2022, 1, 1), datetime(2024, 1, 1), "at most"),
+])
+def test_invalid_specs(start, end, message):
+    import reports
+    from error_handlers import BadRequestError
+
+    with pytest.raises(BadRequestError, match=message):
+        reports.normalize_spec("visitor_summary", "pdf", start, end, None)
+
+
+def test_xlsx_needs_openpyxl(monkeypatch):
+    import reports
+    from error_handlers import BadRequestError
+
+    monkeypatch.setattr(reports, "openpyxl", None)
+    with pytest.raises(BadRequestError, match="openpyxl"):
+        reports.normalize_spec("visitor_summary", "xlsx", None, None, None)
+
+
+def test_job_lifecycle_with_csv_download(client, api, admin_headers):
+    department = f"Dept {uuid.uuid4().hex[:8]}"
+    host = _user(client, api, admin_headers, department=department, full_name="Report Host")
+    for _ in range(2):
+        response = client.post(f"{api}/visitors/", json=visitor_payload(host["id"]), headers=admin_headers)
+        assert response.status_code == 201, response.text
+
+    now = datetime.utcnow()
+    body = {
+        "report_type": "host_activity", "format": "csv", "department": department,
+        "start_date": (now - timedelta(days=1)).isoformat(), "end_date": (now + timedelta(days=1)).isoformat()
+    }
+    response = client.post(f"{api}/reports/", headers=admin_headers, json=body)
+    assert response.status_code == 202, response.text
+    job = response.json()
+    assert job["status"] == "queued" and job["download_url"] is None
+
+    # The same spec while the job is pending, and once it is done, is the same job
+    response = client.post(f"{api}/reports/", headers=admin_headers, json=body)
+    assert response.status_code == 200 and response.json()["id"] == job["id"]
+
+    job = _wait_for(client, api, admin_headers, job["id"])
+    assert job["status"] == "succeeded", job
+    assert job["progress"] == 100 and job["artifact_size"] > 0 and job["expires_at"]
+
+    response = client.post(f"{api}/reports/", headers=admin_headers, json=body)
+    assert response.status_code == 200 and response.json()["id"] == job["id"]
+
+    response = client.get(job["download_url"], headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0][0] == f"Host activity - {department}"
+    assert ["Report Host", department, "2", "0", "0", "-"] in rows
+
+
+def test_download_before_success_is_refused(client, api, admin_headers):
+    from db_connection import SessionLocal
+    from db_models import ReportJob
+
+    db = SessionLocal()
+    try:
+        job = ReportJob(report_type="visitor_summary", format="pdf", spec="{}", spec_hash="0" * 64, status="failed")
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+
+    assert client.get(f"{api}/reports/{job_id}/download", headers=admin_headers).status_code == 400
+    assert client.get(f"{api}/reports/{uuid.uuid4()}", headers=admin_headers).status_code == 404
+
+
+def test_active_jobs_per_user_are_limited(client, api, admin_headers, monkeypatch):
+    import reports
+    from db_connection import SessionLocal
+    from db_models import ReportJob
+
+    admin = _user(client, api, admin_headers, is_admin=True)
+    headers = _headers(client, api, admin["username"])
+    monkeypatch.setattr(reports.settings, "REPORT_MAX_ACTIVE_PER_USER", 2)
+
+    # Two jobs this admin has running (with a fresh heartbeat, so maintenance leaves them)
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        jobs = [
+            ReportJob(report_type="visitor_summary", format="pdf", spec="{}", spec_hash=uuid.uuid4().hex * 2,
+                      status="running", requested_by=admin["id"], started_at=now, heartbeat_at=now)
+            for _ in range(2)
+        ]
+        db.add_all(jobs)
+        db.commit()
+        job_ids = [job.id for job in jobs]
+    finally:
+        db.close()
+
+    try:
+        response = client.post(f"{api}/reports/", headers=headers, json={
+            "report_type": "visitor_summary", "format": "csv",
+            "start_date": "2021-01-01T00:00:00", "end_date": "2021-02-01T00:00:00"
+        })
+        assert response.status_code == 409
+        assert "2 reports in progress" in response.json()["detail"]
+    finally:
+        # Running rows count against REPORT_MAX_RUNNING for every other test
+        db = SessionLocal()
+        try:
+            db.query(ReportJob).filter(ReportJob.id.in_(job_ids)).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+def test_maintenance_fails_stale_jobs_and_expires_artifacts(client, tmp_path):
+    import reports
+    from db_connection import SessionLocal
+    from db_models import ReportJob
+
+    artifact = tmp_path / "old.csv"
+    artifact.write_text("old")
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        stale = ReportJob(
+            report_type="visitor_summary", format="pdf", spec="{}", spec_hash="1" * 64, status="running",
+            started_at=now - timedelta(hours=1),
+            heartbeat_at=now - timedelta(seconds=reports.settings.REPORT_STALE_SECONDS + 5)
+        )
+        expired = ReportJob(
+            report_type="visitor_summary", format="csv", spec="{}", spec_hash="2" * 64, status="succeeded",
+            artifact_path=str(artifact), finished_at=now - timedelta(days=4), expires_at=now - timedelta(days=1)
+        )
+        db.add_all([stale, expired])
+        db.commit()
+        stale_id, expired_id = stale.id, expired.id
+    finally:
+        db.close()
+
+    reports.scheduler._maintain()
+
+    db = SessionLocal()
+    try:
+        stale = db.get(ReportJob, stale_id)
+        assert (stale.status, stale.error) == ("failed", "Report worker stopped responding")
+        assert stale.finished_at is not None
+        expired = db.get(ReportJob, expired_id)
+        assert (expired.status, expired.artifact_path) == ("expired", None)
+    finally:
+        db.close()
+    assert not artifact.exists()
@@ -0,0 +1,180 @@
+"""Archiving finished visits: merged reads and daily rollups"""
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+
+# Old enough for any cutoff used here, and before anything other tests create
+FIRST_DAY = datetime(2023, 3, 1)
+CUTOFF = datetime(2023, 4, 1)
+
+
+@pytest.fixture(scope="module")
+def archive_host(client, api, admin_headers) -> str:
+    name = f"archive{uuid.uuid4().hex[:8]}"
+    response = client.post(f"{api}/users/", headers=admin_headers, json={
+        "username": name, "email": f"{name}@example.com", "full_name": "Archive Host",
+        "department": "Archive", "password": "ArchivePass123"
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+@pytest.fixture(scope="module")
+def archived(archive_host):
+    """Finished visits over ten days, two to four a day, archived; returns their totals before archiving"""
+    import visitor_archive
+    from db_connection import SessionLocal
+    from db_models import Visitor, VisitPurpose, VisitStatus
+
+    db = SessionLocal()
+    try:
+        for day in range(10):
+            for number in range(2 + day % 3):
+                created_at = FIRST_DAY + timedelta(days=day, hours=8 + 3 * number)
+                completed = number % 2 == 0
+                db.add(Visitor(
+                    full_name=f"Archived {day}-{number}",
+                    email=f"archived{day}-{number}@example.com",
+                    phone="+15550000000",
+                    purpose=VisitPurpose.MEETING if number else VisitPurpose.DELIVERY,
+                    host_id=archive_host,
+                    status=VisitStatus.CHECKED_OUT if completed else VisitStatus.REJECTED,
+                    created_at=created_at,
+                    check_in_time=created_at + timedelta(minutes=10) if completed else None,
+                    check_out_time=created_at + timedelta(minutes=10 + 15 * (day + 1)) if completed else None
+                ))
+        db.commit()
+
+        before = _totals(visitor_archive._aggregate(db, Visitor).filter(Visitor.host_id == archive_host).all())
+        assert visitor_archive.archive(CUTOFF) >= sum(row[0] for row in before.values())
+        return before
+    finally:
+        db.close()
+
+
+def _totals(rows) -> dict:
+    """(day, status, purpose) -> [visitors, checked_in, completed, visit_minutes]"""
+    totals = {}
+    for row in rows:
+        current = totals.setdefault((row.day, row.status, row.purpose), [0, 0, 0, 0.0])
+        current[0] += row.visitors
+        current[1] += row.checked_in
+        current[2] += row.completed
+        current[3] += row.visit_minutes
+    return totals
+
+
+def test_archived_visits_leave_the_hot_table(archived, archive_host):
+    from db_connection import SessionLocal
+    from db_models import Visitor, VisitorArchive
+
+    db = SessionLocal()
+    try:
+        assert db.query(Visitor).filter(Visitor.host_id == archive_host).count() == 0
+        assert db.query(VisitorArchive).filter(VisitorArchive.host_id == archive_host).count() == \
+            sum(counts[0] for counts in archived.values())
+    finally:
+        db.close()
+
+
+def test_rollups_match_the_archived_visits(archived, archive_host):
+    from db_connection import SessionLocal
+    from db_models import VisitorDailyRollup
+
+    db = SessionLocal()
+    try:
+        rollups = db.query(VisitorDailyRollup).filter(VisitorDailyRollup.host_id == archive_host).all()
+        assert _totals(rollups) == archived
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("start_hour, end_hour", [(0, 0), (12, 9), (13, 23)])
+def test_archived_totals_combine_rollups_and_partial_days(archived, archive_host, start_hour, end_hour):
+    import visitor_archive
+    from db_connection import SessionLocal
+    from db_models import VisitorArchive
+
+    start = FIRST_DAY + timedelta(days=2, hours=start_hour)
+    end = FIRST_DAY + timedelta(days=7, hours=end_hour)
+    db = SessionLocal()
+    try:
+        rows = [row for row in visitor_archive.archived_totals(db, start, end) if row.host_id == archive_host]
+        # Row by row from the archive, for comparison
+        expected = visitor_archive._aggregate(db, VisitorArchive).filter(
+            VisitorArchive.host_id == archive_host,
+            VisitorArchive.created_at >= start,
+            VisitorArchive.created_at <= end
+        ).all()
+        assert _totals(rows) == _totals(expected)
+        assert all(row.host_name == "Archive Host" and row.department == "Archive" for row in rows)
+    finally:
+        db.close()
+
+
+def test_newest_first_merges_hot_and_archived_rows(archived, archive_host, client, api, admin_headers):
+    import visitor_archive
+    from db_connection import SessionLocal
+    from db_models import VisitorArchive
+
+    for number in range(3):
+        response = client.post(f"{api}/visitors/", headers=admin_headers, json={
+            "full_name": f"Hot {number}", "email": f"hot{number}@example.com",
+            "phone": "+15550000000", "purpose": "meeting", "host_id": archive_host
+        })
+        assert response.status_code == 201, response.text
+
+    db = SessionLocal()
+    try:
+        def build_query(source):
+            return db.query(source.id, source.created_at).filter(source.host_id == archive_host)
+
+        everything = visitor_archive.newest_first(db, build_query, None, 0, 1000)
+        archived_count = db.query(VisitorArchive).filter(VisitorArchive.host_id == archive_host).count()
+        assert len(everything) == archived_count + 3
+        created = [row.created_at for row in everything]
+        assert created == sorted(created, reverse=True)
+        # The three new visits come first, then the archive
+        assert all(row.created_at > CUTOFF for row in everything[:3])
+        assert all(row.created_at < CUTOFF for row in everything[3:])
+
+        # Pages cut across the boundary without gaps or repeats
+        pages = [visitor_archive.newest_first(db, build_query, None, skip, 4) for skip in range(0, len(everything), 4)]
+        assert [row.id for page in pages for row in page] == [row.id for row in everything]
+
+        # A range starting after the newest archived visit never reads the archive
+        recent = visitor_archive.newest_first(db, build_query, CUTOFF, 0, 1000)
+        assert [row.id for row in recent] == [row.id for row in everything[:3]]
+    finally:
+        db.close()
+
+
+def test_archived_visitor_is_still_readable(archived, archive_host, client, api, admin_headers):
+    from db_connection import SessionLocal
+    from db_models import VisitorArchive
+
+    db = SessionLocal()
+    try:
+        visitor_id = db.query(VisitorArchive.id).filter(VisitorArchive.host_id == archive_host).first().id
+    finally:
+        db.close()
+
+    response = client.get(f"{api}/visitors/{visitor_id}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["host_name"] == "Archive Host"
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    ("mysql", "(TIMESTAMPDIFF(SECOND, check_in_time, check_out_time) / 60.0)"),
+    ("postgresql", "(EXTRACT(EPOCH FROM (check_out_time - check_in_time)) / 60.0)"),
+])
+def test_visit_minutes_keep_partial_minutes(dialect, expected):
+    from sqlalchemy import column
+    from sqlalchemy.dialects import mysql, postgresql
+    from sql_functions import minutes_between
+
+    compiled = minutes_between(column("check_in_time"), column("check_out_time")).compile(
+        dialect={"mysql": mysql, "postgresql": postgresql}[dialect].dialect()
+    )
+    assert str(compiled) == expected
@@ -0,0 +1,185 @@
+"""POST /visitors/bulk with JSON and CSV guest lists"""
+from datetime import datetime, timedelta
+import csv
+import io
+import uuid
+
+import pytest
+
+from conftest import visitor_payload
+
+
+def _bulk(client, api, headers, body, **params):
+    if isinstance(body, str):
+        response = client.post(f"{api}/visitors/bulk", headers={**headers, "Content-Type": "text/csv"},
+                               content=body.encode(), params=params)
+    else:
+        response = client.post(f"{api}/visitors/bulk", headers=headers, json=body, params=params)
+    return response
+
+
+def _csv(rows) -> str:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=["full_name", "email", "phone", "company", "purpose", "host_id", "scheduled_time"])
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+def _visitors(ids):
+    from db_connection import SessionLocal
+    from db_models import Visitor
+
+    db = SessionLocal()
+    try:
+        return {visitor.id: visitor for visitor in db.query(Visitor).filter(Visitor.id.in_(ids)).all()}
+    finally:
+        db.close()
+
+
+def test_json_rows_are_registered(client, api, admin_headers, host_id):
+    rows = [visitor_payload(host_id, full_name=f"Bulk Guest {number}") for number in range(3)]
+    response = _bulk(client, api, admin_headers, rows)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["failed"]) == (3, 0)
+    assert [result["row"] for result in body["results"]] == [1, 2, 3]
+    assert all(result["status"] == "created" and "qr_code" not in result for result in body["results"])
+
+    visitors = _visitors([result["visitor_id"] for result in body["results"]])
+    assert sorted(visitor.full_name for visitor in visitors.values()) == ["Bulk Guest 0", "Bulk Guest 1", "Bulk Guest 2"]
+    assert {visitor.status.value for visitor in visitors.values()} == {"pending"}
+
+    # The {"visitors": [...]} envelope is the same list
+    response = _bulk(client, api, admin_headers, {"visitors": [visitor_payload(host_id)]})
+    assert response.json()["created"] == 1
+
+
+def test_csv_rows_are_registered(client, api, admin_headers, host_id):
+    rows = [
+        dict(visitor_payload(host_id, full_name="Csv Guest", company="Acme")),
+        # Empty cells are omitted values, so an empty company is fine
+        dict(visitor_payload(host_id, full_name="Csv Guest Two", company="")),
+    ]
+    response = _bulk(client, api, admin_headers, _csv(rows))
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "created"]
+    visitors = _visitors([result["visitor_id"] for result in results])
+    assert sorted((visitor.full_name, visitor.company) for visitor in visitors.values()) == [
+        ("Csv Guest", "Acme"), ("Csv Guest Two", None)
+    ]
+
+
+def test_csv_missing_columns(client, api, admin_headers):
+    response = _bulk(client, api, admin_headers, "full_name,email\nA,a@example.com\n")
+    assert response.status_code == 400
+    assert "host_id, phone, purpose" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("body", [[], {"guests": []}, "not json"])
+def test_bad_bodies(client, api, admin_headers, body):
+    if body == "not json":
+        response = client.post(f"{api}/visitors/bulk", headers={**admin_headers, "Content-Type": "application/json"},
+                               content=b"not json")
+    else:
+        response = _bulk(client, api, admin_headers, body)
+    assert response.status_code == 400
+
+
+def test_invalid_rows_are_reported_and_the_rest_registered(client, api, admin_headers, host_id):
+    unknown_host = str(uuid.uuid4())
+    rows = [
+        visitor_payload(host_id, full_name="Good Guest"),
+        visitor_payload(host_id, email="not-an-email"),
+        "not an object",
+        visitor_payload(unknown_host),
+    ]
+    response = _bulk(client, api, admin_headers, rows)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["failed"]) == (1, 3)
+    good, bad_email, not_object, no_host = body["results"]
+    assert good["status"] == "created"
+    assert bad_email["status"] == "error" and bad_email["errors"][0].startswith("email:")
+    assert not_object["errors"] == ["Row must be an object"]
+    assert no_host["errors"] == [f"host_id: Host not found with id {unknown_host}"]
+
+
+def test_atomic_skips_every_row_when_one_fails(client, api, admin_headers, host_id):
+    names = [f"Atomic Guest {uuid.uuid4().hex[:8]}" for _ in range(2)]
+    rows = [visitor_payload(host_id, full_name=names[0]), visitor_payload(host_id, phone="x"),
+            visitor_payload(host_id, full_name=names[1])]
+    response = _bulk(client, api, admin_headers, rows, atomic="true")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["failed"]) == (0, 1)
+    assert [result["status"] for result in body["results"]] == ["skipped", "error", "skipped"]
+    assert all("visitor_id" not in result for result in body["results"])
+
+    from db_connection import SessionLocal
+    from db_models import Visitor
+
+    db = SessionLocal()
+    try:
+        assert db.query(Visitor).filter(Visitor.full_name.in_(names)).count() == 0
+    finally:
+        db.close()
+
+
+def test_pre_approve_issues_badges(client, api, admin_headers, host_id):
+    from db_connection import SessionLocal
+    from db_models import Badge
+
+    scheduled = (datetime.utcnow() + timedelta(days=2)).replace(microsecond=0)
+    rows = [visitor_payload(host_id, scheduled_time=scheduled.isoformat()) for _ in range(2)]
+    response = _bulk(client, api, admin_headers, rows, pre_approve="true", visit_duration_minutes=90)
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert all(result["qr_code"].startswith("VMS-PRE-") for result in results)
+    assert all(datetime.fromisoformat(result["expiry_time"]) == scheduled + timedelta(minutes=90) for result in results)
+
+    visitor_ids = [result["visitor_id"] for result in results]
+    assert {visitor.status.value for visitor in _visitors(visitor_ids).values()} == {"approved"}
+    db = SessionLocal()
+    try:
+        badges = db.query(Badge).filter(Badge.visitor_id.in_(visitor_ids)).all()
+        assert sorted(badge.qr_code for badge in badges) == sorted(result["qr_code"] for result in results)
+    finally:
+        db.close()
+
+
+def test_pre_approve_needs_a_future_time(client, api, admin_headers, host_id):
+    past = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    response = _bulk(client, api, admin_headers, [visitor_payload(host_id), visitor_payload(host_id, scheduled_time=past)],
+                     pre_approve="true")
+    body = response.json()
+    assert body["created"] == 0
+    assert all(result["errors"] == ["scheduled_time: must be in the future for pre-approved visitors"]
+               for result in body["results"])
+
+
+def test_every_registration_is_audited(client, api, admin_headers, host_id):
+    from db_connection import SessionLocal
+    from db_models import SystemLog
+
+    scheduled = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    plain = _bulk(client, api, admin_headers, [visitor_payload(host_id, full_name="Audited Guest")]).json()
+    approved = _bulk(client, api, admin_headers, [visitor_payload(host_id, scheduled_time=scheduled)],
+                     pre_approve="true").json()
+    plain_id = plain["results"][0]["visitor_id"]
+    approved_id = approved["results"][0]["visitor_id"]
+
+    db = SessionLocal()
+    try:
+        logs = {
+            log.entity_id: log for log in
+            db.query(SystemLog).filter(SystemLog.entity_type == "visitor",
+                                       SystemLog.entity_id.in_([plain_id, approved_id])).all()
+        }
+    finally:
+        db.close()
+    assert logs[plain_id].action == "create"
+    assert logs[plain_id].details == "Registered visitor: Audited Guest for host: Test Host"
+    assert logs[approved_id].action == "pre_approve"
+    assert all(log.user_id is not None for log in logs.values())
@@ -0,0 +1,147 @@
+"""Visitor status transitions and optimistic version checks"""
+import uuid
+
+import pytest
+
+from conftest import visitor_payload
+
+PHOTO = {"photo": ("photo.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+
+
+@pytest.fixture
+def visitor(client, api, admin_headers, host_id) -> dict:
+    response = client.post(f"{api}/visitors/", json=visitor_payload(host_id), headers=admin_headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _post(client, api, headers, visitor_id: str, action: str, **params):
+    return client.post(f"{api}/visitors/{visitor_id}/{action}", headers=headers, params=params)
+
+
+def test_visit_lifecycle(client, api, admin_headers, visitor):
+    visitor_id = visitor["id"]
+    assert (visitor["status"], visitor["version"]) == ("pending", 1)
+
+    response = client.post(f"{api}/visitors/{visitor_id}/approval", json={"approved": True}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert (response.json()["status"], response.json()["version"]) == ("approved", 2)
+
+    # Check-in needs a photo
+    assert _post(client, api, admin_headers, visitor_id, "check-in").status_code == 400
+    assert client.post(f"{api}/visitors/{visitor_id}/photo", files=PHOTO, headers=admin_headers).status_code == 200
+
+    response = _post(client, api, admin_headers, visitor_id, "check-in")
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "checked_in"
+
+    response = _post(client, api, admin_headers, visitor_id, "check-out")
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "checked_out"
+
+
+@pytest.mark.parametrize("action", ["check-in", "check-out"])
+def test_transition_from_wrong_status_conflicts(client, api, admin_headers, visitor, action):
+    # A pending visitor can be neither checked in nor out
+    response = _post(client, api, admin_headers, visitor["id"], action)
+    assert response.status_code == 409
+    assert "status: pending" in response.json()["detail"]
+
+
+def test_checked_in_visitor_cannot_be_approved_again(client, api, admin_headers, visitor):
+    visitor_id = visitor["id"]
+    client.post(f"{api}/visitors/{visitor_id}/approval", json={"approved": True}, headers=admin_headers)
+    client.post(f"{api}/visitors/{visitor_id}/photo", files=PHOTO, headers=admin_headers)
+    assert _post(client, api, admin_headers, visitor_id, "check-in").status_code == 200
+
+    response = client.post(f"{api}/visitors/{visitor_id}/approval", json={"approved": False}, headers=admin_headers)
+    assert response.status_code == 409
+
+
+def test_stale_expected_version_conflicts(client, api, admin_headers, visitor):
+    visitor_id = visitor["id"]
+    url = f"{api}/visitors/{visitor_id}/approval"
+
+    response = client.post(url, json={"approved": True}, headers=admin_headers, params={"expected_version": 1})
+    assert response.status_code == 200 and response.json()["version"] == 2
+
+    # A second client still holding version 1
+    response = client.post(url, json={"approved": False}, headers=admin_headers, params={"expected_version": 1})
+    assert response.status_code == 409
+    assert "version 2, expected 1" in response.json()["detail"]
+
+    response = client.put(f"{api}/visitors/{visitor_id}", json={"company": "Late"}, headers=admin_headers,
+                          params={"expected_version": 1})
+    assert response.status_code == 409
+
+
+def test_concurrent_transitions_apply_once(visitor):
+    import visitor_state
+    from db_connection import SessionLocal
+    from error_handlers import ConflictError
+
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        # Both guards read version 1; only the first UPDATE matches
+        row = visitor_state.transition(first, visitor["id"], visitor_state.APPROVE, expected_version=1)
+        first.commit()
+        assert row.version == 2
+
+        with pytest.raises(ConflictError):
+            visitor_state.transition(second, visitor["id"], visitor_state.REJECT, expected_version=1)
+        assert visitor_state.transition(
+            second, visitor["id"], visitor_state.REJECT, expected_version=1, required=False
+        ) is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_bulk_approve_reports_each_visitor(client, api, admin_headers, host_id, visitor):
+    other = client.post(f"{api}/visitors/", json=visitor_payload(host_id), headers=admin_headers).json()
+    client.post(f"{api}/visitors/{other['id']}/approval", json={"approved": True}, headers=admin_headers)
+    client.post(f"{api}/visitors/{other['id']}/photo", files=PHOTO, headers=admin_headers)
+    assert _post(client, api, admin_headers, other["id"], "check-in").status_code == 200
+    missing = str(uuid.uuid4())
+
+    response = client.post(f"{api}/visitors/bulk/approve", headers=admin_headers,
+                           json={"visitor_ids": [visitor["id"], other["id"], missing]})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (1, 2)
+
+    results = {item["visitor_id"]: item for item in body["results"]}
+    assert results[visitor["id"]]["status"] == "approved"
+    assert results[visitor["id"]]["version"] == 2
+    assert results[visitor["id"]]["qr_code"]
+    # Checked-in visitors are past approval
+    assert results[other["id"]].get("status") is None and "checked_in" in results[other["id"]]["error"]
+    assert results[missing]["error"] == "Visitor not found"
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_transition_many_returns_only_its_rows(client, api, admin_headers, host_id, monkeypatch, returning):
+    import visitor_state
+    from db_connection import SessionLocal, get_engine
+    from db_models import VisitStatus
+
+    ids = [client.post(f"{api}/visitors/", json=visitor_payload(host_id), headers=admin_headers).json()["id"]
+           for _ in range(3)]
+    # Already approved by an earlier call: left alone and not reported
+    assert client.post(f"{api}/visitors/{ids[0]}/approval", json={"approved": True},
+                       headers=admin_headers).status_code == 200
+
+    # Without RETURNING (MySQL) the rows are read back by their updated_at stamp
+    monkeypatch.setattr(get_engine().dialect, "update_returning", returning)
+    db = SessionLocal()
+    try:
+        rows = visitor_state.transition_many(
+            db, visitor_state.APPROVE, visitor_ids=ids, sources=[VisitStatus.PENDING]
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    assert sorted(row.id for row in rows) == sorted(ids[1:])
+    assert all(row.status == VisitStatus.APPROVED and row.version == 2 for row in rows)
+    assert len({visitor_state._unique_stamp() for _ in range(1000)}) == 1000
@@ -0,0 +1,129 @@
+"""Delta sync tokens on GET /visitors/changes"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import visitor_payload
+
+
+@pytest.fixture
+def sync_settings(monkeypatch):
+    from config import get_settings
+
+    settings = get_settings()
+    # Freshly written rows are visible at once unless a test says otherwise
+    monkeypatch.setattr(settings, "SYNC_COMMIT_LAG_SECONDS", 0)
+    return settings
+
+
+def _changes(client, api, headers, **params) -> dict:
+    response = client.get(f"{api}/visitors/changes", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _create(client, api, headers, host_id) -> str:
+    response = client.post(f"{api}/visitors/", json=visitor_payload(host_id), headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def test_token_round_trip():
+    from routes_visitors import _decode_sync_token, _encode_sync_token
+
+    timestamp = datetime(2024, 5, 17, 8, 30, 15, 123456)
+    assert _decode_sync_token(_encode_sync_token(timestamp, "visitor-id")) == (timestamp, "visitor-id")
+    assert _decode_sync_token(_encode_sync_token(timestamp)) == (timestamp, "")
+
+
+def test_malformed_token_is_rejected(client, api, admin_headers):
+    response = client.get(f"{api}/visitors/changes", headers=admin_headers, params={"since": "not a token"})
+    assert response.status_code == 400
+
+
+def test_initial_sync_lists_visitors_but_no_deletions(client, api, admin_headers, host_id, sync_settings):
+    deleted = _create(client, api, admin_headers, host_id)
+    assert client.delete(f"{api}/visitors/{deleted}", headers=admin_headers).status_code == 204
+    kept = _create(client, api, admin_headers, host_id)
+
+    body = _changes(client, api, admin_headers, limit=1000)
+    assert body["deleted"] == []
+    ids = [visitor["id"] for visitor in body["changes"]]
+    assert kept in ids and deleted not in ids
+
+
+def test_next_call_returns_only_later_changes(client, api, admin_headers, host_id, sync_settings):
+    first = _create(client, api, admin_headers, host_id)
+    token = _changes(client, api, admin_headers, limit=1000)["token"]
+
+    second = _create(client, api, admin_headers, host_id)
+    assert client.put(f"{api}/visitors/{first}", json={"company": "Changed"}, headers=admin_headers).status_code == 200
+    assert client.delete(f"{api}/visitors/{second}", headers=admin_headers).status_code == 204
+
+    body = _changes(client, api, admin_headers, since=token)
+    assert [visitor["id"] for visitor in body["changes"]] == [first]
+    assert body["changes"][0]["company"] == "Changed"
+    assert body["deleted"] == [second]
+    assert not body["has_more"]
+
+    # Nothing happened since
+    body = _changes(client, api, admin_headers, since=body["token"])
+    assert body["changes"] == [] and body["deleted"] == []
+
+
+def test_pages_chain_without_gaps_or_repeats(client, api, admin_headers, host_id, sync_settings):
+    token = _changes(client, api, admin_headers, limit=1000)["token"]
+    created = [_create(client, api, admin_headers, host_id) for _ in range(5)]
+
+    seen = []
+    while True:
+        body = _changes(client, api, admin_headers, since=token, limit=2)
+        seen.extend(visitor["id"] for visitor in body["changes"])
+        token = body["token"]
+        if not body["has_more"]:
+            break
+    assert seen == created
+
+
+def test_recent_writes_wait_for_the_commit_lag(client, api, admin_headers, host_id, sync_settings):
+    token = _changes(client, api, admin_headers, limit=1000)["token"]
+    visitor_id = _create(client, api, admin_headers, host_id)
+
+    sync_settings.SYNC_COMMIT_LAG_SECONDS = 60
+    held_back = _changes(client, api, admin_headers, since=token)
+    assert visitor_id not in [visitor["id"] for visitor in held_back["changes"]]
+
+    # The held-back token still reaches the write once the lag has passed
+    sync_settings.SYNC_COMMIT_LAG_SECONDS = 0
+    body = _changes(client, api, admin_headers, since=held_back["token"])
+    assert visitor_id in [visitor["id"] for visitor in body["changes"]]
+
+
+def test_expired_token_is_gone(client, api, admin_headers, sync_settings):
+    from routes_visitors import _encode_sync_token
+
+    max_age = timedelta(days=sync_settings.SYNC_TOKEN_MAX_AGE_DAYS)
+    expired = _encode_sync_token(datetime.utcnow() - max_age - timedelta(minutes=1))
+    response = client.get(f"{api}/visitors/changes", headers=admin_headers, params={"since": expired})
+    assert response.status_code == 410
+
+    recent = _encode_sync_token(datetime.utcnow() - max_age + timedelta(minutes=1))
+    assert client.get(f"{api}/visitors/changes", headers=admin_headers, params={"since": recent}).status_code == 200
+
+
+def test_deleting_prunes_tombstones_past_the_token_age(client, api, admin_headers, host_id, sync_settings):
+    from db_connection import SessionLocal
+    from db_models import VisitorTombstone
+
+    cutoff = datetime.utcnow() - timedelta(days=sync_settings.SYNC_TOKEN_MAX_AGE_DAYS)
+    db = SessionLocal()
+    try:
+        db.add(VisitorTombstone(visitor_id=_create(client, api, admin_headers, host_id), host_id=host_id,
+                                deleted_at=cutoff - timedelta(days=1)))
+        db.commit()
+
+        visitor_id = _create(client, api, admin_headers, host_id)
+        assert client.delete(f"{api}/visitors/{visitor_id}", headers=admin_headers).status_code == 204
+        assert db.query(VisitorTombstone).filter(VisitorTombstone.deleted_at < cutoff).count() == 0
+    finally:
+        db.close()
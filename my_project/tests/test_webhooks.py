@@ -0,0 +1,233 @@
+"""Webhook fan-out, signing, capacity-limited claiming, retries and the dead-letter routes"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import asyncio
+import hashlib
+import hmac
+import json
+import uuid
+
+import pytest
+
+from conftest import visitor_payload
+
+
+@pytest.fixture(scope="module", autouse=True)
+def paused_dispatcher(client):
+    """Stop the app's own dispatcher so only these tests claim deliveries"""
+    import webhooks
+
+    client.portal.call(webhooks.dispatcher.stop)
+    yield
+    client.portal.call(webhooks.dispatcher.start)
+
+
+class RecordingClient:
+    """Stands in for the shared httpx client"""
+
+    def __init__(self, status_code: int = 200, error: Exception = None):
+        self.status_code = status_code
+        self.error = error
+        self.requests = []
+
+    async def post(self, url, content, headers):
+        self.requests.append(SimpleNamespace(url=url, content=content, headers=headers))
+        if self.error:
+            raise self.error
+        return SimpleNamespace(status_code=self.status_code)
+
+
+def _subscribe(client, api, admin_headers, event_types, **extra) -> dict:
+    response = client.post(f"{api}/webhooks/subscriptions", headers=admin_headers, json={
+        "name": f"Receiver {uuid.uuid4().hex[:8]}", "url": "http://127.0.0.1:9/hook", "event_types": event_types, **extra
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _stage(subscription_id: str, count: int) -> list:
+    """Insert due deliveries for a subscription; returns their ids"""
+    from db_connection import SessionLocal
+    from db_models import WebhookDelivery
+
+    db = SessionLocal()
+    try:
+        rows = [
+            WebhookDelivery(subscription_id=subscription_id, event_type="visitor.approved",
+                            payload=json.dumps({"type": "visitor.approved", "number": number}),
+                            next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+            for number in range(count)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+def _deliveries(client, api, admin_headers, **params) -> list:
+    response = client.get(f"{api}/webhooks/deliveries", headers=admin_headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _deliver(subscription: dict, delivery_ids: list, http_client: RecordingClient):
+    import webhooks
+    from db_connection import SessionLocal
+    from db_models import WebhookDelivery
+
+    db = SessionLocal()
+    try:
+        rows = [
+            {"id": row.id, "attempts": row.attempts, "payload": row.payload}
+            for row in db.query(WebhookDelivery).filter(WebhookDelivery.id.in_(delivery_ids)).order_by(WebhookDelivery.id)
+        ]
+    finally:
+        db.close()
+    dispatcher = webhooks.WebhookDispatcher()
+    dispatcher._client = http_client
+    asyncio.run(dispatcher._deliver(subscription, rows))
+
+
+def test_signature_is_hmac_of_timestamp_and_body():
+    import webhooks
+
+    body = b'{"events":[]}'
+    expected = hmac.new(b"topsecret", b"1700000000." + body, hashlib.sha256).hexdigest()
+    assert webhooks.sign("topsecret", "1700000000", body) == f"sha256={expected}"
+
+
+def test_one_delivery_per_matching_subscription(client, api, admin_headers, host_id):
+    both = _subscribe(client, api, admin_headers, ["visitor.approved", "visitor.rejected"])
+    rejected_only = _subscribe(client, api, admin_headers, ["visitor.rejected"])
+    paused = _subscribe(client, api, admin_headers, ["visitor.approved", "visitor.rejected"])
+    response = client.put(f"{api}/webhooks/subscriptions/{paused['id']}", headers=admin_headers, json={"active": False})
+    assert response.status_code == 200, response.text
+
+    try:
+        approved_id = client.post(f"{api}/visitors/", headers=admin_headers, json=visitor_payload(host_id)).json()["id"]
+        rejected_id = client.post(f"{api}/visitors/", headers=admin_headers, json=visitor_payload(host_id)).json()["id"]
+        # Registration is not a webhook event
+        assert _deliveries(client, api, admin_headers, subscription_id=both["id"]) == []
+
+        client.post(f"{api}/visitors/{approved_id}/approval", headers=admin_headers, json={"approved": True})
+        client.post(f"{api}/visitors/{rejected_id}/approval", headers=admin_headers, json={"approved": False})
+
+        staged = _deliveries(client, api, admin_headers, subscription_id=both["id"])
+        assert sorted(delivery["event_type"] for delivery in staged) == ["visitor.approved", "visitor.rejected"]
+        assert all(delivery["status"] == "pending" and delivery["attempts"] == 0 for delivery in staged)
+        staged = _deliveries(client, api, admin_headers, subscription_id=rejected_only["id"])
+        assert [delivery["event_type"] for delivery in staged] == ["visitor.rejected"]
+        assert _deliveries(client, api, admin_headers, subscription_id=paused["id"]) == []
+    finally:
+        for subscription in (both, rejected_only, paused):
+            response = client.delete(f"{api}/webhooks/subscriptions/{subscription['id']}", headers=admin_headers)
+            assert response.status_code == 204
+
+
+def test_unknown_event_types_are_refused(client, api, admin_headers):
+    response = client.post(f"{api}/webhooks/subscriptions", headers=admin_headers, json={
+        "name": "Bad", "url": "http://127.0.0.1:9/hook", "event_types": ["visitor.teleported"]
+    })
+    assert response.status_code == 400
+
+
+def test_claims_stop_at_the_subscription_concurrency(client, api, admin_headers, monkeypatch):
+    import webhooks
+
+    monkeypatch.setattr(webhooks.settings, "WEBHOOK_EVENTS_PER_REQUEST", 2)
+    subscription = _subscribe(client, api, admin_headers, ["visitor.approved"], max_concurrency=2)
+    ids = _stage(subscription["id"], 9)
+    dispatcher = webhooks.WebhookDispatcher()
+
+    try:
+        # Two requests of two; the other five go back, due at once
+        batches, backlog = dispatcher._claim(10, {})
+        assert [[row["id"] for row in rows] for _, rows in batches] == [ids[0:2], ids[2:4]]
+        assert backlog
+        assert batches[0][0]["secret"] == subscription["secret"]
+
+        # Both requests still in flight: nothing more for this subscriber
+        dispatcher._limits[subscription["id"]] = 2
+        batches, backlog = dispatcher._claim(10, {subscription["id"]: 2})
+        assert batches == [] and backlog
+
+        # One finished: one more request's worth
+        batches, backlog = dispatcher._claim(10, {subscription["id"]: 1})
+        assert [[row["id"] for row in rows] for _, rows in batches] == [ids[4:6]]
+
+        # Limited by free connections rather than by the subscriber
+        batches, backlog = dispatcher._claim(1, {})
+        assert [[row["id"] for row in rows] for _, rows in batches] == [ids[6:8]]
+
+        batches, backlog = dispatcher._claim(10, {})
+        assert [[row["id"] for row in rows] for _, rows in batches] == [ids[8:9]]
+        assert not backlog
+    finally:
+        client.delete(f"{api}/webhooks/subscriptions/{subscription['id']}", headers=admin_headers)
+
+
+def test_delivery_is_signed_and_recorded(client, api, admin_headers):
+    import webhooks
+
+    subscription = _subscribe(client, api, admin_headers, ["visitor.approved"])
+    ids = _stage(subscription["id"], 2)
+    http_client = RecordingClient(204)
+
+    try:
+        _deliver(subscription, ids, http_client)
+        [request] = http_client.requests
+        assert request.url == subscription["url"]
+        timestamp = request.headers[webhooks.TIMESTAMP_HEADER]
+        assert request.headers[webhooks.SIGNATURE_HEADER] == webhooks.sign(subscription["secret"], timestamp, request.content)
+        body = json.loads(request.content)
+        assert body["subscription_id"] == subscription["id"]
+        # Receivers drop repeats by the delivery id
+        assert [(event["id"], event["number"]) for event in body["events"]] == [(ids[0], 0), (ids[1], 1)]
+
+        delivered = _deliveries(client, api, admin_headers, subscription_id=subscription["id"])
+        assert {(delivery["status"], delivery["attempts"], delivery["last_status_code"]) for delivery in delivered} == {
+            ("delivered", 1, 204)
+        }
+    finally:
+        client.delete(f"{api}/webhooks/subscriptions/{subscription['id']}", headers=admin_headers)
+
+
+def test_failures_back_off_then_dead_letter_and_requeue(client, api, admin_headers, monkeypatch):
+    import webhooks
+
+    monkeypatch.setattr(webhooks.settings, "WEBHOOK_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(webhooks.settings, "WEBHOOK_RETRY_BASE_SECONDS", 10)
+    subscription = _subscribe(client, api, admin_headers, ["visitor.approved"])
+    [delivery_id] = _stage(subscription["id"], 1)
+
+    try:
+        before = datetime.utcnow()
+        _deliver(subscription, [delivery_id], RecordingClient(503))
+        [delivery] = _deliveries(client, api, admin_headers, subscription_id=subscription["id"])
+        assert (delivery["status"], delivery["attempts"], delivery["last_error"]) == ("pending", 1, "HTTP 503")
+        retry_at = datetime.fromisoformat(delivery["next_attempt_at"])
+        assert before + timedelta(seconds=8) <= retry_at <= datetime.utcnow() + timedelta(seconds=12)
+
+        _deliver(subscription, [delivery_id], RecordingClient(error=ConnectionError("refused")))
+        dead = _deliveries(client, api, admin_headers, status="dead", subscription_id=subscription["id"])
+        assert [(delivery["id"], delivery["attempts"]) for delivery in dead] == [(delivery_id, 2)]
+        assert dead[0]["last_error"] == "ConnectionError: refused"
+
+        response = client.post(f"{api}/webhooks/deliveries/{delivery_id}/retry", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        assert (response.json()["status"], response.json()["attempts"]) == ("pending", 0)
+        # Only dead deliveries go back on the queue
+        response = client.post(f"{api}/webhooks/deliveries/{delivery_id}/retry", headers=admin_headers)
+        assert response.status_code == 400
+        response = client.post(f"{api}/webhooks/deliveries/999999999/retry", headers=admin_headers)
+        assert response.status_code == 404
+    finally:
+        client.delete(f"{api}/webhooks/subscriptions/{subscription['id']}", headers=admin_headers)
+
+
+def test_admin_only(client, api, host_id):
+    response = client.post(f"{api}/auth/token", data={"username": "testhost", "password": "TestPass123"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get(f"{api}/webhooks/deliveries", headers=headers).status_code == 403
+    assert client.post(f"{api}/webhooks/deliveries/1/retry", headers=headers).status_code == 403
@@ -0,0 +1,127 @@
+from fastapi import Request
+from sqlalchemy.orm import Session
+from typing import Callable, List, Optional
+import logging
+
+from db_models import User, SystemLog, OutboxMessage
+from auth import get_client_ip
+from config import get_settings
+import events
+import idempotency
+import outbox
+import webhooks
+
+# Configure logging
+logger = logging.getLogger("unit_of_work")
+
+settings = get_settings()
+
+
+class UnitOfWork:
+    """Request-scoped unit of work for write endpoints.
+
+    Entity changes, their audit entries and the events they raise are staged
+    and then committed together, so every write costs a single transaction
+    and an entity can never be persisted without its SystemLog row.
+
+    Usage:
+        uow = UnitOfWork(db, request, current_user)
+        uow.add(visitor)
+        uow.audit("create", "visitor", visitor, f"Registered visitor: {visitor.full_name}")
+        uow.publish(events.VISITOR_CREATED, visitor)
+        uow.commit()
+    """
+
+    def __init__(self, db: Session, request: Optional[Request] = None, user: Optional[User] = None):
+        self.db = db
+        self.request = request
+        self.user_id = user.id if user else None
+        self.client_ip = get_client_ip(request) if request else "unknown"
+        self._audit_entries = []
+        self._events = []
+        self._notifications = []
+        self._after_commit: List[Callable[[], None]] = []
+
+    def add(self, entity):
+        self.db.add(entity)
+        return entity
+
+    def delete(self, entity):
+        self.db.delete(entity)
+
+    def insert_many(self, model, rows: List[dict], execution_options: Optional[dict] = None):
+        """Insert plain row dicts with chunked executemany, bypassing the ORM.
+
+        Runs immediately inside the transaction; every dict must have the same keys.
+        """
+        for start in range(0, len(rows), settings.BULK_CHUNK_SIZE):
+            self.db.execute(
+                model.__table__.insert(),
+                rows[start:start + settings.BULK_CHUNK_SIZE],
+                execution_options=execution_options or {}
+            )
+
+    def audit(self, action: str, entity_type: str, entity, details: str):
+        """Stage a SystemLog row; `entity` may be an ORM object whose key is assigned at flush"""
+        self._audit_entries.append((action, entity_type, entity, details))
+
+    def publish(self, event_type: str, visitor):
+        """Stage a visitor event, delivered only once the transaction commits"""
+        self._events.append((event_type, visitor))
+
+    def notify(self, kind: str, visitor):
+        """Stage a host email in the outbox; written in this transaction, sent in the background"""
+        self._notifications.append((kind, visitor))
+
+    def after_commit(self, callback: Callable[[], None]):
+        self._after_commit.append(callback)
+
+    def flush(self):
+        self.db.flush()
+
+    def commit(self):
+        # Flushing first assigns generated keys and defaults without ending
+        # the transaction
+        self.db.flush()
+
+        # One executemany for all audit rows, however many entities changed
+        self.insert_many(SystemLog, [
+            {
+                "action": action,
+                "entity_type": entity_type,
+                "entity_id": entity if isinstance(entity, str) else entity.id,
+                "user_id": self.user_id,
+                "ip_address": self.client_ip,
+                "details": details
+            }
+            for action, entity_type, entity, details in self._audit_entries
+        ], execution_options={"audit_only": True})  # Not a write that pins the caller to the primary
+
+        if self._notifications:
+            self.insert_many(OutboxMessage, outbox.host_notifications(self.db, self._notifications))
+
+        # Payloads are built before commit; deleted rows are unreadable after it
+        staged_events = [events.visitor_event(event_type, visitor) for event_type, visitor in self._events]
+        webhook_deliveries = webhooks.stage_deliveries(self.db, staged_events)
+
+        # An Idempotency-Key is marked used in the same transaction as the writes
+        idempotency.store.mark_committed(self.db, self.request)
+
+        self.db.commit()
+
+        for event in staged_events:
+            events.broker.publish(event)
+        if self._notifications:
+            outbox.dispatcher.wake()
+        if webhook_deliveries:
+            webhooks.dispatcher.wake()
+        for callback in self._after_commit:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"After-commit callback failed: {str(e)}")
+
+        self._audit_entries = []
+        self._events = []
+        self._notifications = []
+        self._after_commit = []
@@ -0,0 +1,268 @@
+"""Cold storage for finished visits.
+
+Only visits that can still change need to live in `visitors`. Running
+`python visitor_archive.py` (e.g. nightly from cron) moves checked-out,
+rejected and expired visitors created more than VISITOR_ARCHIVE_AFTER_DAYS
+ago into visitors_archive, with their badges and photos, in batches of
+VISITOR_ARCHIVE_BATCH_SIZE with one short transaction each. Every batch
+also adds its visits to visitor_daily_rollups, in the same transaction.
+
+Reads reach the archive only when they have to. The newest archived
+created_at is one index lookup, and a query starting after it cannot
+match archived rows. Otherwise the visitor list merges in the newest
+archived rows, the export unions the archive, and stats and reports add
+rollups for the whole days in their range, reading archived rows only for
+the partial days at either end.
+
+Archived visits are read-only: they can be listed, fetched and exported,
+but not updated, and delta sync clients keep their last copy.
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Optional
+import argparse
+import heapq
+import logging
+
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.orm import Query, Session
+
+from config import get_settings
+from db_connection import SessionLocal
+from db_models import (
+    User, Visitor, VisitorPhoto, Badge, VisitorArchive, VisitorPhotoArchive, BadgeArchive,
+    VisitorDailyRollup, VisitStatus
+)
+from sql_functions import minutes_between, date_of
+
+# Configure logging
+logger = logging.getLogger("visitor_archive")
+
+settings = get_settings()
+
+# Statuses no workflow leaves
+TERMINAL_STATUSES = (VisitStatus.CHECKED_OUT, VisitStatus.REJECTED, VisitStatus.EXPIRED)
+
+
+def newest_archived(db: Session) -> Optional[datetime]:
+    """created_at of the newest archived visit; None while the archive is empty"""
+    return db.query(func.max(VisitorArchive.created_at)).scalar()
+
+
+def needs_archive(db: Session, start_date: Optional[datetime]) -> bool:
+    """Whether visits created from `start_date` on (or at any time) may be archived"""
+    newest = newest_archived(db)
+    if newest is None:
+        return False
+    # Fix timezone issue
+    return start_date is None or start_date.replace(tzinfo=None) <= newest
+
+
+def newest_first(db: Session, build_query: Callable[..., Query], start_date: Optional[datetime],
+                 skip: int, limit: int) -> list:
+    """Rows `skip` to `skip + limit` of build_query(source), newest first, from both tables.
+
+    `build_query` must select created_at.
+    """
+    newest = newest_archived(db)
+    hot = build_query(Visitor).order_by(Visitor.created_at.desc())
+    # Fix timezone issue
+    if newest is None or (start_date and start_date.replace(tzinfo=None) > newest):
+        return hot.offset(skip).limit(limit).all()
+
+    rows = hot.limit(skip + limit).all()
+    if len(rows) == skip + limit and rows[-1].created_at and rows[-1].created_at > newest:
+        # The page ends before the newest archived visit
+        return rows[skip:]
+
+    archived = build_query(VisitorArchive).order_by(VisitorArchive.created_at.desc()).limit(skip + limit).all()
+    merged = heapq.merge(rows, archived, key=lambda row: row.created_at or datetime.min, reverse=True)
+    return list(islice(merged, skip, skip + limit))
+
+
+def _aggregate(db: Session, source, with_hosts: bool = False) -> Query:
+    """Rollup-shaped totals of `source` per day, host, status and purpose"""
+    visit_minutes = minutes_between(source.check_in_time, source.check_out_time)
+    day = date_of(source.created_at)
+    columns = [
+        day.label("day"),
+        source.host_id.label("host_id"),
+        source.status.label("status"),
+        source.purpose.label("purpose"),
+        func.count(source.id).label("visitors"),
+        func.count(source.check_in_time).label("checked_in"),
+        func.count(visit_minutes).label("completed"),
+        func.coalesce(func.sum(visit_minutes), 0).label("visit_minutes"),
+    ]
+    group_by = [day, source.host_id, source.status, source.purpose]
+    if not with_hosts:
+        return db.query(*columns).group_by(*group_by)
+    return (
+        db.query(*columns, User.full_name.label("host_name"), User.department.label("department"))
+        .join(User, User.id == source.host_id)
+        .group_by(*group_by, User.full_name, User.department)
+    )
+
+
+def archived_totals(db: Session, start_date: datetime, end_date: datetime, end_inclusive: bool = True,
+                    department: Optional[str] = None) -> list:
+    """Archived visits created between the dates, as rollup rows with host_name and department.
+
+    Whole days come from visitor_daily_rollups; the partial days at either
+    end are totalled from visitors_archive.
+    """
+    if not needs_archive(db, start_date):
+        return []
+    # Fix timezone issue
+    start_date = start_date.replace(tzinfo=None)
+    end_date = end_date.replace(tzinfo=None)
+
+    def archived_between(lower: datetime, upper: datetime, inclusive: bool) -> Query:
+        upper_bound = VisitorArchive.created_at <= upper if inclusive else VisitorArchive.created_at < upper
+        return _aggregate(db, VisitorArchive, with_hosts=True).filter(VisitorArchive.created_at >= lower, upper_bound)
+
+    # Whole days run from first_day up to, not including, end_day
+    first_day = start_date.date() if start_date.time() == datetime.min.time() else start_date.date() + timedelta(days=1)
+    end_day = end_date.date()
+    if first_day >= end_day:
+        queries = [archived_between(start_date, end_date, end_inclusive)]
+    else:
+        rollups = db.query(
+            VisitorDailyRollup.day,
+            VisitorDailyRollup.host_id,
+            VisitorDailyRollup.status,
+            VisitorDailyRollup.purpose,
+            VisitorDailyRollup.visitors,
+            VisitorDailyRollup.checked_in,
+            VisitorDailyRollup.completed,
+            VisitorDailyRollup.visit_minutes,
+            User.full_name.label("host_name"),
+            User.department.label("department")
+        ).join(
+            User, User.id == VisitorDailyRollup.host_id
+        ).filter(
+            VisitorDailyRollup.day >= first_day,
+            VisitorDailyRollup.day < end_day
+        )
+        queries = [
+            rollups,
+            archived_between(start_date, datetime.combine(first_day, datetime.min.time()), False),
+            archived_between(datetime.combine(end_day, datetime.min.time()), end_date, end_inclusive),
+        ]
+
+    rows = []
+    for query in queries:
+        if department:
+            query = query.filter(User.department == department)
+        rows.extend(query.all())
+    return rows
+
+
+def _add_to_rollup(db: Session, row):
+    key = (
+        VisitorDailyRollup.day == row.day,
+        VisitorDailyRollup.host_id == row.host_id,
+        VisitorDailyRollup.status == row.status,
+        VisitorDailyRollup.purpose == row.purpose,
+    )
+    updated = db.execute(update(VisitorDailyRollup).where(*key).values(
+        visitors=VisitorDailyRollup.visitors + row.visitors,
+        checked_in=VisitorDailyRollup.checked_in + row.checked_in,
+        completed=VisitorDailyRollup.completed + row.completed,
+        visit_minutes=VisitorDailyRollup.visit_minutes + row.visit_minutes
+    )).rowcount
+    if not updated:
+        db.execute(insert(VisitorDailyRollup).values(
+            day=row.day,
+            host_id=row.host_id,
+            status=row.status,
+            purpose=row.purpose,
+            visitors=row.visitors,
+            checked_in=row.checked_in,
+            completed=row.completed,
+            visit_minutes=row.visit_minutes
+        ))
+
+
+def _copy(db: Session, hot, cold, criterion):
+    """INSERT ... SELECT the rows of `hot` matching `criterion` into `cold`"""
+    hot_columns = hot.__table__.columns
+    names = [column.name for column in cold.__table__.columns if column.name in hot_columns]
+    db.execute(insert(cold.__table__).from_select(
+        names,
+        select(*(hot_columns[name] for name in names)).where(criterion)
+    ))
+
+
+def archive_batch(db: Session, cutoff: datetime) -> int:
+    """Move one batch of finished visits created before `cutoff`; returns the number moved"""
+    ids = db.execute(
+        select(Visitor.id)
+        .where(Visitor.status.in_(TERMINAL_STATUSES), Visitor.created_at < cutoff)
+        .limit(settings.VISITOR_ARCHIVE_BATCH_SIZE)
+        .with_for_update()
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    # Conditions repeated so a visit changed since the SELECT stays behind
+    moving = and_(Visitor.id.in_(ids), Visitor.status.in_(TERMINAL_STATUSES), Visitor.created_at < cutoff)
+    moving_ids = select(Visitor.id).where(moving)
+    try:
+        for row in _aggregate(db, Visitor).filter(moving).all():
+            _add_to_rollup(db, row)
+        _copy(db, Visitor, VisitorArchive, moving)
+        _copy(db, Badge, BadgeArchive, Badge.visitor_id.in_(moving_ids))
+        _copy(db, VisitorPhoto, VisitorPhotoArchive, VisitorPhoto.visitor_id.in_(moving_ids))
+        db.execute(delete(Badge).where(Badge.visitor_id.in_(moving_ids)))
+        db.execute(delete(VisitorPhoto).where(VisitorPhoto.visitor_id.in_(moving_ids)))
+        moved = db.execute(delete(Visitor).where(moving)).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return moved
+
+
+def archive(cutoff: datetime) -> int:
+    """Move every finished visit created before `cutoff`, batch by batch; returns the count"""
+    db = SessionLocal()
+    try:
+        total = 0
+        while True:
+            moved = archive_batch(db, cutoff)
+            if not moved:
+                return total
+            total += moved
+            logger.info(f"Archived {total} visitors so far")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=settings.VISITOR_ARCHIVE_AFTER_DAYS,
+                        help="archive finished visits created more than this many days ago")
+    parser.add_argument("--dry-run", action="store_true", help="count the visits that would be archived")
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error("--days must be at least 1")
+
+    cutoff = datetime.utcnow() - timedelta(days=args.days)
+    if args.dry_run:
+        db = SessionLocal()
+        try:
+            count = db.query(func.count(Visitor.id)).filter(
+                Visitor.status.in_(TERMINAL_STATUSES),
+                Visitor.created_at < cutoff
+            ).scalar()
+        finally:
+            db.close()
+        print(f"Would archive {count} visitors created before {cutoff:%Y-%m-%d %H:%M}")
+        return
+
+    print(f"Archived {archive(cutoff)} visitors created before {cutoff:%Y-%m-%d %H:%M}")
+
+
+if __name__ == "__main__":
+    main()
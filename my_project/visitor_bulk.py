@@ -0,0 +1,159 @@
+"""Bulk visitor registration (conference guest lists).
+
+Rows arrive as JSON or CSV and are validated with the same VisitorCreate
+schema as single registrations. Hosts are resolved with one IN query, and
+visitors, badges and audit rows are inserted with chunked executemany
+through `UnitOfWork.insert_many()`, so a 2,000-guest list costs a handful
+of statements and one commit instead of thousands.
+"""
+from pydantic import ValidationError
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+import csv
+import io
+import json
+import uuid
+
+from db_models import User, Visitor, Badge, VisitStatus, generate_uuid
+from schemas import VisitorCreate
+from config import get_settings
+from error_handlers import BadRequestError
+from unit_of_work import UnitOfWork
+import events
+
+settings = get_settings()
+
+CSV_COLUMNS = ("full_name", "email", "phone", "company", "purpose", "host_id", "scheduled_time")
+
+
+def parse_rows(content_type: str, body: bytes) -> List[dict]:
+    """Raw rows from a JSON list (or {"visitors": [...]}) or a CSV file with a header row"""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in ("text/csv", "application/csv"):
+        try:
+            text = body.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise BadRequestError("CSV must be UTF-8 encoded")
+        reader = csv.DictReader(io.StringIO(text))
+        missing = {"full_name", "email", "phone", "purpose", "host_id"} - set(reader.fieldnames or [])
+        if missing:
+            raise BadRequestError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        # Empty cells mean "not given", as an omitted JSON key would
+        rows = [{key: value for key, value in row.items() if key and value not in ("", None)} for row in reader]
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise BadRequestError("Body must be a JSON list of visitors or a CSV file")
+        rows = payload.get("visitors") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise BadRequestError("Body must be a JSON list of visitors or a CSV file")
+
+    if not rows:
+        raise BadRequestError("No visitors to register")
+    if len(rows) > settings.BULK_MAX_ROWS:
+        raise BadRequestError(f"At most {settings.BULK_MAX_ROWS} visitors can be registered at once")
+    return rows
+
+
+def _error_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+def validate_rows(db: Session, rows: List[dict], pre_approve: bool) -> Tuple[Dict[int, VisitorCreate], Dict[int, List[str]], Dict[str, str]]:
+    """Validate every row; returns (valid rows, errors, host names), both keyed by row number"""
+    valid: Dict[int, VisitorCreate] = {}
+    errors: Dict[int, List[str]] = {}
+    now = datetime.utcnow()
+
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors[number] = ["Row must be an object"]
+            continue
+        try:
+            visitor = VisitorCreate.model_validate(row)
+        except ValidationError as e:
+            errors[number] = _error_messages(e)
+            continue
+
+        if visitor.scheduled_time is not None:
+            # Fix timezone issue
+            visitor.scheduled_time = visitor.scheduled_time.replace(tzinfo=None)
+        if pre_approve and (visitor.scheduled_time is None or visitor.scheduled_time <= now):
+            errors[number] = ["scheduled_time: must be in the future for pre-approved visitors"]
+            continue
+        valid[number] = visitor
+
+    # One IN query for every distinct host
+    host_ids = list({visitor.host_id for visitor in valid.values()})
+    hosts: Dict[str, str] = {}
+    for start in range(0, len(host_ids), settings.BULK_CHUNK_SIZE):
+        chunk = host_ids[start:start + settings.BULK_CHUNK_SIZE]
+        hosts.update(db.query(User.id, User.full_name).filter(User.id.in_(chunk)).all())
+
+    for number in [number for number, visitor in valid.items() if visitor.host_id not in hosts]:
+        errors[number] = [f"host_id: Host not found with id {valid.pop(number).host_id}"]
+    return valid, errors, hosts
+
+
+def register_visitors(
+    uow: UnitOfWork,
+    valid: Dict[int, VisitorCreate],
+    hosts: Dict[str, str],
+    pre_approve: bool,
+    visit_duration_minutes: int
+) -> Dict[int, dict]:
+    """Stage inserts for the validated rows; returns each row's result keyed by row number"""
+    now = datetime.utcnow()
+    status = VisitStatus.APPROVED if pre_approve else VisitStatus.PENDING
+    visitor_rows = []
+    badge_rows = []
+    results: Dict[int, dict] = {}
+
+    for number, visitor in valid.items():
+        visitor_id = generate_uuid()
+        visitor_rows.append({
+            "id": visitor_id,
+            "full_name": visitor.full_name,
+            "email": visitor.email,
+            "phone": visitor.phone,
+            "company": visitor.company,
+            "purpose": visitor.purpose,
+            "image": visitor.photo_url,
+            "host_id": visitor.host_id,
+            "status": status,
+            "scheduled_time": visitor.scheduled_time,
+            "created_at": now,
+            "updated_at": now,
+            "version": 1
+        })
+        result = {"row": number, "status": "created", "visitor_id": visitor_id}
+
+        if pre_approve:
+            qr_code = f"VMS-PRE-{str(uuid.uuid4())}"
+            expiry_time = visitor.scheduled_time + timedelta(minutes=visit_duration_minutes)
+            badge_rows.append({
+                "id": generate_uuid(),
+                "visitor_id": visitor_id,
+                "qr_code": qr_code,
+                "expiry_time": expiry_time,
+                "created_at": now
+            })
+            result.update(qr_code=qr_code, expiry_time=expiry_time)
+            uow.audit("pre_approve", "visitor", visitor_id, f"Pre-approved visitor: {visitor.full_name}, Scheduled: {visitor.scheduled_time}")
+        else:
+            uow.audit("create", "visitor", visitor_id, f"Registered visitor: {visitor.full_name} for host: {hosts[visitor.host_id]}")
+
+        # Event payloads only need the attributes a visitor row has
+        uow.publish(events.VISITOR_CREATED, SimpleNamespace(
+            check_in_time=None, check_out_time=None, **{
+                key: visitor_rows[-1][key] for key in ("id", "host_id", "full_name", "status", "scheduled_time")
+            }
+        ))
+        results[number] = result
+
+    uow.insert_many(Visitor, visitor_rows)
+    uow.insert_many(Badge, badge_rows)
+    return results
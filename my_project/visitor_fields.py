@@ -0,0 +1,147 @@
+"""Sparse fieldsets for visitor read endpoints.
+
+`?fields=full_name,status,host_name` restricts both the response keys and
+the SQL: only the requested columns are selected, and the host join, badge
+join and photo lookup are added only when a field needs them. The list
+filters live here too, so the list and export endpoints scope rows alike.
+Both accept `source=VisitorArchive` to read archived visits the same way.
+"""
+from sqlalchemy import exists
+from sqlalchemy.orm import Query, Session
+from datetime import datetime
+from typing import Optional, Tuple
+
+from db_models import (
+    User, Visitor, VisitorPhoto, Badge, VisitorArchive, VisitorPhotoArchive, BadgeArchive, VisitStatus, VisitPurpose
+)
+from error_handlers import BadRequestError
+
+# VisitorOut fields, in response order
+VISITOR_FIELDS = (
+    "id", "full_name", "email", "phone", "company", "purpose", "host_id",
+    "photo_url", "host_name", "status", "scheduled_time", "check_in_time",
+    "check_out_time", "created_at", "has_photo", "has_badge", "visit_duration",
+    "version"
+)
+
+# Fields read straight from a visitor column (field -> column name)
+_COLUMN_FIELDS = {
+    "id": "id",
+    "full_name": "full_name",
+    "email": "email",
+    "phone": "phone",
+    "company": "company",
+    "purpose": "purpose",
+    "host_id": "host_id",
+    "photo_url": "image",
+    "status": "status",
+    "scheduled_time": "scheduled_time",
+    "check_in_time": "check_in_time",
+    "check_out_time": "check_out_time",
+    "created_at": "created_at",
+    "version": "version",
+}
+
+# Always selected: id identifies the row and host_id drives permission checks
+_ALWAYS_SELECTED = ("id", "host_id")
+
+# Badge and photo tables that go with a visitor table
+_RELATED = {VisitorArchive: (BadgeArchive, VisitorPhotoArchive)}
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Validate a comma-separated `fields` parameter; all fields when omitted"""
+    if not fields:
+        return VISITOR_FIELDS
+
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(VISITOR_FIELDS)
+    if unknown:
+        raise BadRequestError(
+            f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(VISITOR_FIELDS)}"
+        )
+    return tuple(name for name in VISITOR_FIELDS if name in requested)
+
+
+def visitor_query(db: Session, fields: Tuple[str, ...], source=Visitor) -> Query:
+    """Select `fields` from `source` (the visitors table or one shaped like it)"""
+    selected = set(fields) | set(_ALWAYS_SELECTED)
+    if "visit_duration" in fields:
+        selected |= {"check_in_time", "check_out_time"}
+
+    columns = [
+        getattr(source, column).label(name)
+        for name, column in _COLUMN_FIELDS.items()
+        if name in selected
+    ]
+    query = db.query(*columns)
+    badges, photos = _RELATED.get(source, (Badge, VisitorPhoto))
+
+    if "host_name" in fields:
+        query = query.add_columns(User.full_name.label("host_name")).outerjoin(User, User.id == source.host_id)
+    if "has_badge" in fields:
+        # visitor_id is unique on badges, so the join cannot duplicate rows
+        query = query.add_columns(badges.id.label("badge_id")).outerjoin(badges, badges.visitor_id == source.id)
+    if "has_photo" in fields:
+        query = query.add_columns(exists().where(photos.visitor_id == source.id).label("has_photo"))
+    return query
+
+
+def filter_visitors(
+    query: Query,
+    current_user: User,
+    status: Optional[VisitStatus] = None,
+    purpose: Optional[VisitPurpose] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    host_id: Optional[str] = None,
+    source=Visitor
+) -> Query:
+    """Visitor list filters and read scoping, shared by the list and export endpoints"""
+    # Modified permissions - allow security to view all visitors
+    if current_user.department == "Security":
+        # Security can view all visitors (read-only access)
+        pass  # Don't filter by host
+    elif not current_user.is_admin:
+        # Regular faculty can only see their own visitors
+        query = query.filter(source.host_id == current_user.id)
+    elif host_id:
+        # Admin with specific host filter
+        query = query.filter(source.host_id == host_id)
+
+    # Apply query filters
+    if status:
+        query = query.filter(source.status == status)
+    if purpose:
+        query = query.filter(source.purpose == purpose)
+    if start_date:
+        # Fix timezone issue
+        start_date = start_date.replace(tzinfo=None)
+        query = query.filter(source.created_at >= start_date)
+    if end_date:
+        # Fix timezone issue
+        end_date = end_date.replace(tzinfo=None)
+        query = query.filter(source.created_at <= end_date)
+    return query
+
+
+def visitor_row_to_dict(row, fields: Tuple[str, ...]) -> dict:
+    result = {}
+    for name in fields:
+        if name == "host_name":
+            result[name] = row.host_name or "Unknown"
+        elif name == "has_badge":
+            result[name] = row.badge_id is not None
+        elif name == "has_photo":
+            result[name] = bool(row.has_photo)
+        elif name == "visit_duration":
+            visit_duration = None
+            if row.check_in_time and row.check_out_time:
+                # Fix timezone issue
+                check_in = row.check_in_time.replace(tzinfo=None)
+                check_out = row.check_out_time.replace(tzinfo=None)
+                visit_duration = (check_out - check_in).total_seconds() / 60  # Duration in minutes
+            result[name] = visit_duration
+        else:
+            result[name] = getattr(row, name)
+    return result
@@ -0,0 +1,262 @@
+"""Visitor state machine.
+
+Every status change is a single conditional UPDATE:
+
+    UPDATE visitors SET status=?, version=version+1, ...
+    WHERE id=? AND status IN (...) [AND host_id=?] [AND version=?]
+
+so two guards scanning the same badge cannot both check a visitor in, and no
+row lock is held between reading and writing. When no row matches, a
+follow-up read (on the failure path only) reports exactly why.
+
+`transition_many()` is the set-based form for bulk actions: the same
+conditions with `id IN (...)` (or a host filter) instead of one id.
+Without RETURNING (MySQL) it stamps the rows it updates with an updated_at
+unique to the call and reads them back by that stamp, again without
+locking rows that guards may be scanning.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import update, select, exists, case
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional
+import logging
+import threading
+
+from db_models import User, Visitor, VisitorPhoto, VisitStatus
+from error_handlers import NotFoundError, AuthorizationError, BadRequestError, ConflictError
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger("visitor_state")
+
+settings = get_settings()
+
+# Who may perform a transition: the host and admins ("write"), or in
+# addition Security staff ("checkin")
+WRITE = "write"
+CHECKIN = "checkin"
+
+
+class Transition:
+    def __init__(self, name: str, verb: str, sources, target, permission: Optional[str]):
+        self.name = name
+        self.verb = verb
+        self.sources = frozenset(sources)
+        self.target = target
+        self.permission = permission
+
+
+APPROVE = Transition(
+    "approve", "approve",
+    [VisitStatus.PENDING, VisitStatus.APPROVED, VisitStatus.REJECTED, VisitStatus.EXPIRED],
+    VisitStatus.APPROVED, WRITE
+)
+REJECT = Transition(
+    "reject", "reject",
+    [VisitStatus.PENDING, VisitStatus.APPROVED, VisitStatus.REJECTED, VisitStatus.EXPIRED],
+    VisitStatus.REJECTED, WRITE
+)
+CHECK_IN = Transition("check_in", "check in", [VisitStatus.APPROVED], VisitStatus.CHECKED_IN, CHECKIN)
+CHECK_OUT = Transition("check_out", "check out", [VisitStatus.CHECKED_IN], VisitStatus.CHECKED_OUT, CHECKIN)
+# An expired badge was scanned
+EXPIRE = Transition(
+    "expire", "expire",
+    [VisitStatus.PENDING, VisitStatus.APPROVED, VisitStatus.REJECTED, VisitStatus.CHECKED_IN],
+    VisitStatus.EXPIRED, None
+)
+# The badge was invalidated before the visit started
+INVALIDATE = Transition("invalidate", "invalidate", [VisitStatus.APPROVED], VisitStatus.EXPIRED, None)
+# An expired badge was extended: back to where the visit was
+REINSTATE = Transition(
+    "reinstate", "reinstate", [VisitStatus.EXPIRED],
+    case((Visitor.check_in_time.is_(None), VisitStatus.APPROVED), else_=VisitStatus.CHECKED_IN),
+    WRITE
+)
+
+# Columns returned for a transitioned visitor (enough for audit entries and events)
+RESULT_COLUMNS = (
+    Visitor.id,
+    Visitor.full_name,
+    Visitor.host_id,
+    Visitor.status,
+    Visitor.scheduled_time,
+    Visitor.check_in_time,
+    Visitor.check_out_time,
+    Visitor.version
+)
+
+
+def _permission_clause(user: Optional[User], permission: Optional[str]):
+    if permission is None or user is None or user.is_admin:
+        return None
+    if permission == CHECKIN and user.department == "Security":
+        return None
+    return Visitor.host_id == user.id
+
+
+def _has_photo():
+    return exists().where(VisitorPhoto.visitor_id == Visitor.id)
+
+
+def transition(
+    db: Session,
+    visitor_id: str,
+    action: Transition,
+    user: Optional[User] = None,
+    expected_version: Optional[int] = None,
+    require_photo: bool = False,
+    values: Optional[dict] = None,
+    required: bool = True
+):
+    """Apply `action` to a visitor in one UPDATE and return its new state.
+
+    Returns a row with RESULT_COLUMNS. When nothing matched, raises the
+    precise error, or returns None if `required` is False.
+    """
+    conditions = [Visitor.id == visitor_id, Visitor.status.in_(action.sources)]
+    permission = _permission_clause(user, action.permission)
+    if permission is not None:
+        conditions.append(permission)
+    if expected_version is not None:
+        conditions.append(Visitor.version == expected_version)
+    if require_photo:
+        conditions.append(_has_photo())
+
+    statement = update(Visitor).where(*conditions).values(
+        status=action.target,
+        version=Visitor.version + 1,
+        **(values or {})
+    ).execution_options(synchronize_session=False)
+
+    if getattr(db.bind.dialect, "update_returning", False):
+        row = db.execute(statement.returning(*RESULT_COLUMNS)).first()
+    else:
+        result = db.execute(statement)
+        row = None
+        if result.rowcount:
+            # Same transaction, so this sees our own write without locking
+            row = db.execute(select(*RESULT_COLUMNS).where(Visitor.id == visitor_id)).first()
+
+    if row is None and required:
+        _raise_conflict(db, visitor_id, action, user, expected_version, require_photo)
+    return row
+
+
+def _raise_conflict(db, visitor_id, action, user, expected_version, require_photo):
+    current = db.execute(
+        select(Visitor.host_id, Visitor.status, Visitor.version, _has_photo().label("has_photo"))
+        .where(Visitor.id == visitor_id)
+    ).first()
+    if current is None:
+        raise NotFoundError("Visitor", visitor_id)
+
+    permission = _permission_clause(user, action.permission)
+    if permission is not None and current.host_id != user.id:
+        raise AuthorizationError(f"Not authorized to {action.verb} this visitor")
+    if expected_version is not None and current.version != expected_version:
+        raise ConflictError(
+            f"Visitor was modified by another request (version {current.version}, expected {expected_version})"
+        )
+    if current.status not in action.sources:
+        status = current.status.value if current.status else None
+        raise ConflictError(f"Cannot {action.verb} visitor with status: {status}")
+    if require_photo and not current.has_photo:
+        raise BadRequestError("Photo must be captured before check-in")
+
+    # The row changed between the UPDATE and this read; report it as a conflict
+    raise ConflictError("Visitor was modified by another request")
+
+
+_stamp_lock = threading.Lock()
+_last_stamp = datetime.min
+
+
+def _unique_stamp() -> datetime:
+    """The current time, a microsecond past the previous stamp if the clock has not moved on"""
+    global _last_stamp
+    with _stamp_lock:
+        _last_stamp = max(datetime.utcnow(), _last_stamp + timedelta(microseconds=1))
+        return _last_stamp
+
+
+def _update_many(db: Session, scope: list, statuses, target, values: dict) -> List:
+    """One conditional UPDATE over the rows in `scope` and `statuses`; returns the updated rows"""
+    conditions = scope + [Visitor.status.in_(statuses)]
+    if getattr(db.bind.dialect, "update_returning", False):
+        statement = update(Visitor).where(*conditions).values(status=target, **values)
+        return db.execute(statement.returning(*RESULT_COLUMNS).execution_options(synchronize_session=False)).all()
+
+    # No RETURNING (MySQL): mark the rows this UPDATE changes with a stamp no
+    # other call uses, then read back the rows carrying it. Only the UPDATE
+    # takes row locks; a SELECT ... FOR UPDATE would serialize the gate.
+    stamp = _unique_stamp()
+    statement = update(Visitor).where(*conditions).values(status=target, **dict(values, updated_at=stamp))
+    if not db.execute(statement.execution_options(synchronize_session=False)).rowcount:
+        return []
+    # Same transaction, so this sees our own write
+    return db.execute(
+        select(*RESULT_COLUMNS).where(*scope, Visitor.status == target, Visitor.updated_at == stamp)
+    ).all()
+
+
+def transition_many(
+    db: Session,
+    action: Transition,
+    user: Optional[User] = None,
+    visitor_ids: Optional[Iterable[str]] = None,
+    host_id: Optional[str] = None,
+    sources: Optional[Iterable[VisitStatus]] = None,
+    values: Optional[dict] = None
+) -> List:
+    """Apply `action` to many visitors with set-based UPDATEs.
+
+    Targets the given `visitor_ids` (one statement per BULK_CHUNK_SIZE ids),
+    or with no ids every visitor in `sources` (default: the action's
+    sources), optionally only those of `host_id`, in a single statement.
+    Rows the user may not change or in the wrong status are left alone;
+    returns the rows that were transitioned.
+    """
+    source_statuses = frozenset(sources) & action.sources if sources is not None else action.sources
+    scope = []
+    permission = _permission_clause(user, action.permission)
+    if permission is not None:
+        scope.append(permission)
+    if host_id is not None:
+        scope.append(Visitor.host_id == host_id)
+
+    update_values = dict(version=Visitor.version + 1, **(values or {}))
+    if visitor_ids is None:
+        return _update_many(db, scope, source_statuses, action.target, update_values)
+
+    ids = list(dict.fromkeys(visitor_ids))
+    rows = []
+    for start in range(0, len(ids), settings.BULK_CHUNK_SIZE):
+        chunk = ids[start:start + settings.BULK_CHUNK_SIZE]
+        rows.extend(_update_many(db, scope + [Visitor.id.in_(chunk)], source_statuses, action.target, update_values))
+    return rows
+
+
+def explain_failures(db: Session, visitor_ids: Iterable[str], action: Transition, user: Optional[User] = None) -> Dict[str, str]:
+    """Why each of `visitor_ids` was not transitioned, read in BULK_CHUNK_SIZE batches"""
+    ids = list(visitor_ids)
+    current = {}
+    for start in range(0, len(ids), settings.BULK_CHUNK_SIZE):
+        chunk = ids[start:start + settings.BULK_CHUNK_SIZE]
+        current.update(
+            (row.id, row) for row in db.execute(
+                select(Visitor.id, Visitor.host_id, Visitor.status).where(Visitor.id.in_(chunk))
+            )
+        )
+
+    permission = _permission_clause(user, action.permission)
+    reasons = {}
+    for visitor_id in ids:
+        row = current.get(visitor_id)
+        if row is None:
+            reasons[visitor_id] = "Visitor not found"
+        elif permission is not None and row.host_id != user.id:
+            reasons[visitor_id] = f"Not authorized to {action.verb} this visitor"
+        else:
+            status = row.status.value if row.status else None
+            reasons[visitor_id] = f"Cannot {action.verb} visitor with status: {status}"
+    return reasons
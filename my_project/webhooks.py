@@ -0,0 +1,317 @@
+"""Webhook fan-out of visitor events to access-control and HR systems.
+
+`UnitOfWork.commit()` stages one `webhook_deliveries` row per matching
+subscription in the same transaction as the change, so the request path
+only pays for an insert. Each worker runs a dispatcher that claims due
+deliveries (see `outbox.claim_due`), batches them per subscription and
+POSTs them over a shared keep-alive httpx client. A dispatcher only claims
+what it can send at once: no more batches than WEBHOOK_MAX_CONNECTIONS in
+flight, and no more to a subscriber than its max_concurrency, so a slow
+turnstile controller cannot hold back the HR system and a claimed batch
+never waits out its lease in a queue. Delivery needs the optional httpx
+package; without it the dispatcher does not start and deliveries stay
+pending.
+
+Requests are signed: `X-VMS-Signature: sha256=<hex>` is the HMAC-SHA256 of
+`<X-VMS-Timestamp>.<body>` keyed with the subscription secret. Failed
+batches are retried with exponential backoff; after WEBHOOK_MAX_ATTEMPTS
+the deliveries are marked "dead" and can be re-queued through the admin
+routes. Delivery is at least once: receivers should drop repeated ids.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+
+from config import get_settings
+from db_connection import SessionLocal
+from db_models import WebhookSubscription, WebhookDelivery
+from outbox import claim_due, retry_delay
+from responses import dumps
+import events
+
+# Configure logging
+logger = logging.getLogger("webhooks")
+
+settings = get_settings()
+
+# Events a subscription can ask for
+WEBHOOK_EVENT_TYPES = (
+    events.VISITOR_APPROVED,
+    events.VISITOR_REJECTED,
+    events.VISITOR_CHECKED_IN,
+    events.VISITOR_CHECKED_OUT,
+    events.VISITOR_EXPIRED,
+    events.BADGE_INVALIDATED,
+)
+
+PENDING = "pending"
+DELIVERED = "delivered"
+DEAD = "dead"
+
+SIGNATURE_HEADER = "X-VMS-Signature"
+TIMESTAMP_HEADER = "X-VMS-Timestamp"
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+class _SubscriptionCache:
+    """Active subscriptions as (id, event types), reloaded every WEBHOOK_SUBSCRIPTION_CACHE_SECONDS"""
+
+    def __init__(self):
+        self._subscriptions: Optional[List[Tuple[str, frozenset]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> List[Tuple[str, frozenset]]:
+        with self._lock:
+            if self._subscriptions is not None and time.monotonic() - self._loaded_at < settings.WEBHOOK_SUBSCRIPTION_CACHE_SECONDS:
+                return self._subscriptions
+
+        rows = (
+            db.query(WebhookSubscription.id, WebhookSubscription.event_types)
+            .filter(WebhookSubscription.active == True)
+            .all()
+        )
+        subscriptions = [(row.id, frozenset(row.event_types.split(","))) for row in rows]
+        with self._lock:
+            self._subscriptions = subscriptions
+            self._loaded_at = time.monotonic()
+        return subscriptions
+
+    def clear(self):
+        with self._lock:
+            self._subscriptions = None
+
+
+subscriptions = _SubscriptionCache()
+
+
+def stage_deliveries(db: Session, staged_events: List[dict]) -> int:
+    """Add a delivery row per (event, matching subscription) to the session; returns the count"""
+    relevant = [event for event in staged_events if event["type"] in WEBHOOK_EVENT_TYPES]
+    if not relevant:
+        return 0
+
+    now = datetime.utcnow()
+    count = 0
+    for subscription_id, event_types in subscriptions.get(db):
+        for event in relevant:
+            if event["type"] not in event_types:
+                continue
+            db.add(WebhookDelivery(
+                subscription_id=subscription_id,
+                event_type=event["type"],
+                payload=dumps(event).decode(),
+                next_attempt_at=now
+            ))
+            count += 1
+    return count
+
+
+class WebhookDispatcher:
+    def __init__(self):
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight: set = set()
+        # Batches in flight and last seen max_concurrency, per subscription
+        self._busy: Dict[str, int] = {}
+        self._limits: Dict[str, int] = {}
+        # Set when the last round left due deliveries unclaimed for lack of capacity
+        self._backlog = False
+
+    async def start(self):
+        try:
+            import httpx
+        except ImportError:  # Optional: deliveries stay pending until it is installed
+            logger.warning("httpx is not installed; webhook deliveries will not be sent")
+            return
+
+        self._client = httpx.AsyncClient(
+            timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.WEBHOOK_MAX_CONNECTIONS
+            )
+        )
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Unfinished batches keep their lease and are picked up again after it
+        for task in list(self._in_flight):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def wake(self):
+        """Deliver staged events now instead of at the next poll; safe from any thread"""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _finished(self, subscription_id: str, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._busy[subscription_id] -= 1
+        if not self._busy[subscription_id]:
+            del self._busy[subscription_id]
+        if self._backlog:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            free = settings.WEBHOOK_MAX_CONNECTIONS - len(self._in_flight)
+            batches = []
+            self._backlog = free <= 0
+            if free > 0:
+                try:
+                    batches, self._backlog = await asyncio.to_thread(self._claim, free, dict(self._busy))
+                except Exception as e:
+                    logger.error(f"Webhook claim failed: {str(e)}")
+
+            for subscription, deliveries in batches:
+                task = asyncio.create_task(self._deliver(subscription, deliveries))
+                self._in_flight.add(task)
+                self._busy[subscription["id"]] = self._busy.get(subscription["id"], 0) + 1
+                self._limits[subscription["id"]] = subscription["max_concurrency"]
+                task.add_done_callback(lambda task, subscription_id=subscription["id"]: self._finished(subscription_id, task))
+
+            # A full claim means more may be due already
+            if sum(len(deliveries) for _, deliveries in batches) >= settings.WEBHOOK_BATCH_SIZE:
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.WEBHOOK_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _claim(self, free: int, busy: Dict[str, int]) -> Tuple[List[Tuple[dict, List[dict]]], bool]:
+        """Claim due deliveries that can be sent now, grouped into per-subscription request batches.
+
+        At most `free` batches are returned, and no subscription gets more
+        than its max_concurrency minus its `busy` batches. The flag tells
+        whether due deliveries were left for lack of capacity.
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            size = settings.WEBHOOK_EVENTS_PER_REQUEST
+            saturated = [
+                subscription_id for subscription_id, count in busy.items()
+                if count >= self._limits.get(subscription_id, count + 1)
+            ]
+            deliveries = claim_due(
+                db, WebhookDelivery, now, min(settings.WEBHOOK_BATCH_SIZE, free * size),
+                settings.WEBHOOK_LEASE_SECONDS, WebhookDelivery.subscription_id.notin_(saturated)
+            )
+            backlog = bool(saturated)
+            grouped: Dict[str, List[WebhookDelivery]] = {}
+            for delivery in deliveries:
+                grouped.setdefault(delivery.subscription_id, []).append(delivery)
+
+            batches = []
+            for subscription_id, group in grouped.items():
+                subscription = db.query(WebhookSubscription).filter(WebhookSubscription.id == subscription_id).first()
+                if subscription is None or not subscription.active:
+                    # Paused subscriptions keep their backlog; reactivating one makes it due again
+                    for delivery in group:
+                        delivery.next_attempt_at = now + timedelta(seconds=settings.WEBHOOK_RETRY_MAX_SECONDS)
+                    continue
+                target = {
+                    "id": subscription.id,
+                    "url": subscription.url,
+                    "secret": subscription.secret,
+                    "max_concurrency": subscription.max_concurrency
+                }
+                # Whatever cannot be sent now goes back, due at once, for another worker or round
+                capacity = min(subscription.max_concurrency - busy.get(subscription_id, 0), free - len(batches))
+                sendable = max(capacity, 0) * size
+                for delivery in group[sendable:]:
+                    delivery.next_attempt_at = now
+                    backlog = True
+                rows = [
+                    {"id": delivery.id, "attempts": delivery.attempts, "payload": delivery.payload}
+                    for delivery in group[:sendable]
+                ]
+                for start in range(0, len(rows), size):
+                    batches.append((target, rows[start:start + size]))
+            db.commit()
+            return batches, backlog
+        finally:
+            db.close()
+
+    async def _deliver(self, subscription: dict, deliveries: List[dict]):
+        body = dumps({
+            "subscription_id": subscription["id"],
+            "events": [dict(json.loads(delivery["payload"]), id=delivery["id"]) for delivery in deliveries]
+        })
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign(subscription["secret"], timestamp, body)
+        }
+
+        status_code = None
+        error = None
+        try:
+            response = await self._client.post(subscription["url"], content=body, headers=headers)
+            status_code = response.status_code
+            if not 200 <= status_code < 300:
+                error = f"HTTP {status_code}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+
+        if error:
+            logger.warning(f"Webhook delivery to {subscription['url']} failed: {error}")
+        await asyncio.to_thread(self._record, deliveries, status_code, error)
+
+    def _record(self, deliveries: List[dict], status_code: Optional[int], error: Optional[str]):
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            for delivery in deliveries:
+                attempts = delivery["attempts"] + 1
+                values = {
+                    WebhookDelivery.attempts: attempts,
+                    WebhookDelivery.last_status_code: status_code,
+                    WebhookDelivery.last_error: error
+                }
+                if error is None:
+                    values[WebhookDelivery.status] = DELIVERED
+                    values[WebhookDelivery.delivered_at] = now
+                elif attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                    values[WebhookDelivery.status] = DEAD
+                else:
+                    values[WebhookDelivery.next_attempt_at] = now + retry_delay(
+                        attempts, settings.WEBHOOK_RETRY_BASE_SECONDS, settings.WEBHOOK_RETRY_MAX_SECONDS
+                    )
+                db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery["id"]).update(
+                    values, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+
+dispatcher = WebhookDispatcher()